@@ -1,5 +1,10 @@
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Campaign, Chapter, NPC, Encounter, Location, SessionNote, CharacterSummary, SessionSchedule
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Campaign, Chapter, NPC, Encounter, Location, SessionNote, CharacterSummary, SessionSchedule, LLMUsage
 
 admin.site.register(Campaign)
 admin.site.register(Chapter)
@@ -9,3 +14,45 @@ admin.site.register(Location)
 admin.site.register(SessionNote)
 admin.site.register(CharacterSummary)
 admin.site.register(SessionSchedule)
+
+
+@admin.register(LLMUsage)
+class LLMUsageAdmin(admin.ModelAdmin):
+    """Daily token counters, with the heaviest users and campaigns of the last 30 days on top"""
+    list_display = ('day', 'user', 'campaign', 'calls', 'cache_hits', 'prompt_tokens', 'completion_tokens', 'duration_ms')
+    list_filter = ('day',)
+    list_select_related = ('user', 'campaign')
+    date_hierarchy = 'day'
+    change_list_template = 'admin/campaigns/llmusage/change_list.html'
+    heaviest_days = 30
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def heaviest(self, group_by):
+        since = timezone.localdate() - timedelta(days=self.heaviest_days)
+        return (
+            LLMUsage.objects.filter(day__gte=since)
+            .values(*group_by)
+            # tokens comes first, before the sums below shadow the field names
+            .annotate(tokens=Sum(F('prompt_tokens') + F('completion_tokens')))
+            .annotate(
+                calls=Sum('calls'),
+                cache_hits=Sum('cache_hits'),
+                prompt_tokens=Sum('prompt_tokens'),
+                completion_tokens=Sum('completion_tokens'),
+            )
+            .order_by('-tokens')[:10]
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {
+            'heaviest_days': self.heaviest_days,
+            'heaviest_users': self.heaviest(['user__username']),
+            'heaviest_campaigns': self.heaviest(['campaign__title', 'campaign__owner__username']),
+            **(extra_context or {}),
+        }
+        return super().changelist_view(request, extra_context)
@@ -68,4 +68,12 @@ class RemoveCoDMForm(forms.Form):
 
 
 # Campaign forms would go here if we had custom campaign forms
-# Currently Campaign uses generic forms in views, but we can add them here later
\ No newline at end of file
+# Currently Campaign uses generic forms in views, but we can add them here later
+
+
+class CampaignImportForm(forms.Form):
+    archive = forms.FileField(
+        label="Campaign archive",
+        help_text="A .jsonl or .zip file from another campaign's Full archive export",
+        widget=forms.ClearableFileInput(attrs={'accept': '.jsonl,.zip'})
+    )
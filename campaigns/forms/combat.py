@@ -3,6 +3,17 @@ from ..models import CombatSession
 
 
 class CombatSessionForm(forms.ModelForm):
+    MAX_ENEMY_COPIES = 50
+    
+    roll_hit_points = forms.BooleanField(
+        required=False,
+        label="Roll enemy hit points",
+        help_text="Roll each enemy's HP from its hit dice instead of using the fixed value.",
+        widget=forms.CheckboxInput(attrs={
+            'class': 'h-4 w-4 rounded border-gray-600 bg-gray-700 text-red-600 focus:ring-red-500',
+        }),
+    )
+    
     class Meta:
         model = CombatSession
         fields = ['name', 'dm_notes']
@@ -18,7 +29,36 @@ class CombatSessionForm(forms.ModelForm):
             }),
         }
         
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, enemies=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['name'].required = False
-        self.fields['dm_notes'].required = False
\ No newline at end of file
+        self.fields['dm_notes'].required = False
+        
+        # One "how many of these" field per encounter enemy
+        self.enemies = list(enemies or [])
+        for enemy in self.enemies:
+            self.fields[self.enemy_count_field(enemy)] = forms.IntegerField(
+                min_value=0,
+                max_value=self.MAX_ENEMY_COPIES,
+                initial=1,
+                required=False,
+                widget=forms.NumberInput(attrs={
+                    'class': 'w-20 px-2 py-1 border border-gray-600 rounded-md bg-gray-700 text-white text-sm focus:outline-none focus:ring-2 focus:ring-red-500',
+                }),
+            )
+    
+    @staticmethod
+    def enemy_count_field(enemy):
+        return f'enemy_count_{enemy.pk}'
+    
+    def enemy_fields(self):
+        """Pairs of (enemy, bound count field) for the template"""
+        return [(enemy, self[self.enemy_count_field(enemy)]) for enemy in self.enemies]
+    
+    def enemy_counts(self):
+        """Pairs of (enemy, number of copies) from cleaned data"""
+        counts = []
+        for enemy in self.enemies:
+            count = self.cleaned_data.get(self.enemy_count_field(enemy))
+            counts.append((enemy, 1 if count is None else count))
+        return counts
@@ -112,4 +112,12 @@ EncounterFormSet = inlineformset_factory(
 
 
 class ChapterUploadForm(forms.Form):
-    pdf_file = forms.FileField(label="Adventure Chapter PDF")
\ No newline at end of file
+    pdf_file = forms.FileField(label="Adventure Chapter PDF")
+
+    def clean_pdf_file(self):
+        pdf_file = self.cleaned_data['pdf_file']
+        pdf_file.seek(0)
+        if pdf_file.read(5) != b'%PDF-':
+            raise forms.ValidationError("Upload a PDF file.")
+        pdf_file.seek(0)
+        return pdf_file
@@ -150,3 +150,54 @@ class PlayerAvailabilityForm(forms.ModelForm):
             ),
         }
 
+
+class SessionSolverForm(forms.Form):
+    """Constraints for ranking session times on the organizer page"""
+
+    REPEAT_CHOICES = [
+        ("", "One-off session"),
+        ("7", "Weekly"),
+        ("14", "Every two weeks"),
+    ]
+
+    session_hours = forms.IntegerField(
+        min_value=1,
+        max_value=12,
+        required=False,
+        widget=forms.NumberInput(attrs={"class": "form-control", "min": 1, "max": 12}),
+        help_text="Session length (defaults to the slot duration)",
+    )
+    quorum = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={"class": "form-control", "min": 1}),
+        help_text="Minimum number of players",
+    )
+    required_players = forms.TypedMultipleChoiceField(
+        coerce=int,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="Players who must be able to attend",
+    )
+    repeat_every = forms.TypedChoiceField(
+        choices=REPEAT_CHOICES,
+        coerce=int,
+        empty_value=None,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    def __init__(self, *args, responses=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["required_players"].choices = [
+            (response.pk, response.player_name) for response in responses
+        ]
+
+    def solver_options(self):
+        """Keyword arguments for SessionSolver from the cleaned data"""
+        data = self.cleaned_data if self.is_bound and self.is_valid() else {}
+        return {
+            "session_hours": data.get("session_hours"),
+            "quorum": data.get("quorum") or 1,
+            "required": data.get("required_players") or (),
+        }
@@ -1,14 +1,17 @@
 """
 HTMX-specific views for dynamic content updates
 """
+import json
+
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.template.loader import render_to_string
 from django.forms import modelformset_factory
 from .models import Campaign, Encounter, Chapter, NPC, Enemy, Location, SessionSchedule, PlayerAvailability
 from .forms import EncounterForm
+from .services.slot_selection import apply_slot_changes, toggle_slot
 
 @login_required
 @require_http_methods(["POST"])
@@ -461,35 +464,30 @@ def toggle_time_slot(request, token):
         }
         return render(request, 'sessions/components/_time_slot_button.html', context)
     
-    # Get or create player availability
-    availability, created = PlayerAvailability.objects.get_or_create(
-        session_schedule=schedule,
-        email=email,
-        defaults={'player_name': player_name if player_name else 'Anonymous'}
-    )
-    
-    # Update player name if provided and record exists
-    if not created and player_name:
-        availability.player_name = player_name
-        availability.save()
-    
-    # Toggle the time slot
-    date_availability = availability.get_availability_for_date(date)
-    is_selected = time_slot in date_availability
+    # Only accept slots that are part of the poll
+    if schedule.get_slot_universe().bit_for(date, time_slot) is None:
+        context = {
+            'time_slot': time_slot,
+            'date_str': date,
+            'selected': False,
+            'token': token,
+            'email': email,
+            'player_name': player_name,
+            'show_error': True,
+            'error_message': 'That time slot is not part of this poll'
+        }
+        return render(request, 'sessions/components/_time_slot_button.html', context)
     
-    if is_selected:
-        date_availability.remove(time_slot)
-    else:
-        date_availability.append(time_slot)
+    availability = _get_player_availability(schedule, email, player_name)
     
-    availability.set_availability_for_date(date, date_availability)
-    availability.save()
+    # Toggle the slot row atomically instead of rewriting the whole JSON
+    selected = toggle_slot(availability, date, time_slot)
     
     # Return updated button HTML
     context = {
         'time_slot': time_slot,
         'date_str': date,  # Fixed: use date_str to match template
-        'selected': not is_selected,  # Toggled state
+        'selected': selected,
         'token': token,
         'email': email,
         'player_name': player_name
@@ -498,6 +496,70 @@ def toggle_time_slot(request, token):
     return render(request, 'sessions/components/_time_slot_button.html', context)
 
 
+@require_http_methods(["POST"])
+def toggle_time_slots(request, token):
+    """
+    Apply a batch of slot changes in one request (JSON endpoint).
+    
+    Expects ``email``, ``player_name`` and ``changes``, a JSON list of
+    ``{"date", "time_slot", "selected"}`` objects, where ``selected`` is a
+    JSON boolean or omitted to flip the slot, and returns the player's full
+    selection so the page can reconcile its buttons.
+    """
+    schedule = get_object_or_404(SessionSchedule, shareable_token=token)
+    
+    if schedule.status != "collecting":
+        return JsonResponse({'error': 'This poll is closed.'}, status=409)
+    
+    email = request.POST.get('email', '').strip()
+    player_name = request.POST.get('player_name', '').strip()
+    if not email:
+        return JsonResponse({'error': 'Please enter your email first'}, status=400)
+    
+    try:
+        changes = json.loads(request.POST.get('changes') or '[]')
+        changes = [
+            (change['date'], change['time_slot'], change.get('selected'))
+            for change in changes
+        ]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Invalid slot changes'}, status=400)
+    # A missing flag toggles the slot; anything else must be a real boolean
+    if not all(selected is None or isinstance(selected, bool) for _, _, selected in changes):
+        return JsonResponse({'error': 'Invalid slot changes'}, status=400)
+    
+    universe = schedule.get_slot_universe()
+    if any(universe.bit_for(date, time_slot) is None for date, time_slot, _ in changes):
+        return JsonResponse({'error': 'That time slot is not part of this poll'}, status=400)
+    
+    availability = _get_player_availability(schedule, email, player_name)
+    changed = apply_slot_changes(availability, changes)
+    
+    return JsonResponse({
+        'selected': availability.availability_data,
+        'changed': [
+            {'date': date, 'time_slot': time_slot, 'selected': selected}
+            for date, time_slot, selected in changed
+        ],
+    })
+
+
+def _get_player_availability(schedule, email, player_name):
+    """Get or create a player's response, updating only their name"""
+    availability, created = PlayerAvailability.objects.get_or_create(
+        session_schedule=schedule,
+        email=email,
+        defaults={'player_name': player_name if player_name else 'Anonymous'}
+    )
+    
+    # Update player name if provided and record exists
+    if not created and player_name and player_name != availability.player_name:
+        availability.player_name = player_name
+        availability.save(update_fields=['player_name', 'updated_at'])
+    
+    return availability
+
+
 @require_http_methods(["POST"])
 def save_player_info(request, token):
     """
@@ -528,7 +590,7 @@ def save_player_info(request, token):
             availability.player_name = player_name
         if character_name is not None:  # Allow clearing character name
             availability.character_name = character_name
-        availability.save()
+        availability.save(update_fields=['player_name', 'character_name', 'updated_at'])
     
     # Return success indicator (could be a small checkmark or empty)
     return HttpResponse('')
@@ -561,7 +623,7 @@ def submit_player_availability(request, token):
         # Update final info
         availability.player_name = player_name
         availability.character_name = character_name
-        availability.save()
+        availability.save(update_fields=['player_name', 'character_name', 'updated_at'])
         
         # Return success message
         context = {
@@ -0,0 +1,191 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from campaigns.models import (
+    Campaign, Chapter, Encounter, Enemy, CharacterSummary, CombatSession, CombatParticipant, CombatEvent
+)
+from campaigns.services.combat import SNAPSHOT_INTERVAL, CombatRosterBuilder
+from campaigns.services.simulation import (
+    character_combatant, enemy_combatant, simulate_fights, simulate_rosters
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark combat setup paths against throwaway data (all changes are rolled back)"
+
+    SUITES = ('roster', 'replay', 'simulate')
+    FIGHTS_PER_SECOND_TARGET = 10000
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f"Benchmarks to run: {', '.join(self.SUITES)} (default: all)")
+        parser.add_argument('--enemies', type=int, default=12, help="Copies of the enemy to spawn")
+        parser.add_argument('--events', type=int, default=1000, help="Events in the replayed combat log")
+        parser.add_argument('--characters', type=int, default=5, help="Player characters in the campaign")
+        parser.add_argument('--fights', type=int, default=10000, help="Simulated fights per roster")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per path")
+
+    def handle(self, *args, **options):
+        unknown = set(options['suites']) - set(self.SUITES)
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        try:
+            with transaction.atomic():
+                self._setup(options['characters'])
+                suites = options['suites'] or self.SUITES
+                if 'roster' in suites:
+                    self.benchmark_roster(options['enemies'], options['repeat'])
+                if 'replay' in suites:
+                    self.benchmark_replay(options['events'], options['repeat'])
+                if 'simulate' in suites:
+                    self.benchmark_simulate(options['enemies'], options['fights'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _setup(self, character_count):
+        self.user = User.objects.create_user(username='benchmark-combat-user')
+        self.campaign = Campaign.objects.create(title='Benchmark Campaign', owner=self.user)
+        chapter = Chapter.objects.create(campaign=self.campaign, order=1, title='Benchmark', owner=self.user)
+        self.encounter = Encounter.objects.create(
+            chapter=chapter, title='Benchmark Encounter', summary='Benchmark', owner=self.user
+        )
+        self.enemy = Enemy.objects.create(
+            campaign=self.campaign, name='Goblin', armor_class=15, hit_points=7,
+            speed='30 ft.', dexterity=14, challenge_rating='1/4', owner=self.user
+        )
+        self.characters = [
+            CharacterSummary.objects.create(
+                campaign=self.campaign, player_name=f'Player {i}',
+                character_name=f'Hero {i}', race='Human', current_hit_points=30
+            )
+            for i in range(character_count)
+        ]
+
+    enemy_count_for_replay = 8
+
+    def _new_session(self):
+        return CombatSession.objects.create(encounter=self.encounter, name='Benchmark', owner=self.user)
+
+    def _per_row_roster(self, combat_session, enemy_count):
+        """The original path: one INSERT per participant"""
+        for number in range(1, enemy_count + 1):
+            CombatParticipant.objects.create(
+                combat_session=combat_session, participant_type='enemy', enemy=self.enemy,
+                name=f"{self.enemy.name} {number}",
+                current_hp=self.enemy.hit_points, max_hp=self.enemy.hit_points
+            )
+        for character in self.characters:
+            CombatParticipant.objects.create(
+                combat_session=combat_session, participant_type='player', character=character,
+                name=character.character_name,
+                current_hp=character.current_hit_points or 20, max_hp=character.current_hit_points or 20
+            )
+
+    def _bulk_roster(self, combat_session, enemy_count):
+        roster = CombatRosterBuilder(combat_session).add_enemy(self.enemy, enemy_count)
+        for character in self.characters:
+            roster.add_character(character)
+        roster.build()
+
+    def benchmark_roster(self, enemy_count, repeat):
+        self.stdout.write(f"Roster creation: {enemy_count} enemies + {len(self.characters)} characters, {repeat} runs")
+        for label, build in (('per-row create', self._per_row_roster), ('bulk_create', self._bulk_roster)):
+            sessions = [self._new_session() for _ in range(repeat)]
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for combat_session in sessions:
+                    build(combat_session, enemy_count)
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {label:<15} {elapsed / repeat * 1000:8.2f} ms/run  "
+                f"{len(queries.captured_queries) / repeat:6.1f} queries/run"
+            )
+
+    def _append_events(self, combat_session, participants, first, count):
+        events = []
+        for index in range(first, first + count):
+            participant = participants[index % len(participants)]
+            event_type = 'damage' if index % 3 else 'heal'
+            events.append(combat_session.make_event(event_type, participant, amount=1 + index % 4))
+        CombatEvent.objects.bulk_create(events)
+
+    def benchmark_replay(self, event_count, repeat):
+        """
+        Fold a log of ``event_count`` events from the roster's baseline
+        snapshot, then rebuild from the latest compaction snapshot with the
+        longest tail a live log can have (SNAPSHOT_INTERVAL - 1 events)
+        """
+        self.stdout.write(f"Event log replay: {event_count} events, {repeat} runs")
+        combat_session = self._new_session()
+        self._bulk_roster(combat_session, self.enemy_count_for_replay)
+        participants = list(combat_session.participants.all())
+        combat_session.snapshot()
+
+        tail = min(SNAPSHOT_INTERVAL - 1, event_count)
+        self._append_events(combat_session, participants, 0, event_count - tail)
+        # Compacts the head, as a rebuild during the fight would
+        combat_session.build_state()
+        self._append_events(combat_session, participants, event_count - tail, tail)
+
+        latest = combat_session.snapshots.order_by('-last_event_id').first()
+        replayed = {
+            'full fold': len(list(combat_session.replay())),
+            'from snapshot': combat_session.events.filter(id__gt=latest.last_event_id).count(),
+        }
+        if replayed['full fold'] != event_count:
+            raise CommandError(f"The full fold replayed {replayed['full fold']} of {event_count} events")
+        folded = len(combat_session.build_state()['participants'])
+        if folded != len(participants):
+            raise CommandError(f"The folded state has {folded} of {len(participants)} participants")
+
+        for label, build in (
+            ('full fold', lambda: list(combat_session.replay())),
+            ('from snapshot', combat_session.build_state),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    build()
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {label:<15} {elapsed / repeat * 1000:8.2f} ms/run  "
+                f"{len(queries.captured_queries) / repeat:6.1f} queries/run  {replayed[label]:5d} events replayed"
+            )
+
+    def benchmark_simulate(self, enemy_count, fights):
+        combatants = [character_combatant(character) for character in self.characters]
+        combatants += [enemy_combatant(self.enemy)] * enemy_count
+        self.stdout.write(
+            f"Combat simulation: {len(self.characters)} characters vs {enemy_count} enemies, {fights} fights"
+        )
+
+        started = time.perf_counter()
+        result = simulate_fights(combatants, fights, seed=0)
+        elapsed = time.perf_counter() - started
+        rate = fights / elapsed
+        verdict = 'ok' if rate >= self.FIGHTS_PER_SECOND_TARGET else 'below target'
+        self.stdout.write(
+            f"  {'single core':<15} {rate:10.0f} fights/s  "
+            f"(target {self.FIGHTS_PER_SECOND_TARGET}, {verdict})  win rate {result['win_rate']:.2f}"
+        )
+
+        processes = os.cpu_count() or 1
+        if processes > 1:
+            rosters = {index: combatants for index in range(processes)}
+            started = time.perf_counter()
+            simulate_rosters(rosters, fights, processes=processes, seed=0)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {f'{processes} processes':<15} {fights * processes / elapsed:10.0f} fights/s  "
+                f"{fights * processes / elapsed / processes:10.0f} fights/s/core"
+            )
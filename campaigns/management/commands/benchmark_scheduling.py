@@ -0,0 +1,93 @@
+import random
+import time
+from datetime import date, time as clock, timedelta
+
+from django.core.management.base import BaseCommand
+
+from campaigns.models import SessionSchedule, PlayerAvailability
+from campaigns.services.availability import AvailabilityIndex
+from campaigns.services.heatmap import heatmap_index
+from campaigns.services.scheduling import SessionSolver
+
+
+class Command(BaseCommand):
+    help = "Benchmark the session-time solver on synthetic availability (no database writes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=120, help="Length of the date range")
+        parser.add_argument('--players', type=int, default=36, help="Number of respondents")
+        parser.add_argument('--density', type=float, default=0.4, help="Chance a player picks any slot")
+        parser.add_argument('--repeat', type=int, default=10, help="Runs per path")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        schedule = SessionSchedule(
+            date_range_start=date(2030, 1, 1),
+            date_range_end=date(2030, 1, 1) + timedelta(days=options['days'] - 1),
+            weekday_start_time=clock(17, 0),
+            weekday_end_time=clock(23, 0),
+            weekend_start_time=clock(10, 0),
+            weekend_end_time=clock(23, 0),
+            slot_duration_hours=3,
+            slot_overlap_hours=2,
+        )
+        universe = schedule.get_slot_universe()
+        responses = []
+        for number in range(options['players']):
+            data = {
+                date_str: [slot['label'] for slot in slots if rng.random() < options['density']]
+                for date_str, slots in universe.slots_by_date.items()
+            }
+            responses.append(PlayerAvailability(
+                pk=number + 1, session_schedule=schedule, player_name=f'Player {number + 1}',
+                email=f'player{number + 1}@example.com', availability_data=data,
+            ))
+        required = [responses[0].pk, responses[1].pk]
+        quorum = max(options['players'] // 2, 1)
+
+        self.stdout.write(
+            f"Session solver: {options['days']} days, {len(universe)} slots, "
+            f"{options['players']} players, {options['repeat']} runs"
+        )
+        solver = SessionSolver(universe, responses)
+        heatmap = self._heatmap(responses)
+        paths = (
+            ('naive scan', lambda: self._naive_popular(universe, responses)),
+            ('bitset index', lambda: AvailabilityIndex(universe, responses).popular_slots()),
+            ('heatmap index', lambda: heatmap_index(universe, heatmap).popular_slots()),
+            ('solver build', lambda: SessionSolver(universe, responses)),
+            ('best times', lambda: solver.best_times()),
+            ('6h + quorum', lambda: solver.best_times(session_hours=6, quorum=quorum, required=required)),
+            ('weekly series', lambda: solver.recurring(interval_days=7, quorum=quorum, required=required)),
+        )
+        for label, run in paths:
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {label:<15} {elapsed / options['repeat'] * 1000:8.2f} ms/run")
+
+    @staticmethod
+    def _heatmap(responses):
+        """The materialized heatmap a schedule would store for these responses"""
+        slots = {}
+        for response in responses:
+            for date_str, labels in response.availability_data.items():
+                for label in labels:
+                    slots.setdefault(date_str, {}).setdefault(label, []).append(response.pk)
+        return {'respondents': [[r.pk, r.player_name] for r in responses], 'slots': slots}
+
+    @staticmethod
+    def _naive_popular(universe, responses):
+        """The original ranking: list membership per date, slot and response"""
+        counts = []
+        for date_str, slots in universe.slots_by_date.items():
+            for slot in slots:
+                players = [
+                    r.player_name for r in responses
+                    if slot['label'] in r.get_availability_for_date(date_str)
+                ]
+                if players:
+                    counts.append((len(players), date_str, slot['label']))
+        return sorted(counts, key=lambda item: item[0], reverse=True)[:5]
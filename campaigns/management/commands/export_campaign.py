@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.models import Campaign
+from campaigns.services.archive import campaign_archive, campaign_records
+
+
+class Command(BaseCommand):
+    help = "Write a campaign archive (JSON Lines, or a ZIP with map images) for backups or another instance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--zip', action='store_true', help="Write a ZIP that includes the location maps")
+        parser.add_argument('--output', '-o', help="File to write (defaults to standard output)")
+
+    def handle(self, *args, **options):
+        try:
+            campaign = Campaign.objects.get(pk=options['campaign_id'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign_id']} does not exist")
+
+        if options['zip']:
+            pieces = campaign_archive(campaign)
+        else:
+            pieces = (text.encode() for text in campaign_records(campaign))
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for piece in pieces:
+                output.write(piece)
+        finally:
+            if options['output']:
+                output.close()
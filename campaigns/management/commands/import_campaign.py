@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.services.archive import ArchiveError, import_campaign
+
+
+class Command(BaseCommand):
+    help = "Import a campaign archive (JSON Lines or ZIP) made by export_campaign as a new campaign"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help="Username of the DM who will own the campaign")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['owner']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as source:
+                campaign = import_campaign(source, owner)
+        except (ArchiveError, OSError) as error:
+            raise CommandError(str(error))
+        self.stdout.write(f"Imported campaign {campaign.pk}: {campaign.title}")
@@ -0,0 +1,58 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from campaigns.services.jobs import claim_job, requeue_stale_jobs, run_job, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued LLM jobs (summaries, note compression) in a background worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due, then exit")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between checks for new jobs")
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help="Jobs to run at once (defaults to LLM_JOB_CONCURRENCY)",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        requeue_stale_jobs()
+
+        if options['once']:
+            count = run_pending(worker)
+            self.stdout.write(f"Ran {count} job{'s' if count != 1 else ''}")
+            return
+
+        concurrency = options['concurrency'] or settings.LLM_JOB_CONCURRENCY
+        self.stdout.write(f"LLM worker {worker} running up to {concurrency} jobs at once")
+        running = set()
+        last_sweep = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+                while len(running) < concurrency:
+                    job = claim_job(worker)
+                    if job is None:
+                        break
+                    running.add(pool.submit(self._run, job))
+
+                if time.monotonic() - last_sweep > settings.LLM_JOB_LEASE_SECONDS / 2:
+                    requeue_stale_jobs()
+                    last_sweep = time.monotonic()
+                close_old_connections()
+                time.sleep(options['poll'])
+
+    @staticmethod
+    def _run(job):
+        # Each pool thread has its own database connection
+        try:
+            run_job(job)
+        finally:
+            connection.close()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.models import Chapter
+from campaigns.services.simulation import simulate_chapter
+
+
+class Command(BaseCommand):
+    help = "Simulate every encounter in a chapter against the campaign's party"
+
+    def add_arguments(self, parser):
+        parser.add_argument('chapter_id', type=int)
+        parser.add_argument('--fights', type=int, default=5000, help="Simulated fights per encounter")
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes for the chapter")
+        parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible results")
+
+    def handle(self, *args, **options):
+        try:
+            chapter = Chapter.objects.get(pk=options['chapter_id'])
+        except Chapter.DoesNotExist:
+            raise CommandError(f"Chapter {options['chapter_id']} does not exist")
+
+        results = simulate_chapter(chapter, options['fights'], options['processes'], options['seed'])
+        for encounter in chapter.encounters.all():
+            result = results[encounter.pk]
+            self.stdout.write(
+                f"{encounter.title}: win rate {result['win_rate']:.1%}, "
+                f"{result['expected_rounds']:.1f} rounds, "
+                f"{result['expected_pc_downs']:.2f} PCs down"
+            )
@@ -1,6 +1,6 @@
 import logging
 import traceback
-from django.http import JsonResponse, HttpResponseServerError
+from django.http import Http404, JsonResponse, HttpResponseServerError
 from django.shortcuts import render
 from django.contrib import messages
 from django.contrib.auth.models import AnonymousUser
@@ -26,6 +26,10 @@ class ErrorHandlingMiddleware:
         """
         Process exceptions that occur during request processing
         """
+        # Let Django render the normal 404 page instead of reporting a server error
+        if isinstance(exception, Http404):
+            return None
+        
         # Get user info for logging
         user_info = f"User: {request.user}" if request.user.is_authenticated else "Anonymous"
         
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0037_alter_sessionschedule_date_range_end_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='combatsession',
+            name='initiative_ring',
+            field=models.JSONField(blank=True, editable=False, help_text='Cached [participant_id, initiative_order] pairs for active participants', null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 03:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0038_combatsession_initiative_ring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CombatEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('damage', 'Damage'), ('heal', 'Healing'), ('temp_hp', 'Temporary HP'), ('turn_advance', 'Turn Advance'), ('effect_add', 'Effect Added'), ('effect_expire', 'Effect Expired')], max_length=20)),
+                ('round_number', models.PositiveIntegerField()),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('combat_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='campaigns.combatsession')),
+                ('participant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='campaigns.combatparticipant')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CombatSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.PositiveBigIntegerField(default=0)),
+                ('state', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('combat_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='campaigns.combatsession')),
+            ],
+            options={
+                'ordering': ['-last_event_id'],
+                'indexes': [models.Index(fields=['combat_session', 'last_event_id'], name='campaigns_c_combat__6e5960_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0039_combatevent_combatsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encounter',
+            name='difficulty_cache',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 03:44
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_slots(apps, schema_editor):
+    """Create slot rows for availability saved as JSON"""
+    PlayerAvailability = apps.get_model('campaigns', 'PlayerAvailability')
+    AvailabilitySlot = apps.get_model('campaigns', 'AvailabilitySlot')
+
+    rows = []
+    for availability in PlayerAvailability.objects.iterator():
+        for date_str, labels in (availability.availability_data or {}).items():
+            try:
+                day = date.fromisoformat(date_str)
+            except (TypeError, ValueError):
+                continue
+            for label in set(labels):
+                if isinstance(label, str) and len(label) <= 20:
+                    rows.append(AvailabilitySlot(availability_id=availability.pk, date=day, time_slot=label))
+    AvailabilitySlot.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0040_encounter_difficulty_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilitySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time_slot', models.CharField(max_length=20)),
+                ('availability', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='campaigns.playeravailability')),
+            ],
+            options={
+                'ordering': ['date', 'time_slot'],
+                'unique_together': {('availability', 'date', 'time_slot')},
+            },
+        ),
+        migrations.RunPython(backfill_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0041_availability_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionschedule',
+            name='availability_heatmap',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 04:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0045_llmusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='export_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='export_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='encounter',
+            name='export_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ExportSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('campaign', 'Campaign header'), ('chapter', 'Chapter heading'), ('encounter', 'Encounter with notes'), ('encounter_document', 'Encounter export')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('version', models.CharField(max_length=100)),
+                ('markdown', models.TextField()),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_sections', to='campaigns.campaign')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 05:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0046_export_sections'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmjob',
+            name='kind',
+            field=models.CharField(choices=[('session_summary', 'Session Summary'), ('compress_notes', 'Compress Notes'), ('ingest_pdf', 'Import Adventure PDF')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='AdventurePDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to='adventures/')),
+                ('name', models.CharField(help_text='File name as uploaded', max_length=255)),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('outline', models.JSONField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='adventure_pdfs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Adventure PDF',
+                'verbose_name_plural': 'Adventure PDFs',
+            },
+        ),
+    ]
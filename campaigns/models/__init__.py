@@ -3,9 +3,13 @@ from .base import Campaign, CampaignCollaborator
 from .content import Chapter, Encounter
 from .world import Location, NPC, Enemy
 from .characters import CharacterSummary
-from .sessions import SessionNote, ChatMessage, ChapterChatMessage, SessionSchedule, PlayerAvailability, ScheduledSession
+from .sessions import SessionNote, ChatMessage, ChapterChatMessage, SessionSchedule, PlayerAvailability, AvailabilitySlot, ScheduledSession
 from .users import UserProfile
-from .combat import CombatSession, CombatParticipant, StatusEffect, CombatAction
+from .combat import CombatSession, CombatParticipant, StatusEffect, CombatAction, CombatEvent, CombatSnapshot
+from .jobs import LLMJob
+from .llm import CachedLLMResponse, LLMUsage
+from .exports import ExportSection
+from .adventures import AdventurePDF
 
 # Make all models available when importing from campaigns.models
 __all__ = [
@@ -22,10 +26,18 @@ __all__ = [
     'ChapterChatMessage',
     'SessionSchedule',
     'PlayerAvailability',
+    'AvailabilitySlot',
     'ScheduledSession',
     'UserProfile',
     'CombatSession',
     'CombatParticipant',
     'StatusEffect',
     'CombatAction',
+    'CombatEvent',
+    'CombatSnapshot',
+    'LLMJob',
+    'CachedLLMResponse',
+    'LLMUsage',
+    'ExportSection',
+    'AdventurePDF',
 ]
\ No newline at end of file
@@ -0,0 +1,27 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class AdventurePDF(models.Model):
+    """
+    An uploaded adventure module, stored once per file content. ``outline``
+    caches the chapters, encounters and stat blocks found in it (NULL until
+    the PDF has been read), so importing the same file again, into any
+    campaign, skips extraction. See ``services/pdf_ingest.py``.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="adventures/")
+    name = models.CharField(max_length=255, help_text="File name as uploaded")
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    outline = models.JSONField(null=True, blank=True, editable=False)
+    uploaded_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='adventure_pdfs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Adventure PDF'
+        verbose_name_plural = 'Adventure PDFs'
+
+    def __str__(self):
+        return self.name
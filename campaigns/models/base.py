@@ -42,6 +42,8 @@ class Campaign(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     generated_summary = models.TextField(blank=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='campaigns')
+    # Replaced whenever the export header (description, locations, NPCs) changes
+    export_version = models.BigIntegerField(default=0, editable=False)
 
     def get_absolute_url(self):
         return reverse("campaigns:campaign_detail", args=[str(self.id)])
@@ -1,11 +1,15 @@
-import random
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 from .content import Encounter
 from .world import Enemy
 from .characters import CharacterSummary
+from ..services.combat import (
+    InitiativeRing, SNAPSHOT_INTERVAL,
+    apply_combat_event, damage_hit_points, empty_combat_state, heal_hit_points,
+)
+from ..services.dice import roll_many
 
 
 class CombatSession(models.Model):
@@ -39,6 +43,10 @@ class CombatSession(models.Model):
     
     # Initiative tracking
     initiative_rolled = models.BooleanField(default=False)
+    initiative_ring = models.JSONField(
+        null=True, blank=True, editable=False,
+        help_text="Cached [participant_id, initiative_order] pairs for active participants"
+    )
     
     # Notes and summary
     dm_notes = models.TextField(
@@ -73,49 +81,350 @@ class CombatSession(models.Model):
         self.total_rounds = self.current_round
         self.save()
     
+    def get_initiative_ring(self, save=True):
+        """
+        Return the initiative ring for this session, loading it from the
+        participants table the first time it is needed.
+        """
+        if self.initiative_ring is None:
+            ring = InitiativeRing.load(self)
+            self.initiative_ring = ring.to_json()
+            if save and self.pk:
+                self.save(update_fields=['initiative_ring', 'updated_at'])
+            return ring
+        return InitiativeRing(self.initiative_ring)
+    
+    def reset_initiative_ring(self, participants=None):
+        """Rebuild the ring from in-memory participants, or drop it to reload lazily"""
+        if participants is None:
+            self.initiative_ring = None
+        else:
+            self.initiative_ring = InitiativeRing.from_participants(participants).to_json()
+    
     def next_turn(self):
         """Advance to the next turn in initiative order"""
-        participants = self.participants.filter(is_active=True).order_by('initiative_order')
+        ring = self.get_initiative_ring(save=False)
         
-        if not participants.exists():
+        if not ring:
             return
             
+        previous_turn = self.current_turn
         self.current_turn += 1
         
         # If we've gone through all participants, start a new round
-        if self.current_turn >= participants.count():
+        new_round = self.current_turn >= len(ring)
+        if new_round:
             self.current_turn = 0
             self.current_round += 1
+        
+        self.record_event(
+            'turn_advance', round=self.current_round, turn=self.current_turn, previous_turn=previous_turn
+        )
+        if new_round:
+            # The log is compacted by build_state() when it is next read, not here
+            self.advance_round(save=False)
             
-        self.save()
+        self.save(update_fields=['current_turn', 'current_round', 'initiative_ring', 'updated_at'])
     
-    def get_current_participant(self):
+    def get_current_participant(self, save=True):
         """Get the participant whose turn it currently is"""
-        participants = self.participants.filter(is_active=True).order_by('initiative_order')
-        if participants.exists() and self.current_turn < participants.count():
-            return participants[self.current_turn]
-        return None
+        participant_id = self.get_initiative_ring(save=save).participant_id_at(self.current_turn)
+        if participant_id is None:
+            return None
+        return self.participants.filter(pk=participant_id).first()
+    
+    def update_participant_status(self, participant):
+        """
+        Keep the initiative ring in step when a participant goes down or
+        is brought back up, without moving the turn off the current participant.
+        """
+        if self.initiative_ring is None:
+            # Loading reads the participant's saved state, so there is nothing to patch
+            self.get_initiative_ring()
+            return
+        
+        ring = self.get_initiative_ring()
+        self._move_in_ring(ring, participant)
+        self.initiative_ring = ring.to_json()
+        self.save(update_fields=['initiative_ring', 'current_turn', 'updated_at'])
+    
+    def _move_in_ring(self, ring, participant):
+        """Add or drop a participant from the ring, keeping current_turn on the same participant"""
+        if participant.is_active:
+            had_participants = len(ring) > 0
+            index = ring.insert(participant.pk, participant.initiative_order)
+            if had_participants and index <= self.current_turn:
+                self.current_turn += 1
+        else:
+            index = ring.remove(participant.pk)
+            if index is not None:
+                if index < self.current_turn:
+                    self.current_turn -= 1
+                elif self.current_turn >= len(ring):
+                    self.current_turn = 0
+    
+    def advance_round(self, save=True):
+        """
+        Tick every status effect in the session for the start of a round.
+        
+        Effects are loaded in one query and applied in memory, then
+        participants, remaining durations, expired effects and the action
+        log are each flushed with a single bulk statement.
+        """
+        effects = list(
+            StatusEffect.objects.filter(participant__combat_session=self)
+            .select_related('participant')
+            .order_by('participant_id', 'id')
+        )
+        if not effects:
+            return
+        
+        participants = {}
+        was_active = {}
+        actions = []
+        events = []
+        ticking = []
+        expired_ids = []
+        
+        for effect in effects:
+            participant = participants.setdefault(effect.participant_id, effect.participant)
+            was_active.setdefault(participant.pk, participant.is_active)
+            
+            if effect.auto_damage_per_turn > 0:
+                participant._apply_damage(effect.auto_damage_per_turn)
+                events.append(self.make_event('damage', participant, amount=effect.auto_damage_per_turn))
+                actions.append(CombatAction(
+                    combat_session=self, round_number=self.current_round, participant=participant,
+                    action_type='damage', value=effect.auto_damage_per_turn,
+                    description=f"Takes {effect.auto_damage_per_turn} damage from {effect.name}",
+                ))
+            
+            if effect.auto_healing_per_turn > 0:
+                participant._apply_healing(effect.auto_healing_per_turn)
+                events.append(self.make_event('heal', participant, amount=effect.auto_healing_per_turn))
+                actions.append(CombatAction(
+                    combat_session=self, round_number=self.current_round, participant=participant,
+                    action_type='heal', value=effect.auto_healing_per_turn,
+                    description=f"Regains {effect.auto_healing_per_turn} HP from {effect.name}",
+                ))
+            
+            # Reduce duration
+            if effect.rounds_remaining is not None:
+                effect.rounds_remaining -= 1
+                if effect.rounds_remaining <= 0:
+                    expired_ids.append(effect.pk)
+                    events.append(self.make_event('effect_expire', participant, effect_id=effect.pk))
+                    actions.append(CombatAction(
+                        combat_session=self, round_number=self.current_round, participant=participant,
+                        action_type='other', description=f"{effect.name} wears off",
+                    ))
+                else:
+                    ticking.append(effect)
+        
+        changed = [p for p in participants.values() if p.is_active != was_active[p.pk]]
+        
+        with transaction.atomic():
+            CombatParticipant.objects.bulk_update(
+                participants.values(), ['current_hp', 'temp_hp', 'is_active']
+            )
+            if ticking:
+                StatusEffect.objects.bulk_update(ticking, ['rounds_remaining'])
+            if expired_ids:
+                StatusEffect.objects.filter(pk__in=expired_ids).delete()
+            if actions:
+                CombatAction.objects.bulk_create(actions)
+            if events:
+                # Each event has its action at the same index, so undo can remove both
+                for event, action in zip(events, actions):
+                    event.payload['action_id'] = action.pk
+                self.ensure_snapshot()
+                CombatEvent.objects.bulk_create(events)
+            
+            if changed:
+                if self.initiative_ring is None:
+                    # Loading after the bulk update already reflects the new state
+                    ring = self.get_initiative_ring(save=False)
+                else:
+                    ring = self.get_initiative_ring()
+                    for participant in changed:
+                        self._move_in_ring(ring, participant)
+                self.initiative_ring = ring.to_json()
+                if save:
+                    self.save(update_fields=['initiative_ring', 'current_turn', 'updated_at'])
+    
+    # Event log
+    
+    def make_event(self, event_type, participant=None, **payload):
+        """
+        Build an unsaved event for this session. The turn it happened on is
+        kept with it, because dropping or reviving a participant shifts the
+        turn without an event of its own.
+        """
+        payload.setdefault('previous_turn', self.current_turn)
+        return CombatEvent(
+            combat_session=self,
+            event_type=event_type,
+            participant=participant,
+            round_number=self.current_round,
+            payload=payload,
+        )
+    
+    def record_event(self, event_type, participant=None, **payload):
+        """Append a single event to the log"""
+        self.ensure_snapshot()
+        event = self.make_event(event_type, participant, **payload)
+        event.save()
+        return event
+    
+    def snapshot(self):
+        """Store the current participant and effect rows as a replay starting point"""
+        state = empty_combat_state(self.current_round, self.current_turn)
+        for participant in self.participants.values('id', 'current_hp', 'max_hp', 'temp_hp', 'is_active'):
+            state['participants'][str(participant['id'])] = {
+                'hp': participant['current_hp'],
+                'max_hp': participant['max_hp'],
+                'temp_hp': participant['temp_hp'],
+                'active': participant['is_active'],
+            }
+        for effect in StatusEffect.objects.filter(participant__combat_session=self):
+            state['effects'][str(effect.pk)] = dict(effect.to_state(), participant=effect.participant_id)
+        
+        last_event = self.events.order_by('-id').values_list('id', flat=True).first()
+        self._has_snapshot = True
+        return CombatSnapshot.objects.create(
+            combat_session=self, last_event_id=last_event or 0, state=state
+        )
+    
+    def ensure_snapshot(self):
+        """
+        Take the baseline snapshot before the session's first event is
+        written, so creating a roster doesn't pay for it and sessions from
+        before the event log get one when their rows are next changed.
+        """
+        if getattr(self, '_has_snapshot', False):
+            return
+        if not self.snapshots.exists():
+            self.snapshot()
+        self._has_snapshot = True
+    
+    def build_state(self):
+        """
+        Fold the event log into the current combat state.
+        
+        Only events after the latest snapshot are replayed, and a new snapshot
+        is written once that tail grows past SNAPSHOT_INTERVAL events, so the
+        cost of a rebuild stays bounded however long the fight runs.
+        """
+        snapshot = self.snapshots.order_by('-last_event_id').first()
+        if snapshot:
+            state, last_event_id = snapshot.state, snapshot.last_event_id
+        else:
+            state, last_event_id = empty_combat_state(), 0
+        
+        events = self.events.filter(id__gt=last_event_id).order_by('id').values_list(
+            'id', 'event_type', 'participant_id', 'payload'
+        )
+        replayed = 0
+        for last_event_id, event_type, participant_id, payload in events:
+            apply_combat_event(state, event_type, participant_id, payload)
+            replayed += 1
+        
+        if replayed >= SNAPSHOT_INTERVAL:
+            CombatSnapshot.objects.create(combat_session=self, last_event_id=last_event_id, state=state)
+        return state
+    
+    def replay(self):
+        """Yield (event, state) for every event since the first snapshot"""
+        snapshot = self.snapshots.order_by('last_event_id').first()
+        if snapshot:
+            state, last_event_id = snapshot.state, snapshot.last_event_id
+        else:
+            state, last_event_id = empty_combat_state(), 0
+        
+        for event in self.events.filter(id__gt=last_event_id).order_by('id').iterator():
+            apply_combat_event(state, event.event_type, event.participant_id, event.payload)
+            yield event, state
+    
+    def undo_last_event(self):
+        """
+        Remove the most recent event, restore the participant and effect rows
+        from the folded state and put the turn back where the event happened.
+        An effect tick's line in the action log goes with it. Returns the
+        undone event, or ``None`` when there is nothing to undo or no
+        snapshot older than the event to rebuild from.
+        """
+        event = self.events.order_by('-id').first()
+        if event is None or not self.snapshots.filter(last_event_id__lt=event.pk).exists():
+            return None
+        
+        with transaction.atomic():
+            self.snapshots.filter(last_event_id__gte=event.pk).delete()
+            event.delete()
+            state = self.build_state()
+            
+            participants = list(self.participants.filter(pk__in=[int(pid) for pid in state['participants']]))
+            for participant in participants:
+                saved = state['participants'][str(participant.pk)]
+                participant.current_hp = saved['hp']
+                participant.temp_hp = saved['temp_hp']
+                participant.is_active = saved['active']
+            CombatParticipant.objects.bulk_update(participants, ['current_hp', 'temp_hp', 'is_active'])
+            
+            effects = list(StatusEffect.objects.filter(pk__in=[int(eid) for eid in state['effects']]))
+            for effect in effects:
+                effect.rounds_remaining = state['effects'][str(effect.pk)]['rounds_remaining']
+            StatusEffect.objects.bulk_update(effects, ['rounds_remaining'])
+            
+            if event.payload.get('action_id'):
+                # Round ticks also wrote a line to the action log
+                CombatAction.objects.filter(pk=event.payload['action_id']).delete()
+            if event.event_type == 'effect_add':
+                StatusEffect.objects.filter(pk=event.payload['effect_id']).delete()
+            elif event.event_type == 'effect_expire':
+                effect = state['effects'].get(str(event.payload['effect_id']))
+                if effect:
+                    StatusEffect.objects.create(
+                        pk=event.payload['effect_id'],
+                        participant_id=effect['participant'],
+                        **{k: v for k, v in effect.items() if k != 'participant'}
+                    )
+            
+            self.current_round = state['round']
+            self.reset_initiative_ring()
+            ring = self.get_initiative_ring(save=False)
+            if 'previous_turn' in event.payload:
+                # Undo always takes the latest event, so the turn it happened on is current again
+                self.current_turn = event.payload['previous_turn']
+            if self.current_turn >= len(ring):
+                self.current_turn = 0
+            self.save(update_fields=['current_round', 'current_turn', 'initiative_ring', 'updated_at'])
+        return event
     
     def roll_initiative(self):
         """Roll initiative for all participants"""
         if self.initiative_rolled:
             return
-            
-        # Roll for enemies
-        for participant in self.participants.filter(participant_type='enemy'):
-            if participant.enemy:
-                initiative_roll = random.randint(1, 20) + participant.enemy.get_dexterity_modifier()
-                participant.initiative_roll = initiative_roll
-                participant.save()
         
-        # Players will need to enter their initiative manually
-        self.initiative_rolled = True
-        self._assign_initiative_order()
-        self.save()
+        with transaction.atomic():
+            participants = list(self.participants.select_related('enemy', 'character'))
+            
+            # Roll for enemies in one pass
+            enemies = [p for p in participants if p.participant_type == 'enemy' and p.enemy]
+            rolls = roll_many([
+                f"1d20{participant.enemy.get_dexterity_modifier():+d}" for participant in enemies
+            ])
+            for participant, roll in zip(enemies, rolls):
+                participant.initiative_roll = roll
+            
+            # Players will need to enter their initiative manually
+            self.initiative_rolled = True
+            self._assign_initiative_order(participants)
+            self.save()
     
-    def _assign_initiative_order(self):
+    def _assign_initiative_order(self, participants=None):
         """Assign initiative order based on rolls"""
-        participants = list(self.participants.all())
+        if participants is None:
+            participants = list(self.participants.select_related('enemy', 'character'))
         # Sort by initiative roll (highest first), then by dexterity modifier as tiebreaker
         participants.sort(key=lambda p: (
             p.initiative_roll or 0,
@@ -124,7 +433,9 @@ class CombatSession(models.Model):
         
         for index, participant in enumerate(participants):
             participant.initiative_order = index
-            participant.save()
+        
+        CombatParticipant.objects.bulk_update(participants, ['initiative_roll', 'initiative_order'])
+        self.reset_initiative_ring(participants)
 
 
 class CombatParticipant(models.Model):
@@ -198,41 +509,58 @@ class CombatParticipant(models.Model):
             return self.enemy.get_dexterity_modifier()
         return 0
     
+    def _sync_initiative_ring(self, was_active):
+        """Tell the combat session when this participant drops out of or rejoins the turn order"""
+        if was_active != self.is_active:
+            self.combat_session.update_participant_status(self)
+    
     def take_damage(self, damage):
         """Apply damage to the participant"""
-        # Apply to temp HP first
-        if self.temp_hp > 0:
-            if damage <= self.temp_hp:
-                self.temp_hp -= damage
-                damage = 0
-            else:
-                damage -= self.temp_hp
-                self.temp_hp = 0
-        
-        # Apply remaining damage to HP
-        self.current_hp = max(0, self.current_hp - damage)
+        was_active = self.is_active
+        self.combat_session.record_event('damage', self, amount=damage)
+        self._apply_damage(damage)
+        self.save()
+        self._sync_initiative_ring(was_active)
+    
+    def _apply_damage(self, damage):
+        """Apply damage in memory without saving"""
+        # Temp HP soaks damage before HP
+        self.current_hp, self.temp_hp = damage_hit_points(self.current_hp, self.temp_hp, damage)
         
         # Check if participant is knocked unconscious
         if self.current_hp <= 0:
             self.is_active = False
-            
-        self.save()
     
     def heal(self, healing):
         """Apply healing to the participant"""
-        self.current_hp = min(self.max_hp, self.current_hp + healing)
+        was_active = self.is_active
+        self.combat_session.record_event('heal', self, amount=healing)
+        self._apply_healing(healing)
+        self.save()
+        self._sync_initiative_ring(was_active)
+    
+    def _apply_healing(self, healing):
+        """Apply healing in memory without saving"""
+        self.current_hp = heal_hit_points(self.current_hp, self.max_hp, healing)
         
         # If healed above 0, reactivate
         if self.current_hp > 0 and not self.is_active:
             self.is_active = True
-            
-        self.save()
     
     def add_temp_hp(self, temp_hp):
         """Add temporary hit points"""
         # Temp HP doesn't stack, take the higher value
+        self.combat_session.record_event('temp_hp', self, amount=temp_hp)
         self.temp_hp = max(self.temp_hp, temp_hp)
         self.save()
+    
+    def add_status_effect(self, name, **fields):
+        """Attach a status effect and record it in the combat log"""
+        fields.setdefault('rounds_remaining', fields.get('duration_rounds'))
+        self.combat_session.ensure_snapshot()
+        effect = StatusEffect.objects.create(participant=self, name=name, **fields)
+        self.combat_session.record_event('effect_add', self, effect_id=effect.pk, effect=effect.to_state())
+        return effect
 
 
 class StatusEffect(models.Model):
@@ -276,8 +604,23 @@ class StatusEffect(models.Model):
         duration_str = f" ({self.rounds_remaining} rounds)" if self.rounds_remaining else ""
         return f"{self.participant.name}: {self.name}{duration_str}"
     
+    def to_state(self):
+        """Fields needed to fold, and restore, this effect from the combat log"""
+        return {
+            'name': self.name,
+            'effect_type': self.effect_type,
+            'description': self.description,
+            'duration_rounds': self.duration_rounds,
+            'rounds_remaining': self.rounds_remaining,
+            'auto_damage_per_turn': self.auto_damage_per_turn,
+            'auto_healing_per_turn': self.auto_healing_per_turn,
+        }
+    
     def advance_round(self):
-        """Called at the start of each round to handle duration and effects"""
+        """
+        Handle duration and effects for this effect alone. Whole rounds are
+        ticked in bulk by CombatSession.advance_round().
+        """
         # Apply automatic effects
         if self.auto_damage_per_turn > 0:
             self.participant.take_damage(self.auto_damage_per_turn)
@@ -333,4 +676,57 @@ class CombatAction(models.Model):
     
     def __str__(self):
         target_str = f" vs {self.target.name}" if self.target else ""
-        return f"R{self.round_number}: {self.participant.name} - {self.description}{target_str}"
\ No newline at end of file
+        return f"R{self.round_number}: {self.participant.name} - {self.description}{target_str}"
+
+
+class CombatEvent(models.Model):
+    """
+    Append-only log of state changes in a combat session. The state of a
+    fight at any point is a fold over these events from the latest snapshot.
+    """
+    EVENT_TYPES = [
+        ('damage', 'Damage'),
+        ('heal', 'Healing'),
+        ('temp_hp', 'Temporary HP'),
+        ('turn_advance', 'Turn Advance'),
+        ('effect_add', 'Effect Added'),
+        ('effect_expire', 'Effect Expired'),
+    ]
+    
+    combat_session = models.ForeignKey(
+        CombatSession, on_delete=models.CASCADE, related_name='events'
+    )
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    participant = models.ForeignKey(
+        CombatParticipant, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='events'
+    )
+    round_number = models.PositiveIntegerField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"R{self.round_number}: {self.get_event_type_display()} {self.payload}"
+
+
+class CombatSnapshot(models.Model):
+    """
+    Compact fold of a combat session's event log up to and including
+    ``last_event_id``, used as the starting point for replays.
+    """
+    combat_session = models.ForeignKey(
+        CombatSession, on_delete=models.CASCADE, related_name='snapshots'
+    )
+    last_event_id = models.PositiveBigIntegerField(default=0)
+    state = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_event_id']
+        indexes = [models.Index(fields=['combat_session', 'last_event_id'])]
+    
+    def __str__(self):
+        return f"Snapshot of {self.combat_session.name} at event {self.last_event_id}"
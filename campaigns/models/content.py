@@ -59,6 +59,8 @@ class Chapter(models.Model):
     owner = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='chapters'
     )
+    # Replaced on every save; see services/export.py
+    export_version = models.BigIntegerField(default=0, editable=False)
 
     def get_absolute_url(self):
         return reverse("campaigns:chapter_detail", kwargs={
@@ -132,6 +134,10 @@ class Encounter(models.Model):
 
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='encounters')
     order = models.PositiveIntegerField(default=1, help_text="Order of the encounter in the chapter")
+    # Monster count and raw XP of the enemy roster, cleared when the roster changes
+    difficulty_cache = models.JSONField(null=True, blank=True, editable=False)
+    # Replaced whenever the encounter or its notes change; see services/export.py
+    export_version = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['order']  # Ascending order by default
@@ -139,5 +145,10 @@ class Encounter(models.Model):
     def tags_as_list(self):
         return self.tags.split(",")
 
+    def get_difficulty(self):
+        """Computed XP budget and difficulty rating against the campaign's party"""
+        from ..services.difficulty import encounter_difficulty
+        return encounter_difficulty(self)
+
     def __str__(self):
         return f"{self.title} (Chapter {self.chapter.order})"
\ No newline at end of file
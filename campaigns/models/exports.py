@@ -0,0 +1,95 @@
+from django.db import models
+
+from .base import Campaign
+from .content import Chapter, Encounter
+from .world import Location, NPC
+from .sessions import SessionNote
+
+
+class ExportSection(models.Model):
+    """
+    Rendered Markdown for one part of an export, stored with the content
+    version it was rendered from. See ``campaigns/services/export.py``.
+    """
+    KIND_CHOICES = [
+        ('campaign', 'Campaign header'),
+        ('chapter', 'Chapter heading'),
+        ('encounter', 'Encounter with notes'),
+        ('encounter_document', 'Encounter export'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='export_sections')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Primary key of the campaign, chapter or encounter the section renders
+    object_id = models.PositiveIntegerField()
+    version = models.CharField(max_length=100)
+    markdown = models.TextField()
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}"
+
+
+# Give changed content a new export version so its stored sections go stale
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+
+@receiver(pre_save, sender=Campaign)
+@receiver(pre_save, sender=Chapter)
+@receiver(pre_save, sender=Encounter)
+def stamp_export_version(sender, instance, update_fields=None, **kwargs):
+    from ..services.export import new_version
+
+    if update_fields is None or 'export_version' in update_fields:
+        instance.export_version = new_version()
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_save, sender=Chapter)
+@receiver(post_save, sender=Encounter)
+def stamp_partial_save(sender, instance, update_fields=None, **kwargs):
+    """A save limited to some fields doesn't write export_version, so stamp it after"""
+    from ..services.export import new_version
+
+    if update_fields is not None and 'export_version' not in update_fields:
+        instance.export_version = new_version()
+        sender.objects.filter(pk=instance.pk).update(export_version=instance.export_version)
+
+
+@receiver(post_save, sender=Location)
+@receiver(pre_delete, sender=Location)
+@receiver(post_save, sender=NPC)
+@receiver(pre_delete, sender=NPC)
+def invalidate_campaign_header(sender, instance, **kwargs):
+    """Locations and NPCs are listed in the campaign header and named in encounter exports"""
+    from ..services.export import invalidate_campaign
+
+    invalidate_campaign(instance.campaign_id)
+
+
+@receiver(post_save, sender=SessionNote)
+@receiver(post_delete, sender=SessionNote)
+def invalidate_note_encounter(sender, instance, **kwargs):
+    from ..services.export import invalidate_encounters
+
+    if instance.encounter_id:
+        invalidate_encounters([instance.encounter_id])
+
+
+@receiver(m2m_changed, sender=Encounter.npcs.through)
+def invalidate_encounter_npcs(sender, instance, action, reverse, pk_set, **kwargs):
+    """Encounter exports list the encounter's NPCs"""
+    from ..services.export import invalidate_encounters
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # instance is the Encounter
+        invalidate_encounters([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_encounters(instance.encounters.values_list('pk', flat=True))
+    else:
+        invalidate_encounters(pk_set or [])
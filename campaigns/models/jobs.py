@@ -0,0 +1,55 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class LLMJob(models.Model):
+    """
+    A queued call to the language model. Views enqueue jobs and return at
+    once; the ``process_llm_jobs`` worker claims them, runs them with retries
+    and writes the result back to the target object.
+    """
+    KIND_CHOICES = [
+        ('session_summary', 'Session Summary'),
+        ('compress_notes', 'Compress Notes'),
+        ('ingest_pdf', 'Import Adventure PDF'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='llm_jobs')
+    # What the job writes to, e.g. "note:12"; one active job per kind and target
+    target = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['kind', 'target']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
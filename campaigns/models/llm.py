@@ -0,0 +1,52 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class CachedLLMResponse(models.Model):
+    """
+    A stored language-model reply, keyed by a hash of everything that shapes
+    it: model, sampling settings, prompt template version and input text.
+    See ``campaigns/services/llm.py`` for lookup and eviction.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=50)
+    prompt_version = models.CharField(max_length=50)
+    response = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-last_used_at']
+
+    def __str__(self):
+        return f"{self.prompt_version} ({self.hits} hits)"
+
+
+class LLMUsage(models.Model):
+    """
+    Daily language-model usage for one user and campaign. Calls made
+    outside a request, or without a campaign, have those fields empty.
+    """
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='llm_usage')
+    campaign = models.ForeignKey(
+        'campaigns.Campaign', on_delete=models.CASCADE, null=True, blank=True, related_name='llm_usage'
+    )
+    calls = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    duration_ms = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['day', 'user', 'campaign']
+        verbose_name_plural = 'LLM usage'
+
+    def __str__(self):
+        return f"{self.day} {self.user or 'system'}: {self.total_tokens} tokens"
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
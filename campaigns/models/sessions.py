@@ -116,6 +116,8 @@ class SessionSchedule(models.Model):
     include_weekdays = models.BooleanField(
         default=True, help_text="Include weekdays in scheduling options"
     )
+    # Respondents and who picked each slot, updated as responses change
+    availability_heatmap = models.JSONField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
@@ -201,14 +203,21 @@ class SessionSchedule(models.Model):
 
         return slots
 
+    def get_slot_universe(self):
+        """Precomputed, shared slot layout for the current configuration"""
+        from ..services.availability import get_slot_universe
+
+        return get_slot_universe(self)
+
+    def get_availability_heatmap(self):
+        """Materialized respondents and per-slot picks, built on first use"""
+        from ..services.heatmap import get_heatmap
+
+        return get_heatmap(self)
+
     def get_all_time_slots_by_date(self):
-        """Get all time slots organized by date"""
-        slots_by_date = {}
-        for date in self.get_date_range():
-            slots_by_date[date.strftime("%Y-%m-%d")] = (
-                self.generate_time_slots_for_date(date)
-            )
-        return slots_by_date
+        """Get all time slots organized by date (read-only)"""
+        return self.get_slot_universe().slots_by_date
 
 
 class PlayerAvailability(models.Model):
@@ -239,6 +248,29 @@ class PlayerAvailability(models.Model):
         self.availability_data[date_str] = time_slots
 
 
+class AvailabilitySlot(models.Model):
+    """
+    One selected time slot of a player's availability.
+
+    Slots are stored as rows so selecting and clearing are single inserts
+    and deletes; ``PlayerAvailability.availability_data`` is kept in step
+    as a read copy.
+    """
+
+    availability = models.ForeignKey(
+        PlayerAvailability, on_delete=models.CASCADE, related_name="slots"
+    )
+    date = models.DateField()
+    time_slot = models.CharField(max_length=20)
+
+    class Meta:
+        ordering = ["date", "time_slot"]
+        unique_together = ["availability", "date", "time_slot"]
+
+    def __str__(self):
+        return f"{self.availability.player_name} - {self.date} {self.time_slot}"
+
+
 class ScheduledSession(models.Model):
     STATUS_CHOICES = [
         ("confirmed", "Confirmed"),
@@ -271,3 +303,36 @@ class ScheduledSession(models.Model):
     def end_datetime(self):
         return self.scheduled_datetime + timezone.timedelta(hours=self.duration_hours)
 
+
+# Keep slot rows and the schedule heatmap in step with responses
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=PlayerAvailability)
+def record_heatmap_respondent(sender, instance, created, update_fields=None, **kwargs):
+    """Add a new respondent to the heatmap or refresh a renamed one."""
+    from ..services.heatmap import record_respondent
+
+    if created or update_fields is None or "player_name" in update_fields:
+        record_respondent(instance)
+
+
+@receiver(post_delete, sender=PlayerAvailability)
+def remove_heatmap_respondent(sender, instance, **kwargs):
+    """Drop a deleted response and its picks from the heatmap."""
+    from ..services.heatmap import remove_respondent
+
+    remove_respondent(instance)
+
+
+@receiver(post_save, sender=PlayerAvailability)
+def sync_availability_slots(sender, instance, created, update_fields=None, **kwargs):
+    """Mirror a saved ``availability_data`` into AvailabilitySlot rows."""
+    from ..services.slot_selection import sync_slot_rows
+
+    if update_fields is not None and "availability_data" not in update_fields:
+        return
+    if created and not instance.availability_data:
+        return
+    sync_slot_rows(instance)
@@ -617,4 +617,35 @@ class Enemy(models.Model):
             source_npc=npc,
             owner=npc.owner
         )
-        return enemy
\ No newline at end of file
+        return enemy
+
+# Keep cached encounter difficulty in step with enemy rosters
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+
+@receiver(m2m_changed, sender=Enemy.encounters.through)
+def invalidate_roster_difficulty(sender, instance, action, reverse, pk_set, **kwargs):
+    """Clear the difficulty cache of encounters whose enemy roster changed."""
+    from ..services.difficulty import invalidate_encounter_difficulty
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is the Encounter
+        invalidate_encounter_difficulty([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_encounter_difficulty(instance.encounters.values_list('pk', flat=True))
+    else:
+        invalidate_encounter_difficulty(pk_set or [])
+
+
+@receiver(post_save, sender=Enemy)
+@receiver(pre_delete, sender=Enemy)
+def invalidate_enemy_difficulty(sender, instance, **kwargs):
+    """Clear the difficulty cache of every encounter an edited or deleted enemy is in."""
+    from .content import Encounter
+
+    if kwargs.get('created'):
+        return
+    Encounter.objects.filter(enemies=instance).update(difficulty_cache=None)
@@ -0,0 +1,412 @@
+"""
+Full campaign archives for backups and moving campaigns between instances.
+
+``campaign_records(campaign)`` yields the campaign as JSON Lines: a header
+line, then one line per object in Django's ``jsonl`` serialization format
+(``{"model": ..., "pk": ..., "fields": {...}}``). Models come in dependency
+order, so every foreign key and many-to-many link points at an object
+earlier in the file.
+
+``campaign_archive(campaign)`` yields a ZIP with the records as
+``campaign.jsonl`` and each location's map image under ``media/``.
+
+Both exports stay in bounded memory however large the campaign is. Rows
+are read with ``iterator()`` and serialized a batch at a time, with
+many-to-many links prefetched per batch. The ZIP is written to a buffer
+that is emptied after every batch, and images are copied from storage in
+chunks, so no file is ever held whole.
+
+Caches that are rebuilt on demand (difficulty, initiative ring, export
+versions) are left out. Users are exported by primary key only; accounts,
+collaborators, chat history and scheduling belong to the instance and are
+not part of the archive.
+
+``import_campaign(source, owner)`` reads either form back as a new campaign
+owned by ``owner``. Records are deserialized as the file is read and
+inserted a model at a time with ``bulk_create``, including the
+many-to-many tables, all in one transaction. The export's primary keys are
+mapped to the new rows as they are created, so every reference (foreign
+keys, many-to-many links, the ids inside combat events and snapshots) is
+rewritten to point inside the imported campaign. A reference to anything
+outside the archive is an error, and a map image that isn't bundled is
+only kept if the importing user already uses it, so a crafted file can't
+attach itself to another user's data. Anything else wrong with the file
+(bad encoding, invalid values) is reported as an ``ArchiveError``.
+"""
+import codecs
+import json
+import zipfile
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.files import File
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+FORMAT = "dnd-companion.campaign"
+FORMAT_VERSION = 1
+# Objects serialized per batch
+ROWS_PER_FETCH = 200
+# Objects inserted per bulk_create on import
+BATCH_SIZE = 500
+RECORDS_NAME = "campaign.jsonl"
+MEDIA_PREFIX = "media/"
+# Cached values that are rebuilt after import instead of being exported
+SKIPPED_FIELDS = {"export_version", "difficulty_cache", "initiative_ring"}
+
+
+class ArchiveError(Exception):
+    """The file isn't a campaign archive this instance can import"""
+
+
+def archived_models():
+    """
+    (model, campaign lookup, many-to-many fields) for everything in an
+    archive, in the order it is written and read back
+    """
+    from ..models import (
+        Campaign, Chapter, CharacterSummary, CombatAction, CombatEvent, CombatParticipant, CombatSession,
+        CombatSnapshot, Encounter, Enemy, Location, NPC, SessionNote, StatusEffect,
+    )
+
+    combat = "encounter__chapter__campaign"
+    return [
+        (Campaign, "pk", []),
+        (Chapter, "campaign", []),
+        (Location, "campaign", ["chapters"]),
+        (NPC, "campaign", ["chapters"]),
+        (Encounter, "chapter__campaign", ["npcs"]),
+        (Enemy, "campaign", ["encounters", "chapters"]),
+        (CharacterSummary, "campaign", []),
+        (SessionNote, "encounter__chapter__campaign", []),
+        (CombatSession, combat, []),
+        (CombatParticipant, f"combat_session__{combat}", []),
+        (StatusEffect, f"participant__combat_session__{combat}", []),
+        (CombatAction, f"combat_session__{combat}", []),
+        (CombatEvent, f"combat_session__{combat}", []),
+        (CombatSnapshot, f"combat_session__{combat}", []),
+    ]
+
+
+def _fields(model):
+    return [
+        field.name for field in model._meta.get_fields()
+        if field.concrete and not field.primary_key and field.name not in SKIPPED_FIELDS
+    ]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _querysets(campaign):
+    from django.db.models import Prefetch
+
+    for model, lookup, m2m in archived_models():
+        queryset = model.objects.filter(**{lookup: campaign.pk}).order_by("pk")
+        for name in m2m:
+            related = model._meta.get_field(name).related_model
+            queryset = queryset.prefetch_related(Prefetch(name, queryset=related.objects.only("pk")))
+        yield model, queryset
+
+
+def campaign_records(campaign, on_object=None):
+    """
+    Yield the campaign as JSON Lines text, a batch of lines at a time.
+    ``on_object`` is called with every exported object, e.g. to collect files.
+    """
+    header = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "campaign": campaign.pk,
+        "exported_at": timezone.now().isoformat(),
+    }
+    yield json.dumps(header) + "\n"
+
+    serializer = serializers.get_serializer("jsonl")()
+    for model, queryset in _querysets(campaign):
+        fields = _fields(model)
+        for batch in _batches(queryset.iterator(ROWS_PER_FETCH), ROWS_PER_FETCH):
+            if on_object:
+                for obj in batch:
+                    on_object(obj)
+            yield serializer.serialize(batch, fields=fields)
+
+
+class _ZipBuffer:
+    """Write-only file for ``ZipFile`` whose contents are taken as they arrive"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def media_name(name):
+    """Where a stored file is kept inside an archive"""
+    return MEDIA_PREFIX + name
+
+
+def campaign_archive(campaign, storage=None):
+    """Yield a ZIP of the campaign records and its map images, in pieces"""
+    from ..models import Location
+
+    storage = storage or default_storage
+    files = []
+
+    def collect(obj):
+        if isinstance(obj, Location) and obj.map_image:
+            files.append(obj.map_image.name)
+
+    buffer = _ZipBuffer()
+    # The buffer can't seek, so ZipFile writes sizes after each entry's data
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(RECORDS_NAME, "w", force_zip64=True) as records:
+            for text in campaign_records(campaign, on_object=collect):
+                records.write(text.encode())
+                yield buffer.drain()
+
+        for name in dict.fromkeys(files):
+            if not storage.exists(name):
+                continue
+            info = zipfile.ZipInfo(media_name(name), date_time=timezone.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = storage.size(name)
+            with storage.open(name, "rb") as source, archive.open(info, "w") as target:
+                for chunk in source.chunks():
+                    target.write(chunk)
+                    yield buffer.drain()
+    yield buffer.drain()
+
+
+def _header(lines):
+    try:
+        header = json.loads(next(lines, "") or "null")
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise ArchiveError("This is not a campaign archive")
+    version = header.get("version", 0)
+    if not isinstance(version, int):
+        raise ArchiveError("This is not a campaign archive")
+    if version > FORMAT_VERSION:
+        raise ArchiveError("The archive was made by a newer version and can't be read here")
+    return header
+
+
+class _Importer:
+    """Inserts deserialized records in batches, mapping old primary keys to new ones"""
+
+    def __init__(self, owner, bundle, storage):
+        from ..models import Campaign
+
+        self.owner = owner
+        self.bundle_files = set(bundle.namelist()) if bundle else set()
+        self.bundle = bundle
+        self.storage = storage
+        self.order = [model for model, _, _ in archived_models()]
+        self.m2m = {model: names for model, _, names in archived_models()}
+        self.ids = {}
+        self.saved_files = []
+        self.owned_files = set()
+        self.campaign_model = Campaign
+        self.campaign = None
+
+    def new_id(self, model, old, label):
+        try:
+            return self.ids[model, old]
+        except KeyError:
+            raise ArchiveError(
+                f"{label} refers to {model._meta.verbose_name} {old}, which isn't in the archive"
+            ) from None
+
+    def effect_id(self, old):
+        # Effects that have expired are only named in events and snapshots. A
+        # negative id keeps them distinct without colliding with real rows.
+        from ..models import StatusEffect
+
+        return self.ids.get((StatusEffect, int(old)), -abs(int(old)))
+
+    def run(self, records):
+        model, batch = None, []
+        for record in records:
+            obj = record.object
+            if type(obj) not in self.m2m:
+                raise ArchiveError(f"{obj._meta.label} records can't be imported")
+            if type(obj) is not model or len(batch) >= BATCH_SIZE:
+                self.flush(model, batch)
+                model, batch = self.start(model, type(obj)), []
+            batch.append(record)
+        self.flush(model, batch)
+        if self.campaign is None:
+            raise ArchiveError("The archive has no campaign")
+        return self.campaign
+
+    def start(self, previous, model):
+        if previous is not None and self.order.index(model) < self.order.index(previous):
+            raise ArchiveError("The archive records are out of order")
+        if (model is self.campaign_model) == (self.campaign is not None):
+            raise ArchiveError("An archive holds exactly one campaign, before everything else")
+        return model
+
+    def flush(self, model, batch):
+        from ..models import Location
+
+        if not batch:
+            return
+        if model is Location:
+            self.find_owned_files([record.object.map_image.name for record in batch])
+        old_ids = [record.object.pk for record in batch]
+        objects = [self.prepare(record.object) for record in batch]
+        model.objects.bulk_create(objects)
+        for old, obj in zip(old_ids, objects):
+            self.ids[model, old] = obj.pk
+        if model is self.campaign_model:
+            self.campaign = objects[0]
+
+        for name in self.m2m[model]:
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source, target = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+            rows = [
+                through(**{source: obj.pk, target: self.new_id(field.related_model, old, field.verbose_name)})
+                for record, obj in zip(batch, objects)
+                for old in record.m2m_data.get(name, [])
+            ]
+            through.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+    def prepare(self, obj):
+        from ..models import CombatEvent, CombatSnapshot, Location
+        from .export import new_version
+
+        label = f"{obj._meta.verbose_name} {obj.pk}"
+        obj.pk = None
+        for field in obj._meta.concrete_fields:
+            if not field.many_to_one:
+                continue
+            old = getattr(obj, field.attname)
+            if field.related_model is User:
+                # Accounts don't travel with the archive
+                new = None if field.null else self.owner.pk
+            elif old is None:
+                new = None
+            else:
+                new = self.new_id(field.related_model, old, label)
+            setattr(obj, field.attname, new)
+
+        if hasattr(obj, "export_version"):
+            obj.export_version = new_version()
+        if isinstance(obj, Location) and obj.map_image:
+            obj.map_image.name = self.restore_file(obj.map_image.name)
+        elif isinstance(obj, CombatEvent):
+            self.remap_event(obj)
+        elif isinstance(obj, CombatSnapshot):
+            self.remap_snapshot(obj, label)
+        return obj
+
+    def remap_event(self, event):
+        from ..models import CombatAction
+
+        if "effect_id" in event.payload:
+            event.payload["effect_id"] = self.effect_id(event.payload["effect_id"])
+        if event.payload.get("action_id"):
+            # Only used to tidy the action log on undo, so a missing action is dropped
+            event.payload["action_id"] = self.ids.get((CombatAction, event.payload["action_id"]))
+
+    def remap_snapshot(self, snapshot, label):
+        from ..models import CombatEvent, CombatParticipant
+
+        if snapshot.last_event_id:
+            snapshot.last_event_id = self.new_id(CombatEvent, snapshot.last_event_id, label)
+        state = snapshot.state
+        state["participants"] = {
+            str(self.new_id(CombatParticipant, int(pid), label)): values
+            for pid, values in state.get("participants", {}).items()
+        }
+        effects = {}
+        for eid, effect in state.get("effects", {}).items():
+            if effect.get("participant"):
+                effect["participant"] = self.new_id(CombatParticipant, int(effect["participant"]), label)
+            effects[str(self.effect_id(eid))] = effect
+        state["effects"] = effects
+
+    def rollback_files(self):
+        for name in self.saved_files:
+            self.storage.delete(name)
+
+    def find_owned_files(self, names):
+        """Note which of ``names`` the importing user's own locations already use"""
+        from ..models import Location
+
+        names = [name for name in names if name and media_name(name) not in self.bundle_files]
+        if names:
+            self.owned_files.update(Location.objects.filter(
+                campaign__owner=self.owner, map_image__in=names
+            ).values_list("map_image", flat=True))
+
+    def restore_file(self, name):
+        """Copy a bundled file into storage; returns the name it was saved under"""
+        if media_name(name) in self.bundle_files:
+            with self.bundle.open(media_name(name)) as source:
+                saved = self.storage.save(name, File(source, name=name))
+            self.saved_files.append(saved)
+            return saved
+        # Without the file (a JSON Lines import) keep a name only if the importer's
+        # own locations already use it, e.g. when restoring a backup
+        return name if name in self.owned_files else ""
+
+
+def import_campaign(source, owner, storage=None):
+    """
+    Import a campaign archive from ``source``, a binary file holding JSON
+    Lines or a ZIP, as a new campaign owned by ``owner``. Returns the campaign.
+    """
+    storage = storage or default_storage
+    bundle = None
+    if zipfile.is_zipfile(source):
+        source.seek(0)
+        bundle = zipfile.ZipFile(source)
+        if RECORDS_NAME not in bundle.namelist():
+            raise ArchiveError(f"The ZIP has no {RECORDS_NAME}")
+        lines = codecs.iterdecode(bundle.open(RECORDS_NAME), "utf-8")
+    else:
+        source.seek(0)
+        lines = codecs.iterdecode(source, "utf-8")
+
+    lines = iter(lines)
+    _header(lines)
+    importer = _Importer(owner, bundle, storage)
+    records = serializers.deserialize("jsonl", lines, ignorenonexistent=True)
+    try:
+        with transaction.atomic():
+            return importer.run(records)
+    except (
+        serializers.base.DeserializationError, DatabaseError, ValidationError, ValueError, TypeError,
+        AttributeError, KeyError,
+    ) as error:
+        # Undecodable text, wrongly typed values and rows the database refuses
+        importer.rollback_files()
+        raise ArchiveError(f"The archive is damaged: {error}") from error
+    except Exception:
+        importer.rollback_files()
+        raise
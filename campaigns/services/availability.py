@@ -0,0 +1,226 @@
+"""
+Availability index for session scheduling.
+
+Every (date, time slot) pair in a schedule is given a bit position, and each
+player's ``availability_data`` is encoded once into an integer bitset over
+those positions. The index also keeps the transposed view, one bitset of
+players per slot, so per-slot counts are popcounts and "everyone is free"
+is a single AND across players.
+
+The slot layout itself is a ``SlotUniverse``: an immutable object built once
+per schedule configuration and shared by the organizer page, the player
+form and the toggle endpoint. It is cached by the configuration values, so
+editing a schedule simply produces a different key.
+"""
+import heapq
+from datetime import datetime
+from functools import lru_cache, reduce
+from types import MappingProxyType
+
+import numpy as np
+
+# SessionSchedule fields that determine the slot layout
+SLOT_CONFIG_FIELDS = (
+    "date_range_start",
+    "date_range_end",
+    "include_weekdays",
+    "weekday_start_time",
+    "weekday_end_time",
+    "weekend_start_time",
+    "weekend_end_time",
+    "slot_duration_hours",
+    "slot_overlap_hours",
+)
+
+
+class SlotIndex:
+    """Bit positions for every ``(date_str, slot_label)`` in a slot layout"""
+
+    def __init__(self, slots_by_date):
+        self.slots_by_date = slots_by_date
+        self.keys = []
+        self.slots = []
+        self.bits = {}
+        self.bits_by_date = {}
+        for date_str, slots in slots_by_date.items():
+            date_bits = self.bits_by_date[date_str] = {}
+            for slot in slots:
+                key = (date_str, slot["label"])
+                self.bits[key] = date_bits[slot["label"]] = len(self.keys)
+                self.keys.append(key)
+                self.slots.append(slot)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode_bits(self, availability_data):
+        """Bit positions of the slots selected in an ``availability_data`` dict"""
+        bits = []
+        for date_str, labels in (availability_data or {}).items():
+            date_bits = self.bits_by_date.get(date_str)
+            if date_bits:
+                bits.extend(map(date_bits.get, labels))
+        # Labels that aren't part of the layout map to None
+        return [bit for bit in bits if bit is not None]
+
+    def encode(self, availability_data):
+        """Bitset of the slots selected in an ``availability_data`` dict"""
+        mask = 0
+        for bit in self.encode_bits(availability_data):
+            mask |= 1 << bit
+        return mask
+
+    def decode(self, mask):
+        """``availability_data`` dict for a bitset"""
+        data = {}
+        for bit in iter_bits(mask):
+            date_str, label = self.keys[bit]
+            data.setdefault(date_str, []).append(label)
+        return data
+
+
+class SlotUniverse(SlotIndex):
+    """
+    Every date and time slot of a schedule configuration, with labels and
+    bit positions precomputed. Slots are read-only mappings so the shared
+    instance can't be changed by one request under another.
+    """
+
+    def __init__(self, schedule):
+        days = []
+        slots_by_date = {}
+        for day in schedule.get_date_range():
+            date_str = day.strftime("%Y-%m-%d")
+            slots = tuple(
+                MappingProxyType(slot) for slot in schedule.generate_time_slots_for_date(day)
+            )
+            slots_by_date[date_str] = slots
+            days.append(MappingProxyType({
+                "date": day,
+                "date_str": date_str,
+                "day_name": day.strftime("%A"),
+                "time_slots": slots,
+            }))
+
+        super().__init__(MappingProxyType(slots_by_date))
+        self.slot_duration_hours = schedule.slot_duration_hours
+        self.days = tuple(days)
+        self.slot_dates = tuple(day["date"] for day in days for _ in day["time_slots"])
+        self.keys = tuple(self.keys)
+        self.slots = tuple(self.slots)
+        self.bits = MappingProxyType(self.bits)
+        self.bits_by_date = MappingProxyType({
+            date_str: MappingProxyType(bits) for date_str, bits in self.bits_by_date.items()
+        })
+
+    def bit_for(self, date_str, label):
+        """Bit position of a slot, or ``None`` if it isn't part of the schedule"""
+        return self.bits_by_date.get(date_str, {}).get(label)
+
+
+def slot_config(schedule):
+    return tuple((field, getattr(schedule, field)) for field in SLOT_CONFIG_FIELDS)
+
+
+@lru_cache(maxsize=256)
+def _cached_slot_universe(config):
+    from ..models import SessionSchedule
+
+    return SlotUniverse(SessionSchedule(**dict(config)))
+
+
+def get_slot_universe(schedule):
+    """Shared ``SlotUniverse`` for a schedule's current configuration"""
+    return _cached_slot_universe(slot_config(schedule))
+
+
+def _pack_rows(matrix):
+    """One integer bitset per row of a boolean matrix, column 0 as bit 0"""
+    packed = np.packbits(matrix, axis=1, bitorder="little")
+    return [int.from_bytes(row.tobytes(), "little") for row in packed]
+
+
+def iter_bits(mask):
+    """Positions of the set bits in ``mask``, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class AvailabilityIndex:
+    """
+    Player and slot bitsets for a set of availability responses. Pass
+    ``selected``, a boolean players x slots matrix, when the picks are
+    already known and the responses only need ``pk`` and ``player_name``.
+    """
+
+    def __init__(self, slot_index, responses, selected=None):
+        self.slot_index = slot_index
+        self.responses = list(responses)
+
+        # Boolean players x slots matrix, packed into bitsets both ways
+        if selected is None:
+            players, bits = [], []
+            for player, response in enumerate(self.responses):
+                picked = slot_index.encode_bits(response.availability_data)
+                players.extend([player] * len(picked))
+                bits.extend(picked)
+            selected = np.zeros((len(self.responses), len(slot_index)), dtype=bool)
+            selected[players, bits] = True
+        self.selected = selected
+        self.player_masks = _pack_rows(self.selected)
+        self.slot_masks = _pack_rows(self.selected.T)
+
+    def count(self, bit):
+        return self.slot_masks[bit].bit_count()
+
+    def counts(self):
+        return [mask.bit_count() for mask in self.slot_masks]
+
+    def players(self, bit):
+        """Responses available in a slot, in response order"""
+        return [self.responses[player] for player in iter_bits(self.slot_masks[bit])]
+
+    def is_available(self, player, bit):
+        return bool(self.player_masks[player] >> bit & 1)
+
+    def everyone_available(self):
+        """Slot keys every respondent can make"""
+        if not self.player_masks:
+            return []
+        common = reduce(lambda left, right: left & right, self.player_masks)
+        return [self.slot_index.keys[bit] for bit in iter_bits(common)]
+
+    def popular_slots(self, limit=5):
+        """
+        The ``limit`` slots with the most available players, earliest first
+        on ties, in the shape the schedule detail page renders.
+        """
+        candidates = [bit for bit, mask in enumerate(self.slot_masks) if mask]
+        top = heapq.nlargest(limit, candidates, key=self.count)
+
+        popular = []
+        for bit in top:
+            date_str, label = self.slot_index.keys[bit]
+            players = [response.player_name for response in self.players(bit)]
+            popular.append({
+                "date": datetime.strptime(date_str, "%Y-%m-%d").date(),
+                "time_slot": label,
+                "time_display": label,
+                "start_time": self.slot_index.slots[bit]["start_time"],
+                "count": len(players),
+                "players": players,
+            })
+        return popular
+
+    def grid_rows(self, date_str):
+        """Rows of ``(slot, [available per player])`` for one date"""
+        width = len(self.responses)
+        rows = []
+        for slot in self.slot_index.slots_by_date.get(date_str, []):
+            bit = self.slot_index.bits_by_date[date_str][slot["label"]]
+            # Binary string of the player bitset, reversed so player 0 comes first
+            flags = format(self.slot_masks[bit], f"0{width}b")[::-1] if width else ""
+            rows.append({"slot": slot, "cells": [flag == "1" for flag in flags]})
+        return rows
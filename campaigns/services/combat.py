@@ -0,0 +1,252 @@
+"""
+Combat state engine.
+
+Keeps the initiative order of a combat session as a compact ring of
+``[participant_id, initiative_order]`` pairs stored on the session row, so
+turn advancement and current-participant lookups don't need to re-query
+and re-count the participant table on every click. Dice are rolled in
+batches so a whole encounter can be handled in one pass.
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+
+from .dice import DiceExpressionError, compile_dice
+
+
+class InitiativeRing:
+    """
+    Ordered ring of active combat participants keyed by participant id.
+
+    The ring only contains participants that can take a turn (``is_active``).
+    It is loaded once per session and then updated incrementally when a
+    participant drops to 0 HP or is healed back up.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = [[int(pid), int(order)] for pid, order in (entries or [])]
+        self.entries.sort(key=self._sort_key)
+        self._reindex()
+
+    @staticmethod
+    def _sort_key(entry):
+        return (entry[1], entry[0])
+
+    def _reindex(self):
+        self._positions = {pid: index for index, (pid, _) in enumerate(self.entries)}
+
+    @classmethod
+    def load(cls, combat_session):
+        """Build the ring for a session with a single query"""
+        rows = combat_session.participants.filter(is_active=True).values_list(
+            'id', 'initiative_order'
+        )
+        return cls(rows)
+
+    @classmethod
+    def from_participants(cls, participants):
+        """Build the ring from participants that are already in memory"""
+        return cls([p.pk, p.initiative_order] for p in participants if p.is_active)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, participant_id):
+        return participant_id in self._positions
+
+    def participant_id_at(self, turn):
+        """Return the participant id whose turn it is at the given index"""
+        if 0 <= turn < len(self.entries):
+            return self.entries[turn][0]
+        return None
+
+    def position_of(self, participant_id):
+        return self._positions.get(participant_id)
+
+    def insert(self, participant_id, initiative_order):
+        """Add a participant to the ring, returning its new position"""
+        if participant_id in self._positions:
+            return self._positions[participant_id]
+        entry = [participant_id, initiative_order]
+        index = bisect_left([self._sort_key(e) for e in self.entries], self._sort_key(entry))
+        self.entries.insert(index, entry)
+        self._reindex()
+        return index
+
+    def remove(self, participant_id):
+        """Drop a participant from the ring, returning its old position"""
+        index = self._positions.get(participant_id)
+        if index is None:
+            return None
+        del self.entries[index]
+        self._reindex()
+        return index
+
+    def to_json(self):
+        return [list(entry) for entry in self.entries]
+
+
+def build_tracker_context(combat_session):
+    """
+    Materialise everything the combat tracker page needs in three queries:
+    participants, their status effects and the current round's actions.
+    Active, current and bloodied state are derived in Python.
+    """
+    participants = list(
+        combat_session.participants.order_by('initiative_order')
+        .select_related('enemy', 'character')
+        .prefetch_related('status_effects')
+    )
+    actions = list(
+        combat_session.actions.filter(round_number=combat_session.current_round)
+        .select_related('participant', 'target')
+        .order_by('timestamp')
+    )
+
+    if combat_session.initiative_ring is None:
+        ring = InitiativeRing.from_participants(participants)
+    else:
+        ring = InitiativeRing(combat_session.initiative_ring)
+    current_id = ring.participant_id_at(combat_session.current_turn)
+    by_id = {participant.pk: participant for participant in participants}
+
+    return {
+        'participants': participants,
+        'active_participants': [p for p in participants if p.is_active],
+        'bloodied_participants': [p for p in participants if p.is_active and p.is_bloodied],
+        'current_participant': by_id.get(current_id),
+        'current_round_actions': actions,
+    }
+
+
+class CombatRosterBuilder:
+    """
+    Collects the participants for a combat session and inserts them with a
+    single ``bulk_create``. Enemies can be added several times over, in which
+    case the copies are numbered ("Goblin 1", "Goblin 2", ...).
+    """
+
+    DEFAULT_PLAYER_HP = 20
+
+    def __init__(self, combat_session):
+        self.combat_session = combat_session
+        self.participants = []
+
+    def add_enemy(self, enemy, count=1, roll_hit_points=False):
+        """
+        Queue ``count`` copies of an enemy. With ``roll_hit_points`` each copy
+        rolls its own HP from the enemy's hit dice, falling back to the fixed
+        hit points when the hit dice are missing or can't be parsed.
+        """
+        from ..models import CombatParticipant
+
+        hit_points = [enemy.hit_points] * count
+        if roll_hit_points and enemy.hit_dice and count:
+            try:
+                hit_points = [max(int(hp), 1) for hp in compile_dice(enemy.hit_dice).roll(count)]
+            except DiceExpressionError:
+                pass
+
+        for number, hp in enumerate(hit_points, start=1):
+            self.participants.append(CombatParticipant(
+                combat_session=self.combat_session,
+                participant_type='enemy',
+                enemy=enemy,
+                name=enemy.name if count == 1 else f"{enemy.name} {number}",
+                current_hp=hp,
+                max_hp=hp,
+            ))
+        return self
+
+    def add_character(self, character):
+        """Queue a player character"""
+        from ..models import CombatParticipant
+
+        hit_points = character.current_hit_points or self.DEFAULT_PLAYER_HP
+        self.participants.append(CombatParticipant(
+            combat_session=self.combat_session,
+            participant_type='player',
+            character=character,
+            name=character.character_name,
+            current_hp=hit_points,
+            max_hp=hit_points,
+        ))
+        return self
+
+    def build(self):
+        """
+        Insert every queued participant in one transaction. The combat log's
+        baseline snapshot is taken later, before the first event.
+        """
+        from ..models import CombatParticipant
+
+        with transaction.atomic():
+            created = CombatParticipant.objects.bulk_create(self.participants)
+            if self.combat_session.initiative_ring is not None:
+                self.combat_session.reset_initiative_ring()
+                self.combat_session.save(update_fields=['initiative_ring', 'updated_at'])
+        return created
+
+
+# Combat event log
+#
+# The event log is an append-only history of a combat session. The current
+# state of a fight is a fold over its events, starting from the latest
+# snapshot, so undo and full replays never need to touch the participant rows.
+
+SNAPSHOT_INTERVAL = 100
+
+
+def damage_hit_points(current_hp, temp_hp, damage):
+    """Apply damage to temporary HP first, returning the new (current_hp, temp_hp)"""
+    if temp_hp > 0:
+        if damage <= temp_hp:
+            return current_hp, temp_hp - damage
+        damage -= temp_hp
+        temp_hp = 0
+    return max(0, current_hp - damage), temp_hp
+
+
+def heal_hit_points(current_hp, max_hp, healing):
+    """Return current HP after healing, capped at max HP"""
+    return min(max_hp, current_hp + healing)
+
+
+def empty_combat_state(round_number=1, turn=0):
+    return {'round': round_number, 'turn': turn, 'participants': {}, 'effects': {}}
+
+
+def apply_combat_event(state, event_type, participant_id, payload):
+    """
+    Fold a single event into a combat state dict.
+    
+    The state is mutated in place and returned. Events for participants the
+    state doesn't know about (e.g. from before the first snapshot) are ignored.
+    """
+    participant = state['participants'].get(str(participant_id)) if participant_id else None
+
+    if event_type == 'damage' and participant:
+        participant['hp'], participant['temp_hp'] = damage_hit_points(
+            participant['hp'], participant['temp_hp'], payload['amount']
+        )
+        if participant['hp'] <= 0:
+            participant['active'] = False
+    elif event_type == 'heal' and participant:
+        participant['hp'] = heal_hit_points(participant['hp'], participant['max_hp'], payload['amount'])
+        if participant['hp'] > 0:
+            participant['active'] = True
+    elif event_type == 'temp_hp' and participant:
+        participant['temp_hp'] = max(participant['temp_hp'], payload['amount'])
+    elif event_type == 'turn_advance':
+        if payload['round'] > state['round']:
+            for effect in state['effects'].values():
+                if effect['rounds_remaining'] is not None:
+                    effect['rounds_remaining'] -= 1
+        state['round'] = payload['round']
+        state['turn'] = payload['turn']
+    elif event_type == 'effect_add':
+        state['effects'][str(payload['effect_id'])] = dict(payload['effect'], participant=participant_id)
+    elif event_type == 'effect_expire':
+        state['effects'].pop(str(payload['effect_id']), None)
+
+    return state
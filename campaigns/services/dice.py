@@ -0,0 +1,210 @@
+"""
+Dice expression engine.
+
+Parses notation such as ``2d8+2``, ``4d6kh3``, ``4d6dl1``, ``d20 adv`` or
+``1d8+1d6-1`` into a compiled ``DicePlan``. Plans are cached in an LRU, so
+the hit dice of a stat block are parsed once no matter how many goblins are
+spawned from it. A plan can roll itself thousands of times in one NumPy
+call and can compute its exact probability distribution.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+MAX_DICE = 100
+MAX_SIDES = 1000
+# Rough cap on the steps spent building an exact distribution
+MAX_DISTRIBUTION_WORK = 2000000
+
+TOKEN_RE = re.compile(r'\s*([+-]?)\s*([^+-]+)')
+DICE_RE = re.compile(
+    r'^(?P<count>\d*)d(?P<sides>\d+|%)'
+    r'(?:(?P<keep>kh|kl|k|dh|dl)(?P<keep_count>\d+))?'
+    r'\s*(?P<mode>adv|advantage|dis|disadvantage)?$'
+)
+
+
+class DiceExpressionError(ValueError):
+    pass
+
+
+class DiceTerm:
+    """``count`` dice with ``sides`` faces, optionally keeping the highest/lowest ``keep``"""
+
+    __slots__ = ('sign', 'count', 'sides', 'keep', 'keep_highest')
+
+    def __init__(self, sign, count, sides, keep=None, keep_highest=True):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        self.keep = count if keep is None else keep
+        self.keep_highest = keep_highest
+
+    def roll(self, rng, times):
+        dice = rng.integers(1, self.sides + 1, (times, self.count))
+        if self.keep < self.count:
+            dice.sort(axis=1)
+            dice = dice[:, -self.keep:] if self.keep_highest else dice[:, :self.keep]
+        return self.sign * dice.sum(axis=1)
+
+    def distribution(self):
+        """Exact ``{total: probability}`` for this term"""
+        if self.keep == self.count:
+            if self.count * self.sides ** 2 > MAX_DISTRIBUTION_WORK:
+                raise DiceExpressionError("Too many dice to compute an exact distribution")
+            totals = {0: 1}
+            face = {value: 1 for value in range(1, self.sides + 1)}
+            for _ in range(self.count):
+                totals = _convolve_counts(totals, face)
+        else:
+            # Enumerate each multiset of faces once, weighted by its orderings
+            if math.comb(self.sides + self.count - 1, self.count) > MAX_DISTRIBUTION_WORK:
+                raise DiceExpressionError("Too many dice to compute an exact distribution")
+            totals = defaultdict(int)
+            for faces in combinations_with_replacement(range(1, self.sides + 1), self.count):
+                kept = faces[-self.keep:] if self.keep_highest else faces[:self.keep]
+                totals[sum(kept)] += _arrangements(faces)
+        outcomes = self.sides ** self.count
+        return {self.sign * total: ways / outcomes for total, ways in totals.items()}
+
+
+class DicePlan:
+    """A compiled dice expression: dice terms plus a flat modifier"""
+
+    def __init__(self, expression, terms, modifier):
+        self.expression = expression
+        self.terms = tuple(terms)
+        self.modifier = modifier
+
+    def __repr__(self):
+        return f"<DicePlan {self.expression}>"
+
+    @property
+    def minimum(self):
+        return self.modifier + sum(
+            term.sign * (term.keep if term.sign > 0 else term.keep * term.sides) for term in self.terms
+        )
+
+    @property
+    def maximum(self):
+        return self.modifier + sum(
+            term.sign * (term.keep * term.sides if term.sign > 0 else term.keep) for term in self.terms
+        )
+
+    def roll(self, times=1, rng=None):
+        """Roll the expression ``times`` times, returning a NumPy array of totals"""
+        rng = rng or np.random.default_rng()
+        totals = np.full(times, self.modifier)
+        for term in self.terms:
+            totals += term.roll(rng, times)
+        return totals
+
+    def roll_one(self, rng=None):
+        return int(self.roll(1, rng)[0])
+
+    def distribution(self):
+        """Exact probability of every total, as ``{total: probability}``"""
+        totals = {self.modifier: 1.0}
+        for term in self.terms:
+            totals = _convolve_counts(totals, term.distribution())
+        return dict(sorted(totals.items()))
+
+    def expected_value(self):
+        return sum(total * probability for total, probability in self.distribution().items())
+
+
+def _convolve_counts(left, right):
+    combined = defaultdict(int)
+    for a, a_weight in left.items():
+        for b, b_weight in right.items():
+            combined[a + b] += a_weight * b_weight
+    return combined
+
+
+def _arrangements(faces):
+    """Number of orderings of a sorted tuple of faces"""
+    ways = math.factorial(len(faces))
+    for repeats in Counter(faces).values():
+        ways //= math.factorial(repeats)
+    return ways
+
+
+def _parse_dice(sign, match):
+    count = int(match.group('count') or 1)
+    sides = 100 if match.group('sides') == '%' else int(match.group('sides'))
+    if not 1 <= count <= MAX_DICE or not 1 <= sides <= MAX_SIDES:
+        raise DiceExpressionError(f"Dice out of range: {match.group(0)}")
+
+    keep, keep_highest = None, True
+    rule = match.group('keep')
+    if rule:
+        amount = int(match.group('keep_count'))
+        if rule in ('kh', 'k', 'kl'):
+            keep, keep_highest = amount, rule != 'kl'
+        else:
+            keep, keep_highest = count - amount, rule == 'dl'
+        if not 0 < keep <= count:
+            raise DiceExpressionError(f"Cannot keep {keep} of {count} dice")
+
+    mode = match.group('mode')
+    if mode:
+        if count != 1 or rule:
+            raise DiceExpressionError("Advantage and disadvantage apply to a single die")
+        count, keep, keep_highest = 2, 1, mode.startswith('adv')
+
+    return DiceTerm(sign, count, sides, keep, keep_highest)
+
+
+@lru_cache(maxsize=512)
+def compile_dice(expression):
+    """Parse a dice expression into a cached ``DicePlan``"""
+    text = (expression or '').strip().lower()
+    if not text:
+        raise DiceExpressionError("Empty dice expression")
+
+    terms, modifier, position = [], 0, 0
+    for match in TOKEN_RE.finditer(text):
+        if match.start() != position or (not match.group(1) and position):
+            raise DiceExpressionError(f"Invalid dice expression: {expression!r}")
+        position = match.end()
+        sign = -1 if match.group(1) == '-' else 1
+        token = match.group(2).strip()
+        if token.isdigit():
+            modifier += sign * int(token)
+            continue
+        dice = DICE_RE.match(token)
+        if not dice:
+            raise DiceExpressionError(f"Invalid dice term {token!r} in {expression!r}")
+        terms.append(_parse_dice(sign, dice))
+    if position != len(text):
+        raise DiceExpressionError(f"Invalid dice expression: {expression!r}")
+
+    return DicePlan(expression, terms, modifier)
+
+
+def roll(expression, rng=None):
+    """Roll a single dice expression"""
+    return compile_dice(expression).roll_one(rng)
+
+
+def roll_many(expressions, rng=None):
+    """
+    Roll a list of expressions, returning totals in the same order.
+
+    Identical expressions are grouped so each distinct plan is rolled once
+    for all of its occurrences.
+    """
+    rng = rng or np.random.default_rng()
+    positions = defaultdict(list)
+    for index, expression in enumerate(expressions):
+        positions[expression].append(index)
+
+    totals = [0] * len(expressions)
+    for expression, indexes in positions.items():
+        for index, total in zip(indexes, compile_dice(expression).roll(len(indexes), rng)):
+            totals[index] = int(total)
+    return totals
@@ -0,0 +1,238 @@
+"""
+Encounter difficulty engine.
+
+Scores encounters against the campaign's party using the 5e XP budget
+rules. CR→XP and level→threshold tables are precomputed at import time, so
+scoring is a couple of dictionary lookups per enemy and per character.
+
+The roster-dependent part of the score (monster count and raw XP) is cached
+on ``Encounter.difficulty_cache`` and cleared by signals whenever an
+encounter's enemies change. The party-dependent part is cheap and always
+computed fresh, so levelling up a character never leaves stale ratings.
+"""
+from fractions import Fraction
+from functools import lru_cache
+
+# Challenge rating -> XP awarded
+CR_XP = {
+    Fraction(0): 10,
+    Fraction(1, 8): 25,
+    Fraction(1, 4): 50,
+    Fraction(1, 2): 100,
+    Fraction(1): 200,
+    Fraction(2): 450,
+    Fraction(3): 700,
+    Fraction(4): 1100,
+    Fraction(5): 1800,
+    Fraction(6): 2300,
+    Fraction(7): 2900,
+    Fraction(8): 3900,
+    Fraction(9): 5000,
+    Fraction(10): 5900,
+    Fraction(11): 7200,
+    Fraction(12): 8400,
+    Fraction(13): 10000,
+    Fraction(14): 11500,
+    Fraction(15): 13000,
+    Fraction(16): 15000,
+    Fraction(17): 18000,
+    Fraction(18): 20000,
+    Fraction(19): 22000,
+    Fraction(20): 25000,
+    Fraction(21): 33000,
+    Fraction(22): 41000,
+    Fraction(23): 50000,
+    Fraction(24): 62000,
+    Fraction(25): 75000,
+    Fraction(26): 90000,
+    Fraction(27): 105000,
+    Fraction(28): 120000,
+    Fraction(29): 135000,
+    Fraction(30): 155000,
+}
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'deadly')
+
+# Character level -> (easy, medium, hard, deadly) XP thresholds
+LEVEL_THRESHOLDS = {
+    1: (25, 50, 75, 100),
+    2: (50, 100, 150, 200),
+    3: (75, 150, 225, 400),
+    4: (125, 250, 375, 500),
+    5: (250, 500, 750, 1100),
+    6: (300, 600, 900, 1400),
+    7: (350, 750, 1100, 1700),
+    8: (450, 900, 1400, 2100),
+    9: (550, 1100, 1600, 2400),
+    10: (600, 1200, 1900, 2800),
+    11: (800, 1600, 2400, 3600),
+    12: (1000, 2000, 3000, 4500),
+    13: (1100, 2200, 3400, 5100),
+    14: (1250, 2500, 3800, 5700),
+    15: (1400, 2800, 4300, 6400),
+    16: (1600, 3200, 4800, 7200),
+    17: (2000, 3900, 5900, 8800),
+    18: (2100, 4200, 6300, 9500),
+    19: (2400, 4900, 7300, 10900),
+    20: (2800, 5700, 8500, 12700),
+}
+
+# Encounter multipliers, indexed by monster count band. Small parties step
+# one place up the ladder and large parties one place down.
+MULTIPLIERS = (0.5, 1, 1.5, 2, 2.5, 3, 4, 5)
+MONSTER_COUNT_BANDS = ((1, 1), (2, 2), (6, 3), (10, 4), (14, 5))
+LARGEST_BAND = 6
+SMALL_PARTY = 3
+LARGE_PARTY = 6
+
+# Computed rating -> Encounter.danger_level choice
+DANGER_LEVELS = {
+    'trivial': 'low',
+    'easy': 'low',
+    'medium': 'moderate',
+    'hard': 'high',
+    'deadly': 'deadly',
+}
+
+
+@lru_cache(maxsize=256)
+def challenge_rating_xp(challenge_rating):
+    """Return the XP value for a CR string like ``"1/4"``, ``"0.5"`` or ``"5"``"""
+    value = str(challenge_rating or '').strip().lower()
+    if value.startswith('cr'):
+        value = value[2:].strip()
+    try:
+        return CR_XP.get(Fraction(value), 0)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+
+def party_thresholds(levels):
+    """Sum the per-character XP thresholds for a list of character levels"""
+    totals = [0, 0, 0, 0]
+    for level in levels:
+        row = LEVEL_THRESHOLDS[min(max(int(level), 1), 20)]
+        for index, threshold in enumerate(row):
+            totals[index] += threshold
+    return dict(zip(DIFFICULTIES, totals))
+
+
+def encounter_multiplier(monster_count, party_size):
+    """XP multiplier for ``monster_count`` enemies facing ``party_size`` characters"""
+    if monster_count <= 0:
+        return 1
+    index = LARGEST_BAND
+    for ceiling, band in MONSTER_COUNT_BANDS:
+        if monster_count <= ceiling:
+            index = band
+            break
+    if party_size < SMALL_PARTY:
+        index += 1
+    elif party_size >= LARGE_PARTY:
+        index -= 1
+    return MULTIPLIERS[index]
+
+
+def roster_budget(challenge_ratings):
+    """Roster-only part of the score, as stored in ``Encounter.difficulty_cache``"""
+    return {
+        'monster_count': len(challenge_ratings),
+        'base_xp': sum(challenge_rating_xp(cr) for cr in challenge_ratings),
+    }
+
+
+def score_budget(budget, levels):
+    """Combine a cached roster budget with the party's levels into a rating"""
+    monster_count = budget['monster_count']
+    if not monster_count:
+        return None
+
+    party_size = len(levels)
+    thresholds = party_thresholds(levels)
+    multiplier = encounter_multiplier(monster_count, party_size)
+    adjusted_xp = int(budget['base_xp'] * multiplier)
+
+    rating = None
+    if party_size:
+        rating = 'trivial'
+        for difficulty in DIFFICULTIES:
+            if adjusted_xp >= thresholds[difficulty]:
+                rating = difficulty
+
+    return {
+        'rating': rating,
+        'danger_level': DANGER_LEVELS.get(rating, ''),
+        'monster_count': monster_count,
+        'party_size': party_size,
+        'base_xp': budget['base_xp'],
+        'multiplier': multiplier,
+        'adjusted_xp': adjusted_xp,
+        'thresholds': thresholds,
+    }
+
+
+def score_encounter(challenge_ratings, levels):
+    """Score a list of enemy CRs against a list of character levels"""
+    return score_budget(roster_budget(challenge_ratings), levels)
+
+
+def party_levels(campaign_id):
+    """Levels of the living characters in a campaign"""
+    from ..models import CharacterSummary
+
+    return list(
+        CharacterSummary.objects.filter(campaign_id=campaign_id, alive=True)
+        .values_list('level', flat=True)
+    )
+
+
+def encounter_difficulty(encounter, levels=None):
+    """Score a single encounter, using its cached roster budget when present"""
+    if levels is None:
+        levels = party_levels(encounter.chapter.campaign_id)
+    return campaign_encounter_difficulties(
+        encounter.chapter.campaign_id, encounters=[encounter], levels=levels
+    )[encounter.pk]
+
+
+def campaign_encounter_difficulties(campaign_id, encounters=None, levels=None):
+    """
+    Score every encounter in a campaign in one pass.
+
+    Returns ``{encounter_id: result}``. Party levels are loaded once, cached
+    roster budgets are reused, and all stale encounters are rebuilt from a
+    single query over the enemy roster table and saved with one bulk update.
+    """
+    from ..models import Encounter, Enemy
+
+    if encounters is None:
+        encounters = Encounter.objects.filter(chapter__campaign_id=campaign_id)
+    encounters = list(encounters)
+    if levels is None:
+        levels = party_levels(campaign_id)
+
+    stale = [encounter for encounter in encounters if encounter.difficulty_cache is None]
+    if stale:
+        ratings = {encounter.pk: [] for encounter in stale}
+        rows = Enemy.encounters.through.objects.filter(
+            encounter_id__in=ratings
+        ).values_list('encounter_id', 'enemy__challenge_rating')
+        for encounter_id, challenge_rating in rows:
+            ratings[encounter_id].append(challenge_rating)
+        for encounter in stale:
+            encounter.difficulty_cache = roster_budget(ratings[encounter.pk])
+        Encounter.objects.bulk_update(stale, ['difficulty_cache'])
+
+    return {
+        encounter.pk: score_budget(encounter.difficulty_cache, levels)
+        for encounter in encounters
+    }
+
+
+def invalidate_encounter_difficulty(encounter_ids):
+    """Drop cached roster budgets so the next read rebuilds them"""
+    from ..models import Encounter
+
+    encounter_ids = list(encounter_ids)
+    if encounter_ids:
+        Encounter.objects.filter(pk__in=encounter_ids).update(difficulty_cache=None)
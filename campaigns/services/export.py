@@ -0,0 +1,424 @@
+"""
+Campaign and encounter Markdown exports.
+
+``campaign_markdown(campaign)`` yields the campaign document in chunks for a
+``StreamingHttpResponse``; ``encounter_markdown(encounter)`` returns the
+export of a single encounter.
+
+Rendered parts are kept in ``ExportSection``: the campaign header
+(description, locations, NPCs), each chapter heading, each encounter with
+its notes, and each single-encounter export. A section is stored with the
+content version it was rendered from. Campaigns, chapters and encounters
+carry an ``export_version`` that is replaced whenever something in their
+section changes (see the signals in ``models/exports.py``), so a stored
+section is used only while its version still matches. A repeat export of
+an unchanged campaign just reassembles stored text; after an edit, only the
+stale sections are rendered again. Versions are never reused, so a save
+from an out-of-date model instance can't revive an old section.
+
+The campaign export runs a fixed number of queries however large the
+campaign is: chapters, encounters and the notes of stale encounters are
+each read once, already in document order, and streamed with
+``iterator()``. They are merged as the rows arrive, so memory use doesn't
+grow with the campaign.
+"""
+import time
+from itertools import groupby
+from operator import attrgetter
+
+from django.db.models import CharField, OuterRef, Subquery
+from django.db.models.functions import Cast
+
+# Rows fetched per round trip while streaming
+ROWS_PER_FETCH = 200
+# Characters collected before a chunk is sent
+CHUNK_SIZE = 8192
+# Rendered sections saved per query
+SECTIONS_PER_STORE = 200
+
+
+def new_version():
+    """A content version that is never handed out twice"""
+    return time.time_ns()
+
+
+def invalidate_campaign(campaign_id):
+    """Mark the campaign header, and with it every encounter export, stale"""
+    from ..models import Campaign
+
+    Campaign.objects.filter(pk=campaign_id).update(export_version=new_version())
+
+
+def invalidate_encounters(encounter_ids):
+    """Mark encounters stale after changes that don't save the encounter itself"""
+    from ..models import Encounter
+
+    encounter_ids = list(encounter_ids)
+    if encounter_ids:
+        Encounter.objects.filter(pk__in=encounter_ids).update(export_version=new_version())
+
+
+def _stored(kind, object_id, version):
+    from ..models import ExportSection
+
+    return (
+        ExportSection.objects.filter(kind=kind, object_id=object_id, version=str(version))
+        .values_list("markdown", flat=True)
+        .first()
+    )
+
+
+def _fresh(kind):
+    """Annotation with the stored section of each row, if it is current"""
+    from ..models import ExportSection
+
+    return Subquery(
+        ExportSection.objects.filter(
+            kind=kind, object_id=OuterRef("pk"), version=Cast(OuterRef("export_version"), CharField())
+        ).values("markdown")[:1]
+    )
+
+
+def _store(sections):
+    """Save rendered ``ExportSection``s, replacing older renders of the same parts"""
+    from ..models import ExportSection
+
+    if sections:
+        ExportSection.objects.bulk_create(
+            sections,
+            update_conflicts=True,
+            unique_fields=["kind", "object_id"],
+            update_fields=["version", "markdown"],
+        )
+
+
+def _children(parents, children, key):
+    """
+    Pair each parent with its children, given both streams sorted in the
+    same order; parents without children get an empty tuple
+    """
+    groups = groupby(children, key=key)
+    group_key, group = next(groups, (None, ()))
+    for parent in parents:
+        if group_key == parent.pk:
+            yield parent, group
+            group_key, group = next(groups, (None, ()))
+        else:
+            yield parent, ()
+
+
+def _location_lines(loc):
+    return [
+        f"### **{loc.name}**",
+        f"- **Region:** {loc.region or '_Unknown_'}",
+        f"- **Tags:** {loc.tags or '_None_'}",
+        "",
+        f"{loc.description.strip() if loc.description else '_No description_'}",
+        "",
+    ]
+
+
+def _npc_lines(npc):
+    return [
+        f"### **{npc.name}**",
+        f"- **Role:** {npc.role or '_Unknown_'}",
+        f"- **Status:** {npc.status.capitalize()}",
+        f"- **Location:** {npc.location.name if npc.location else '_Unknown_'}",
+        f"- **Tags:** {npc.tags or '_None_'}",
+        "",
+        f"{npc.appearance.strip() if npc.appearance else '_No description_'}",
+        "",
+    ]
+
+
+def _chapter_lines(chapter):
+    return [
+        f"### Chapter {chapter.order}: {chapter.title}",
+        f"**Status:** {chapter.status.replace('_', ' ').capitalize()}",
+        "",
+        chapter.summary or "_No summary yet_",
+        "",
+    ]
+
+
+def _encounter_lines(encounter):
+    return [
+        f"#### {encounter.order}. {encounter.title} ({encounter.type})",
+        f"**Summary:** {encounter.summary}",
+        "",
+    ]
+
+
+def _note_lines(note):
+    return [
+        "<details>",
+        f"<summary><strong>Session on {note.date}</strong></summary>",
+        "",
+        "#### Raw Notes:",
+        note.content.strip(),
+        "",
+        "#### Summary:",
+        note.summary.strip() if note.summary else "_No summary available_",
+        "",
+        "</details>",
+        "",
+    ]
+
+
+def _header_lines(campaign):
+    lines = [
+        f"# {campaign.title}",
+        "",
+        campaign.description or "",
+        "",
+        "---",
+        "",
+        "## 📍 Locations",
+    ]
+    for loc in campaign.locations.all().iterator(ROWS_PER_FETCH):
+        lines += _location_lines(loc)
+
+    lines += ["", "## 👤 NPCs"]
+    for npc in campaign.npcs.select_related("location").iterator(ROWS_PER_FETCH):
+        lines += _npc_lines(npc)
+
+    lines += ["", "---", "", "## 📖 Chapters"]
+    return lines
+
+
+def _encounter_document_lines(encounter):
+    chapter = encounter.chapter
+    campaign = chapter.campaign
+
+    lines = [
+        f"# Chapter {chapter.order}: {chapter.title}",
+        "",
+        f"**Campaign:** {campaign.title}",
+        f"**Status:** {chapter.status.replace('_', ' ').capitalize()}",
+        f"**Level Range:** {chapter.level_range or '_Not specified_'}",
+        "",
+        "## Chapter Summary",
+        "",
+        chapter.summary.strip() if chapter.summary else "_No summary available_",
+        "",
+    ]
+
+    # Add chapter intro if present
+    if chapter.intro:
+        lines += [
+            "## Chapter Introduction",
+            "",
+            chapter.intro.strip(),
+            "",
+        ]
+
+    # Add chapter DM notes if present
+    if chapter.dm_notes:
+        lines += [
+            "## Chapter DM Notes",
+            "",
+            chapter.dm_notes.strip(),
+            "",
+        ]
+
+    lines += [
+        "---",
+        "",
+        f"## Encounter: {encounter.title}",
+        "",
+        f"**Type:** {encounter.get_type_display()}",
+        f"**Danger Level:** {encounter.get_danger_level_display() if encounter.danger_level else '_Not specified_'}",
+    ]
+
+    # Add location if set
+    if encounter.location:
+        lines += [f"**Location:** {encounter.location.name}"]
+
+    # Add NPCs if any
+    npcs = encounter.npcs.all()
+    if npcs:
+        npc_names = ", ".join([npc.name for npc in npcs])
+        lines += [f"**NPCs:** {npc_names}"]
+
+    # Add tags if present
+    if encounter.tags:
+        lines += [f"**Tags:** {encounter.tags}"]
+
+    lines += ["", ""]
+
+    # Add encounter summary
+    lines += [
+        "### Summary",
+        "",
+        encounter.summary.strip() if encounter.summary else "_No summary available_",
+        "",
+    ]
+
+    # Add setup details
+    if encounter.setup:
+        lines += [
+            "### Setup",
+            "",
+            encounter.setup.strip(),
+            "",
+        ]
+
+    # Add read-aloud text
+    if encounter.read_aloud:
+        lines += [
+            "### Read-Aloud Text",
+            "",
+            "> " + encounter.read_aloud.strip().replace("\n", "\n> "),
+            "",
+        ]
+
+    # Add DM notes
+    if encounter.dm_notes:
+        lines += [
+            "### DM Notes",
+            "",
+            encounter.dm_notes.strip(),
+            "",
+        ]
+
+    # Add map reference if present
+    if encounter.map_reference:
+        lines += [
+            f"**Map Reference:** {encounter.map_reference}",
+            "",
+        ]
+
+    # Add session notes
+    session_notes = encounter.session_notes.order_by("date")
+    if session_notes:
+        lines += [
+            "---",
+            "",
+            "## Session Notes",
+            "",
+        ]
+
+        for note in session_notes:
+            lines += [
+                f"### Session on {note.date.strftime('%B %d, %Y')}",
+                "",
+                "#### Session Content",
+                "",
+                note.content.strip(),
+                "",
+            ]
+
+            # Add AI summary if available
+            if note.summary:
+                lines += [
+                    "#### AI Summary",
+                    "",
+                    note.summary.strip(),
+                    "",
+                ]
+
+            lines += ["---", ""]
+    else:
+        lines += [
+            "---",
+            "",
+            "## Session Notes",
+            "",
+            "_No session notes recorded for this encounter yet._",
+            "",
+        ]
+
+    # Add chapter conclusion if present
+    if chapter.conclusion:
+        lines += [
+            "---",
+            "",
+            "## Chapter Conclusion",
+            "",
+            chapter.conclusion.strip(),
+            "",
+        ]
+    return lines
+
+
+def encounter_markdown(encounter):
+    """
+    Markdown export of one encounter with its chapter context and session
+    notes. ``encounter`` should come with its chapter and campaign selected.
+    """
+    from ..models import ExportSection
+
+    chapter, campaign = encounter.chapter, encounter.chapter.campaign
+    version = f"{campaign.export_version}.{chapter.export_version}.{encounter.export_version}"
+    markdown = _stored("encounter_document", encounter.pk, version)
+    if markdown is None:
+        markdown = "\n".join(_encounter_document_lines(encounter))
+        _store([ExportSection(
+            campaign=campaign, kind="encounter_document", object_id=encounter.pk, version=version, markdown=markdown
+        )])
+    return markdown
+
+
+def campaign_sections(campaign):
+    """
+    Yield the export's sections in order; joined by newlines they make the
+    document. Stale sections are rendered and stored on the way.
+    """
+    from ..models import Encounter, ExportSection, SessionNote
+
+    rendered = []
+
+    def render(kind, row, lines):
+        rendered.append(ExportSection(
+            campaign=campaign, kind=kind, object_id=row.pk, version=str(row.export_version), markdown="\n".join(lines)
+        ))
+        if len(rendered) >= SECTIONS_PER_STORE:
+            _store(rendered)
+            rendered.clear()
+        return "\n".join(lines)
+
+    header = _stored("campaign", campaign.pk, campaign.export_version)
+    yield header if header is not None else render("campaign", campaign, _header_lines(campaign))
+
+    # The three streams share one order: chapter, then encounter, then note
+    encounters = Encounter.objects.filter(chapter__campaign=campaign).annotate(cached=_fresh("encounter"))
+    stale = encounters.filter(cached__isnull=True).values("pk")
+    stale_ids = {row["pk"] for row in stale}
+    chapters = campaign.chapters.annotate(cached=_fresh("chapter")).order_by("order", "pk").iterator(ROWS_PER_FETCH)
+    encounters = encounters.order_by("chapter__order", "chapter_id", "order", "pk").iterator(ROWS_PER_FETCH)
+    notes = (
+        SessionNote.objects.filter(encounter__in=stale)
+        .order_by("encounter__chapter__order", "encounter__chapter_id", "encounter__order", "encounter_id", "date", "pk")
+        .iterator(ROWS_PER_FETCH)
+    ) if stale_ids else iter(())
+
+    notes_by_encounter = _children(encounters, notes, attrgetter("encounter_id"))
+    for chapter, chapter_encounters in _children(chapters, notes_by_encounter, lambda pair: pair[0].chapter_id):
+        yield chapter.cached if chapter.cached is not None else render("chapter", chapter, _chapter_lines(chapter))
+        for encounter, encounter_notes in chapter_encounters:
+            if encounter.cached is not None:
+                yield encounter.cached
+                continue
+            if encounter.pk not in stale_ids:
+                # Went stale after the stale encounters were listed, so its notes weren't read
+                encounter_notes = encounter.session_notes.order_by("date", "pk")
+            lines = _encounter_lines(encounter)
+            for note in encounter_notes:
+                lines += _note_lines(note)
+            yield render("encounter", encounter, lines)
+
+    _store(rendered)
+
+
+def campaign_markdown(campaign, chunk_size=CHUNK_SIZE):
+    """Yield the Markdown export in chunks of about ``chunk_size`` characters"""
+    buffer, size = [], 0
+    for number, section in enumerate(campaign_sections(campaign)):
+        piece = section if number == 0 else "\n" + section
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,173 @@
+"""
+Materialized availability heatmap.
+
+Every ``SessionSchedule`` keeps ``availability_heatmap``: its respondents in
+submission order and, for every picked slot, the responses that picked it::
+
+    {"respondents": [[pk, player_name], ...],
+     "slots": {date_str: {slot_label: [pk, ...]}}}
+
+Slot changes, new respondents, renames and deletions patch it in the same
+transaction as the change, so the organizer page reads one row instead of
+re-aggregating every response. ``None`` means it hasn't been built yet; the
+next read rebuilds it from the slot rows.
+
+Writers lock the schedule row with a no-op UPDATE before reading the
+heatmap, which serializes them on SQLite and PostgreSQL alike.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from .availability import AvailabilityIndex
+
+Respondent = namedtuple("Respondent", ["pk", "player_name"])
+
+
+def build_heatmap(schedule_id):
+    """Aggregate the heatmap from the responses and their slot rows"""
+    from ..models import AvailabilitySlot, PlayerAvailability
+
+    respondents = list(
+        PlayerAvailability.objects.filter(session_schedule_id=schedule_id)
+        .order_by("submitted_at", "pk")
+        .values_list("pk", "player_name")
+    )
+    slots = {}
+    picks = (
+        AvailabilitySlot.objects.filter(availability__session_schedule_id=schedule_id)
+        .order_by("date", "time_slot", "availability_id")
+        .values_list("date", "time_slot", "availability_id")
+    )
+    for day, label, pk in picks:
+        slots.setdefault(day.isoformat(), {}).setdefault(label, []).append(pk)
+    return {"respondents": [list(respondent) for respondent in respondents], "slots": slots}
+
+
+def _lock(schedule_id):
+    from ..models import SessionSchedule
+
+    SessionSchedule.objects.filter(pk=schedule_id).update(
+        availability_heatmap=F("availability_heatmap")
+    )
+
+
+def get_heatmap(schedule):
+    """The schedule's heatmap, building and storing it if it is missing"""
+    from ..models import SessionSchedule
+
+    if schedule.availability_heatmap is None:
+        with transaction.atomic():
+            _lock(schedule.pk)
+            stored = (
+                SessionSchedule.objects.filter(pk=schedule.pk)
+                .values_list("availability_heatmap", flat=True)
+                .first()
+            )
+            if stored is None:
+                stored = build_heatmap(schedule.pk)
+                SessionSchedule.objects.filter(pk=schedule.pk).update(availability_heatmap=stored)
+        schedule.availability_heatmap = stored
+    return schedule.availability_heatmap
+
+
+def _patch(schedule_id, change):
+    """Apply ``change(heatmap)`` to a built heatmap under the schedule lock"""
+    from ..models import SessionSchedule
+
+    with transaction.atomic():
+        _lock(schedule_id)
+        heatmap = (
+            SessionSchedule.objects.filter(pk=schedule_id)
+            .values_list("availability_heatmap", flat=True)
+            .first()
+        )
+        if heatmap is None:
+            return
+        change(heatmap)
+        SessionSchedule.objects.filter(pk=schedule_id).update(availability_heatmap=heatmap)
+
+
+def record_slot_changes(schedule_id, availability_pk, added, removed):
+    """Add and remove one response's picks, given ``(date_str, label)`` pairs"""
+    if not added and not removed:
+        return
+
+    def change(heatmap):
+        slots = heatmap["slots"]
+        for date_str, label in added:
+            pks = slots.setdefault(date_str, {}).setdefault(label, [])
+            if availability_pk not in pks:
+                pks.append(availability_pk)
+                pks.sort()
+        for date_str, label in removed:
+            pks = slots.get(date_str, {}).get(label)
+            if pks and availability_pk in pks:
+                pks.remove(availability_pk)
+                if not pks:
+                    del slots[date_str][label]
+                    if not slots[date_str]:
+                        del slots[date_str]
+
+    _patch(schedule_id, change)
+
+
+def record_respondent(availability):
+    """Add a response to the respondents, or update its name"""
+
+    def change(heatmap):
+        for respondent in heatmap["respondents"]:
+            if respondent[0] == availability.pk:
+                respondent[1] = availability.player_name
+                return
+        heatmap["respondents"].append([availability.pk, availability.player_name])
+
+    _patch(availability.session_schedule_id, change)
+
+
+def remove_respondent(availability):
+    """Drop a response and all of its picks"""
+    pk = availability.pk
+
+    def change(heatmap):
+        heatmap["respondents"] = [r for r in heatmap["respondents"] if r[0] != pk]
+        for date_str in list(heatmap["slots"]):
+            labels = heatmap["slots"][date_str]
+            for label in list(labels):
+                if pk in labels[label]:
+                    labels[label].remove(pk)
+                    if not labels[label]:
+                        del labels[label]
+            if not labels:
+                del heatmap["slots"][date_str]
+
+    _patch(availability.session_schedule_id, change)
+
+
+def heatmap_respondents(heatmap):
+    return [Respondent(pk, name) for pk, name in heatmap["respondents"]]
+
+
+def heatmap_index(slot_index, heatmap):
+    """An ``AvailabilityIndex`` over the heatmap's respondents, without reading responses"""
+    respondents = heatmap_respondents(heatmap)
+    numbers = {respondent.pk: player for player, respondent in enumerate(respondents)}
+    players, bits = [], []
+    for date_str, labels in heatmap["slots"].items():
+        date_bits = slot_index.bits_by_date.get(date_str)
+        if not date_bits:
+            continue
+        for label, pks in labels.items():
+            bit = date_bits.get(label)
+            if bit is not None:
+                players.extend(map(numbers.get, pks))
+                bits.extend([bit] * len(pks))
+    selected = np.zeros((len(respondents), len(slot_index)), dtype=bool)
+    if None in players:
+        # A pick by a response that isn't a respondent any more
+        bits = [bit for player, bit in zip(players, bits) if player is not None]
+        players = [player for player in players if player is not None]
+    selected[players, bits] = True
+    return AvailabilityIndex(slot_index, respondents, selected=selected)
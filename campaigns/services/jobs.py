@@ -0,0 +1,229 @@
+"""
+Database-backed queue for language-model jobs and adventure PDF imports.
+
+Views call ``enqueue`` and return straight away; the ``process_llm_jobs``
+worker runs queued jobs in a small thread pool. The queue is an ordinary
+table, so it works on SQLite/LiteFS without a broker:
+
+- a job is claimed with a compare-and-set UPDATE on its status, so two
+  workers never run the same job;
+- at most ``LLM_JOB_CONCURRENCY`` jobs are running at once, counted in the
+  table so the limit holds across worker processes;
+- a failed attempt is retried after ``LLM_JOB_RETRY_DELAY`` seconds,
+  doubling each time, until the job's ``max_attempts`` is used up;
+- a running job's lease is renewed while its handler runs, and a job whose
+  worker stopped is re-queued once its lease expires. Only the claim that
+  is still current records an outcome, so a run that lost its lease can't
+  overwrite the run that replaced it.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+class JobError(Exception):
+    """A failure that retrying cannot fix, such as a deleted target"""
+
+
+def handler(kind):
+    """Register the function that runs jobs of ``kind``"""
+
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def enqueue(kind, owner, target="", **payload):
+    """Queue a job, or return the one already queued or running for the same target"""
+    from ..models import LLMJob
+
+    with transaction.atomic():
+        if target:
+            active = LLMJob.objects.filter(
+                kind=kind, target=target, status__in=LLMJob.ACTIVE_STATUSES
+            ).first()
+            if active:
+                return active
+        return LLMJob.objects.create(
+            kind=kind,
+            owner=owner,
+            target=target,
+            payload=payload,
+            max_attempts=settings.LLM_JOB_MAX_ATTEMPTS,
+        )
+
+
+def active_job(kind, target):
+    from ..models import LLMJob
+
+    return LLMJob.objects.filter(kind=kind, target=target, status__in=LLMJob.ACTIVE_STATUSES).first()
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt, after ``attempts`` failures"""
+    return timedelta(seconds=settings.LLM_JOB_RETRY_DELAY * 2 ** max(attempts - 1, 0))
+
+
+def claim_job(worker):
+    """
+    Claim the next due job for ``worker``, or return ``None`` when nothing
+    is due or the concurrency limit is reached.
+    """
+    from ..models import LLMJob
+
+    now = timezone.now()
+    candidates = LLMJob.objects.filter(status="queued", run_after__lte=now).values_list("pk", flat=True)
+    for pk in candidates[:10]:
+        with transaction.atomic():
+            claimed = LLMJob.objects.filter(pk=pk, status="queued").update(
+                status="running", locked_at=now, locked_by=worker, attempts=F("attempts") + 1
+            )
+            if not claimed:
+                continue
+            # Counted after the claim, which holds the write lock on SQLite
+            if LLMJob.objects.filter(status="running").count() > settings.LLM_JOB_CONCURRENCY:
+                transaction.set_rollback(True)
+                return None
+        return LLMJob.objects.get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs():
+    """Give jobs whose lease expired back to the queue, or fail them if out of attempts"""
+    from ..models import LLMJob
+
+    now = timezone.now()
+    stale = LLMJob.objects.filter(
+        status="running", locked_at__lt=now - timedelta(seconds=settings.LLM_JOB_LEASE_SECONDS)
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="failed", error="The worker stopped responding", finished_at=now, locked_at=None, locked_by=""
+    )
+    requeued = stale.update(status="queued", run_after=now, locked_at=None, locked_by="")
+    return requeued + failed
+
+
+def _renew_lease(mine, stop):
+    """Keep a running job's lease fresh until ``stop`` is set or the job is taken away"""
+    try:
+        while not stop.wait(settings.LLM_JOB_LEASE_SECONDS / 3):
+            if not mine.update(locked_at=timezone.now()):
+                return
+    finally:
+        # Heartbeats run in their own thread, with their own connection
+        connection.close()
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome. Returns whether it succeeded
+    and the outcome was recorded.
+    """
+    from ..models import LLMJob
+
+    # A worker's threads share its name, but every claim adds an attempt
+    mine = LLMJob.objects.filter(pk=job.pk, status="running", locked_by=job.locked_by, attempts=job.attempts)
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_renew_lease, args=(mine, stop), daemon=True)
+    heartbeat.start()
+    try:
+        result = HANDLERS[job.kind](job)
+    except Exception as error:
+        now = timezone.now()
+        retry = job.attempts < job.max_attempts and not isinstance(error, JobError)
+        logger.warning("LLM job %s attempt %s failed: %s", job.pk, job.attempts, error)
+        if retry:
+            mine.update(
+                status="queued", error=str(error), run_after=now + retry_delay(job.attempts),
+                locked_at=None, locked_by="",
+            )
+        else:
+            mine.update(status="failed", error=str(error), finished_at=now, locked_at=None, locked_by="")
+        return False
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    recorded = mine.update(
+        status="succeeded", result=result or "", error="", finished_at=timezone.now(),
+        locked_at=None, locked_by="",
+    )
+    if not recorded:
+        logger.warning("LLM job %s attempt %s finished after losing its lease", job.pk, job.attempts)
+    return bool(recorded)
+
+
+def run_pending(worker="inline", limit=None):
+    """Claim and run due jobs one at a time until none are left. Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job(worker)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+@handler("session_summary")
+def summarize_note(job):
+    """Write an AI summary of one session note into ``SessionNote.summary``"""
+    from ..models import SessionNote
+    from .export import invalidate_encounters
+    from .llm import generate_session_summary, usage_for
+
+    note = SessionNote.objects.select_related("encounter__chapter").filter(pk=job.payload["note_id"]).first()
+    if note is None:
+        raise JobError("The note was deleted")
+    chapter = note.encounter.chapter if note.encounter else None
+    with usage_for(job.owner, chapter.campaign_id if chapter else None):
+        summary = generate_session_summary(note.content, chapter.title if chapter else None)
+    SessionNote.objects.filter(pk=note.pk).update(summary=summary)
+    # update() skips the signals that mark the export stale
+    invalidate_encounters([note.encounter_id])
+    return summary
+
+
+@handler("compress_notes")
+def compress_notes(job):
+    """Add one note combining an encounter's notes; the originals are kept"""
+    from ..models import Encounter, SessionNote
+    from .llm import compress_session_notes, usage_for
+
+    encounter = Encounter.objects.select_related("chapter").filter(pk=job.payload["encounter_id"]).first()
+    notes = list(SessionNote.objects.filter(pk__in=job.payload["note_ids"]).order_by("date", "pk"))
+    if encounter is None or not notes:
+        raise JobError("The notes to compress were deleted")
+    with usage_for(job.owner, encounter.chapter.campaign_id):
+        compressed = compress_session_notes([note.content for note in notes], encounter.title)
+    SessionNote.objects.create(encounter=encounter, content=compressed, date=notes[-1].date, owner=job.owner)
+    return compressed
+
+
+@handler("ingest_pdf")
+def ingest_pdf(job):
+    """Read an adventure PDF, or reuse its cached outline, and add drafts to a campaign"""
+    from ..models import AdventurePDF, Campaign
+    from .pdf_ingest import PDFError, create_drafts, pdf_outline
+
+    pdf = AdventurePDF.objects.filter(pk=job.payload["pdf_id"]).first()
+    campaign = Campaign.objects.filter(pk=job.payload["campaign_id"]).first()
+    if pdf is None or campaign is None:
+        raise JobError("The PDF or campaign was deleted")
+    try:
+        outline = pdf_outline(pdf, settings.PDF_INGEST_WORKERS)
+    except PDFError as error:
+        raise JobError(str(error)) from error
+    chapters, encounters, enemies = create_drafts(outline, campaign, job.owner, pdf.name)
+    return f"Added {chapters} chapters, {encounters} encounters and {enemies} new enemies from {pdf.name} as drafts."
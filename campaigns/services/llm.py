@@ -1,22 +1,328 @@
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+
 from openai import OpenAI
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class FakeLLMClient:
+    """
+    Offline stand-in for the OpenAI client with the same call shape.
+
+    Replies are built from the bullet points in the prompt, so they are
+    deterministic. ``failures`` makes that many calls raise first, for
+    exercising retries. ``stream=True`` returns the reply word by word.
+    """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @staticmethod
+    def _usage(messages, content):
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+        completion_tokens = len(content.split())
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
 
-# Initialize OpenAI client only if API key is available
-if hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
+    def _stream(self, messages, content, include_usage):
+        # One chunk per word, shaped like the API's ChatCompletionChunk
+        for piece in re.findall(r"\s*\S+", content):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if include_usage:
+            yield SimpleNamespace(choices=[], usage=self._usage(messages, content))
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append(dict(kwargs, model=model, messages=messages))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Fake LLM failure")
+
+        prompt = messages[-1]['content']
+        points = [
+            line.strip().lstrip('-•* ').strip()
+            for line in prompt.splitlines()
+            if line.strip().startswith(('-', '•', '*')) and not line.strip().startswith('---')
+        ]
+        content = "\n".join(f"- {point}" for point in points if point) or "- Nothing of note happened."
+        if kwargs.get('stream'):
+            include_usage = (kwargs.get('stream_options') or {}).get('include_usage', False)
+            return self._stream(messages, content, include_usage)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=self._usage(messages, content),
+        )
+
+
+# Initialize the fake client when configured, else OpenAI only if an API key is available
+if getattr(settings, 'LLM_BACKEND', 'openai') == 'fake':
+    client = FakeLLMClient()
+elif hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
     client = OpenAI(api_key=settings.OPENAI_API_KEY)
 else:
     client = None
 
 
-def generate_session_summary(bullet_points, chapter_title=None):
+# Rough size of a token in English text; exact counts need the model's tokenizer
+CHARS_PER_TOKEN = 4
+# Prompt plus reply limits; unknown models get the smallest
+CONTEXT_WINDOWS = {"gpt-3.5-turbo": 16385, "gpt-4": 8192}
+TRUNCATION_NOTE = "\n\n[... truncated to fit the model's context window]"
+
+_usage_owner = contextvars.ContextVar("llm_usage_owner", default=(None, None))
+
+
+def estimate_tokens(text):
+    """Local token estimate, used where the API doesn't report counts"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@contextmanager
+def usage_for(user=None, campaign=None):
+    """Charge the LLM calls made inside the block to ``user`` and ``campaign`` (objects or pks)"""
+    token = _usage_owner.set((getattr(user, "pk", user), getattr(campaign, "pk", campaign)))
+    try:
+        yield
+    finally:
+        _usage_owner.reset(token)
+
+
+def _usage(usage, request, content):
+    """Prompt and completion tokens as reported by the API, else estimated"""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in request["messages"])
+        completion_tokens = estimate_tokens(content)
+    return prompt_tokens, completion_tokens
+
+
+def record_usage(name, prompt_tokens=0, completion_tokens=0, duration_ms=0, cached=False):
+    """Log one call and add it to today's counters for the current user and campaign"""
+    from ..models import LLMUsage
+
+    user_id, campaign_id = _usage_owner.get()
+    if cached:
+        logger.info("LLM %s: cache hit (user %s, campaign %s)", name, user_id, campaign_id)
+    else:
+        logger.info(
+            "LLM %s: %s prompt + %s completion tokens in %s ms (user %s, campaign %s)",
+            name, prompt_tokens, completion_tokens, duration_ms, user_id, campaign_id,
+        )
+    counters = {
+        "calls": 0 if cached else 1,
+        "cache_hits": 1 if cached else 0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "duration_ms": duration_ms,
+    }
+    today = LLMUsage.objects.filter(day=timezone.localdate(), user_id=user_id, campaign_id=campaign_id)
+    increments = {field: F(field) + value for field, value in counters.items()}
+    if today.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            LLMUsage.objects.create(day=timezone.localdate(), user_id=user_id, campaign_id=campaign_id, **counters)
+    except IntegrityError:
+        today.update(**increments)
+
+
+def fit_inputs(system, template, inputs, model, max_tokens):
+    """Cut the longest input so the prompt and reply fit in the model's context window"""
+    window = CONTEXT_WINDOWS.get(model, min(CONTEXT_WINDOWS.values()))
+    overflow = estimate_tokens(system) + estimate_tokens(template.format(**inputs)) + max_tokens - window
+    if overflow <= 0:
+        return inputs
+    field = max(inputs, key=lambda name: len(inputs[name]))
+    text = inputs[field]
+    keep = max(0, len(text) - (overflow + estimate_tokens(TRUNCATION_NOTE)) * CHARS_PER_TOKEN)
+    logger.warning("Truncated the %s input from %s to %s characters to fit %s", field, len(text), keep, model)
+    return dict(inputs, **{field: text[:keep] + TRUNCATION_NOTE})
+
+
+# Bump to drop every cached response, e.g. after changing how replies are post-processed
+CACHE_VERSION = 1
+
+_stats_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        cache_stats[stat] += amount
+
+
+def prompt_version(name, system, template):
+    """
+    A template's name plus a hash of its text, so editing a prompt changes
+    the version and stops older cached replies from matching
+    """
+    digest = hashlib.sha256(f"{CACHE_VERSION}\0{system}\0{template}".encode()).hexdigest()
+    return f"{name}:{digest[:12]}"
+
+
+def cache_key(model, temperature, max_tokens, version, inputs):
+    """Content address of a request: identical requests share a key"""
+    material = json.dumps([model, temperature, max_tokens, version, inputs], sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def cached_response(key):
+    """The stored reply for ``key``, or ``None`` if missing or older than the age limit"""
+    from ..models import CachedLLMResponse
+
+    now = timezone.now()
+    cutoff = now - timedelta(days=settings.LLM_CACHE_MAX_AGE_DAYS)
+    entry = CachedLLMResponse.objects.filter(key=key, created_at__gte=cutoff).values_list("response", flat=True).first()
+    if entry is None:
+        _count("misses")
+        return None
+    CachedLLMResponse.objects.filter(key=key).update(hits=F("hits") + 1, last_used_at=now)
+    _count("hits")
+    return entry
+
+
+def store_response(key, model, version, response):
+    """Store a reply, then evict expired entries and the least recently used beyond the limit"""
+    from ..models import CachedLLMResponse
+
+    now = timezone.now()
+    CachedLLMResponse.objects.update_or_create(
+        key=key,
+        defaults={"model": model, "prompt_version": version, "response": response, "created_at": now, "last_used_at": now},
+    )
+    evicted, _ = CachedLLMResponse.objects.filter(
+        created_at__lt=now - timedelta(days=settings.LLM_CACHE_MAX_AGE_DAYS)
+    ).delete()
+    overflow = list(
+        CachedLLMResponse.objects.order_by("-last_used_at", "-pk").values_list("pk", flat=True)[settings.LLM_CACHE_MAX_ENTRIES:]
+    )
+    if overflow:
+        evicted += CachedLLMResponse.objects.filter(pk__in=overflow).delete()[0]
+    if evicted:
+        _count("evictions", evicted)
+
+
+def _prepare(name, system, template, inputs, model, temperature, max_tokens):
+    inputs = fit_inputs(system, template, inputs, model, max_tokens)
+    version = prompt_version(name, system, template)
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": template.format(**inputs)},
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    return cache_key(model, temperature, max_tokens, version, inputs), version, request
+
+
+def _call(request):
+    """One API call; no database access, so it is safe in worker threads"""
+    started = time.monotonic()
+    response = client.chat.completions.create(**request)
+    content = response.choices[0].message.content.strip()
+    prompt_tokens, completion_tokens = _usage(getattr(response, "usage", None), request, content)
+    return content, prompt_tokens, completion_tokens, round((time.monotonic() - started) * 1000)
+
+
+def complete(name, system, template, inputs, model, temperature, max_tokens):
+    """
+    Fill ``template`` with ``inputs`` and ask the model, answering repeated
+    requests from the response cache without calling the API
+    """
+    return complete_many([dict(
+        name=name, system=system, template=template, inputs=inputs,
+        model=model, temperature=temperature, max_tokens=max_tokens,
+    )])[0]
+
+
+def complete_many(requests, workers=1):
+    """
+    Answer several ``complete`` requests, running the ones missing from the
+    cache on up to ``workers`` threads. The cache and usage counters are
+    written on the calling thread only.
+    """
+    prepared = [_prepare(**request) for request in requests]
+    enabled = settings.LLM_CACHE_MAX_ENTRIES > 0
+    results = [cached_response(key) if enabled else None for key, _, _ in prepared]
+    missing = [i for i, result in enumerate(results) if result is None]
+    for request, result in zip(requests, results):
+        if result is not None:
+            record_usage(request["name"], cached=True)
+    if not missing:
+        return results
     if not client:
         raise ValueError("OpenAI API key not configured")
-        
-    prompt = f"""
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+        replies = pool.map(_call, [prepared[i][2] for i in missing])
+        for i, (content, prompt_tokens, completion_tokens, duration_ms) in zip(missing, replies):
+            results[i] = content
+            record_usage(requests[i]["name"], prompt_tokens, completion_tokens, duration_ms)
+            if enabled:
+                key, version, request = prepared[i]
+                store_response(key, request["model"], version, content)
+    return results
+
+
+def stream_complete(name, system, template, inputs, model, temperature, max_tokens):
+    """
+    Like ``complete``, but yields the reply in pieces as the model writes
+    it. A cached reply is yielded whole; a new one is cached once the
+    stream has finished.
+    """
+    key, version, request = _prepare(name, system, template, inputs, model, temperature, max_tokens)
+    enabled = settings.LLM_CACHE_MAX_ENTRIES > 0
+    if enabled:
+        cached = cached_response(key)
+        if cached is not None:
+            record_usage(name, cached=True)
+            yield cached
+            return
+    if not client:
+        raise ValueError("OpenAI API key not configured")
+
+    started = time.monotonic()
+    pieces, usage = [], None
+    for chunk in client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request):
+        # The last chunk has no choices, only the token counts
+        usage = getattr(chunk, "usage", None) or usage
+        piece = chunk.choices[0].delta.content if chunk.choices else None
+        if piece:
+            pieces.append(piece)
+            yield piece
+    content = "".join(pieces).strip()
+    record_usage(name, *_usage(usage, request, content), round((time.monotonic() - started) * 1000))
+    if enabled:
+        store_response(key, model, version, content)
+
+
+SESSION_SUMMARY_SYSTEM = "You summarize D&D game sessions."
+SESSION_SUMMARY_PROMPT = """
 You are a professional Dungeons & Dragons campaign writer. Based on the following bullet point notes from a game session, 
 generate a clean and engaging narrative summary of what happened in the session.
 
-Chapter: {chapter_title or "Unknown"}
+Chapter: {chapter_title}
 
 Notes:
 {bullet_points}
@@ -30,22 +336,163 @@ Keep all of the notes short and precise, there's no need to add extra fluff arou
 Thanks!
 """
 
-    response = client.chat.completions.create(
+COMPRESS_NOTES_SYSTEM = "You are an expert at organizing and compressing D&D session notes while preserving all important information."
+COMPRESS_NOTES_PROMPT = """
+You are a professional Dungeons & Dragons campaign writer. You have been given multiple session notes from the same encounter that need to be compressed into a single, comprehensive note.
+
+Encounter: {encounter_title}
+
+Multiple Session Notes:
+{all_notes}
+
+Please compress these notes into a single, well-organized note that:
+1. Combines all the important information chronologically
+2. Removes redundant information 
+3. Maintains all key story beats, character decisions, and outcomes
+4. Preserves important NPC interactions and dialogue
+5. Keeps combat details and mechanical outcomes
+6. Uses clear markdown formatting with bullet points and sections as appropriate
+
+The compressed note should be comprehensive but concise, suitable for future reference during campaign preparation.
+"""
+
+
+def _session_summary_request(bullet_points, chapter_title):
+    chapter_title = chapter_title or "Unknown"
+    # Notes too long for one prompt are condensed first (this may call the API)
+    bullet_points = NOTE_SEPARATOR.join(condense_notes([bullet_points], chapter_title))
+    return dict(
+        name="session_summary",
+        system=SESSION_SUMMARY_SYSTEM,
+        template=SESSION_SUMMARY_PROMPT,
+        inputs={"bullet_points": bullet_points, "chapter_title": chapter_title},
         model="gpt-3.5-turbo",  # Or gpt-4 if available
-        messages=[
-            {"role": "system", "content": "You summarize D&D game sessions."},
-            {"role": "user", "content": prompt},
-        ],
         temperature=0.7,
         max_tokens=500,
     )
 
-    return response.choices[0].message.content.strip()
+
+def generate_session_summary(bullet_points, chapter_title=None):
+    return complete(**_session_summary_request(bullet_points, chapter_title))
+
+
+def stream_session_summary(bullet_points, chapter_title=None):
+    """Yield a session summary piece by piece as the model writes it"""
+    return stream_complete(**_session_summary_request(bullet_points, chapter_title))
+
+
+CHUNK_SUMMARY_SYSTEM = "You condense part of a D&D encounter's session notes without losing facts."
+CHUNK_SUMMARY_PROMPT = """
+You are a professional Dungeons & Dragons campaign writer. Below is one consecutive part of the session notes for an encounter. Other parts are summarized separately and combined later.
+
+Encounter: {encounter_title}
+
+Notes:
+{notes}
+
+Condense these notes into short markdown bullet points in chronological order. Keep every story beat, character decision, NPC interaction, combat outcome and item found. Do not add an introduction or conclusion.
+"""
+
+NOTE_SEPARATOR = "\n\n--- Note Separator ---\n\n"
+# On average one note in this many ends a chunk early (see ``chunk_notes``)
+BOUNDARY_SPREAD = 8
+
+
+def split_text(text, max_tokens):
+    """Split ``text`` at line breaks into pieces of at most ``max_tokens``"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    limit = max_tokens * CHARS_PER_TOKEN - CHARS_PER_TOKEN
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            # A single line longer than a piece
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return [piece for piece in pieces if piece.strip()]
+
+
+def _ends_chunk(text):
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16) % BOUNDARY_SPREAD == 0
+
+
+def chunk_notes(notes, max_tokens):
+    """
+    Group consecutive notes into chunks of at most ``max_tokens``.
+
+    A chunk also ends after a note whose content hash picks it as a
+    boundary. Those boundaries don't move when notes are added elsewhere,
+    so a new or edited note changes only the chunks around it and the
+    rest keep their cached summaries. Every chunk but the last holds at
+    least two notes when each note fits in half the budget, so each round
+    of summaries is shorter than the last.
+    """
+    chunks, current, size = [], [], 0
+    for note in notes:
+        tokens = estimate_tokens(note + NOTE_SEPARATOR)
+        if current and size + tokens > max_tokens:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(note)
+        size += tokens
+        if len(current) > 1 and _ends_chunk(note):
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _chunk_summary_request(notes, encounter_title):
+    return dict(
+        name="chunk_summary",
+        system=CHUNK_SUMMARY_SYSTEM,
+        template=CHUNK_SUMMARY_PROMPT,
+        inputs={"notes": NOTE_SEPARATOR.join(notes), "encounter_title": encounter_title},
+        model="gpt-3.5-turbo",
+        temperature=0.3,
+        max_tokens=400,
+    )
+
+
+def condense_notes(notes, title):
+    """
+    Summarize ``notes`` in rounds until together they fit in
+    ``LLM_SUMMARY_CHUNK_TOKENS``; notes that already fit are returned as-is
+    """
+    budget = settings.LLM_SUMMARY_CHUNK_TOKENS
+    # Any two pieces fit in one chunk, separators included
+    piece_tokens = budget // 2 - estimate_tokens(NOTE_SEPARATOR)
+    notes = [piece for content in notes for piece in split_text(content, piece_tokens)]
+    while len(notes) > 1 and estimate_tokens(NOTE_SEPARATOR.join(notes)) > budget:
+        chunks = chunk_notes(notes, budget)
+        if len(chunks) == len(notes):
+            break
+        notes = complete_many(
+            [_chunk_summary_request(chunk, title) for chunk in chunks],
+            workers=settings.LLM_SUMMARY_WORKERS,
+        )
+    return notes
 
 
 def compress_session_notes(notes_content_list, encounter_title=None):
     """
     Compress multiple session notes into a single comprehensive note.
+
+    Notes that don't fit in ``LLM_SUMMARY_CHUNK_TOKENS`` are summarized
+    hierarchically: they are chunked, the chunks are summarized in
+    parallel, and the summaries are chunked and summarized again until
+    they fit in one final request. Chunk summaries are cached, so adding a
+    note re-summarizes only its branch.
     
     Args:
         notes_content_list: List of note content strings
@@ -54,42 +501,21 @@ def compress_session_notes(notes_content_list, encounter_title=None):
     Returns:
         Compressed note content as a string
     """
-    if not client:
-        raise ValueError("OpenAI API key not configured")
-        
     if not notes_content_list:
         return ""
     
+    encounter_title = encounter_title or "Unknown"
+    notes = condense_notes(notes_content_list, encounter_title)
+
     # Join all notes with clear separators
-    all_notes = "\n\n--- Note Separator ---\n\n".join(notes_content_list)
+    all_notes = NOTE_SEPARATOR.join(notes)
     
-    prompt = f"""
-You are a professional Dungeons & Dragons campaign writer. You have been given multiple session notes from the same encounter that need to be compressed into a single, comprehensive note.
-
-Encounter: {encounter_title or "Unknown"}
-
-Multiple Session Notes:
-{all_notes}
-
-Please compress these notes into a single, well-organized note that:
-1. Combines all the important information chronologically
-2. Removes redundant information 
-3. Maintains all key story beats, character decisions, and outcomes
-4. Preserves important NPC interactions and dialogue
-5. Keeps combat details and mechanical outcomes
-6. Uses clear markdown formatting with bullet points and sections as appropriate
-
-The compressed note should be comprehensive but concise, suitable for future reference during campaign preparation.
-"""
-
-    response = client.chat.completions.create(
+    return complete(
+        "compress_notes",
+        COMPRESS_NOTES_SYSTEM,
+        COMPRESS_NOTES_PROMPT,
+        {"all_notes": all_notes, "encounter_title": encounter_title},
         model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are an expert at organizing and compressing D&D session notes while preserving all important information."},
-            {"role": "user", "content": prompt},
-        ],
         temperature=0.3,  # Lower temperature for more consistent, factual output
         max_tokens=800,   # Allow more tokens for comprehensive compression
     )
-
-    return response.choices[0].message.content.strip()
\ No newline at end of file
@@ -0,0 +1,445 @@
+"""
+Adventure PDF ingestion.
+
+An uploaded module is stored once per SHA-256 as an ``AdventurePDF`` and
+read by the ``ingest_pdf`` job, so the request only saves the file:
+
+1. ``iter_pages`` extracts each page's text with PyMuPDF, keeping the font
+   size and weight of every line. Ranges of pages are read in a process
+   pool and yielded in page order as they finish, so parsing starts while
+   later pages are still being read.
+2. ``OutlineParser`` reads the lines in order and picks out chapter
+   headings, encounter headings (larger text, or keyed areas such as "A3.
+   Guard Room") and 5e stat blocks (a name, a size and type line, then
+   Armor Class, Hit Points and so on). Sizes are judged against the most
+   common text size seen so far.
+3. The outline is cached on the ``AdventurePDF`` by parser version, and
+   ``create_drafts`` adds it to a campaign as chapters, encounters and
+   enemies whose DM notes mark them as drafts to review.
+"""
+import hashlib
+import multiprocessing
+import re
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from fractions import Fraction
+
+import pymupdf
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+# Bump when the parser changes so cached outlines are read again
+OUTLINE_VERSION = 2
+# Pages read by one pool task
+PAGES_PER_TASK = 20
+# Longest draft summary taken from the text
+SUMMARY_CHARS = 300
+# Heading sizes, relative to the body text
+CHAPTER_SCALE = 1.7
+HEADING_SCALE = 1.2
+LONGEST_HEADING = 100
+
+CREATURE_TYPES = (
+    "humanoid", "beast", "monstrosity", "dragon", "fey", "fiend", "celestial", "undead",
+    "construct", "elemental", "giant", "aberration", "ooze", "plant",
+)
+CHAPTER_RE = re.compile(
+    r"^(chapter|part)\s+(\d+|[ivxlc]+|one|two|three|four|five|six|seven|eight|nine|ten)\b", re.IGNORECASE
+)
+# Keyed map areas: "A3. Guard Room", "12. Well"
+AREA_RE = re.compile(r"^[A-Z]?\d{1,3}[a-z]?\.\s+\S")
+SIZE_TYPE_RE = re.compile(
+    r"^(tiny|small|medium|large|huge|gargantuan)\b[^,]*?\b(" + "|".join(CREATURE_TYPES) + r")s?\b.*,",
+    re.IGNORECASE,
+)
+ARMOR_CLASS_RE = re.compile(r"^armor class\s+(\d+)", re.IGNORECASE)
+HIT_POINTS_RE = re.compile(r"^hit points\s+(\d+)(?:\s*\(([^)]*)\))?", re.IGNORECASE)
+SPEED_RE = re.compile(r"^speed\s+(.+)", re.IGNORECASE)
+ABILITY_HEADER_RE = re.compile(r"^(str|dex|con|int|wis|cha)(\s+(str|dex|con|int|wis|cha))*$", re.IGNORECASE)
+ABILITY_RE = re.compile(r"(\d{1,2})\s*\(\s*[+\-−–]\s*\d+\s*\)")
+CHALLENGE_RE = re.compile(r"^challenge\s+(\d+(?:/\d+)?)", re.IGNORECASE)
+# On its own line, or after the challenge rating in newer books
+PROFICIENCY_RE = re.compile(r"proficiency bonus\s+\+?(\d+)", re.IGNORECASE)
+DETAIL_FIELDS = [
+    ("saving throws", "saving_throws"),
+    ("skills", "skills"),
+    ("damage resistances", "damage_resistances"),
+    ("damage immunities", "damage_immunities"),
+    ("condition immunities", "condition_immunities"),
+    ("senses", "senses"),
+]
+# Headings inside a stat block and the Enemy field their text goes to
+STAT_SECTIONS = {
+    "actions": "actions",
+    "bonus actions": "actions",
+    "reactions": "actions",
+    "legendary actions": "legendary_actions",
+}
+ABILITIES = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
+
+
+class PDFError(Exception):
+    """The file can't be read as a PDF"""
+
+
+def _read_pages(path, start, stop):
+    """(size, bold, text) for each text line of pages ``start`` to ``stop``"""
+    pages = []
+    with pymupdf.open(path) as document:
+        for number in range(start, stop):
+            lines = []
+            for block in document[number].get_text("dict")["blocks"]:
+                for line in block.get("lines", []):
+                    spans = [span for span in line["spans"] if span["text"].strip()]
+                    if spans:
+                        lines.append((
+                            max(span["size"] for span in spans),
+                            any(span["flags"] & pymupdf.TEXT_FONT_BOLD for span in spans),
+                            "".join(span["text"] for span in line["spans"]),
+                        ))
+            pages.append(lines)
+    return start, pages
+
+
+def page_count(path):
+    try:
+        with pymupdf.open(path) as document:
+            if document.needs_pass:
+                raise PDFError("The PDF is password protected")
+            return document.page_count
+    except (pymupdf.FileDataError, pymupdf.FileNotFoundError) as error:
+        raise PDFError(f"The file could not be read as a PDF: {error}") from error
+
+
+def iter_pages(path, workers=1):
+    """Yield ``(page number, lines)`` for every page in order"""
+    count = page_count(path)
+    ranges = [(start, min(start + PAGES_PER_TASK, count)) for start in range(0, count, PAGES_PER_TASK)]
+    if workers > 1 and len(ranges) > 1:
+        # Jobs run on worker threads, and forking a threaded process can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            starts, stops = zip(*ranges)
+            for start, pages in pool.map(_read_pages, [path] * len(ranges), starts, stops):
+                yield from enumerate(pages, start + 1)
+    else:
+        for start, stop in ranges:
+            yield from enumerate(_read_pages(path, start, stop)[1], start + 1)
+
+
+class OutlineParser:
+    """
+    Builds an outline from page lines fed in reading order. Each line is
+    handled once the next one is known, since a stat block's name only
+    shows itself by the size and type line that follows it.
+    """
+
+    def __init__(self):
+        self.sizes = Counter()
+        self.chapters = []
+        self.enemies = {}
+        self.chapter = None
+        self.encounter = None
+        self.enemy = None
+        self.previous = None
+
+    def feed_page(self, number, lines):
+        # The page's own lines count towards the body size it is judged by
+        for size, bold, text in lines:
+            self.sizes[round(size * 2) / 2] += len(text)
+        for size, bold, text in lines:
+            text = " ".join(text.split())
+            # Page numbers
+            if text.isdigit():
+                continue
+            line = (number, size, bold, text)
+            if self.previous:
+                self.handle(self.previous, line)
+            self.previous = line
+
+    def finish(self):
+        if self.previous:
+            self.handle(self.previous, None)
+            self.previous = None
+        self.end_enemy()
+        return {"version": OUTLINE_VERSION, "chapters": self.chapters, "enemies": list(self.enemies.values())}
+
+    def classify(self, size, bold, text):
+        body = self.sizes.most_common(1)[0][0]
+        if len(text) > LONGEST_HEADING:
+            return None
+        if size >= body * CHAPTER_SCALE or (CHAPTER_RE.match(text) and (bold or size > body)):
+            return "chapter"
+        if (size >= body * HEADING_SCALE or (bold and AREA_RE.match(text))) and not text.endswith((".", ",")):
+            return "encounter"
+        return None
+
+    def handle(self, line, following):
+        number, size, bold, text = line
+        if following and SIZE_TYPE_RE.match(following[3]) and len(text) <= 60 and not text.endswith("."):
+            self.start_enemy(number, text)
+            return
+
+        kind = self.classify(size, bold, text)
+        if self.enemy is not None:
+            if kind is None or text.lower() in STAT_SECTIONS:
+                self.stat_line(text)
+                return
+            self.end_enemy()
+
+        if kind == "chapter":
+            self.encounter = None
+            self.chapter = {"title": text, "page": number, "intro": [], "encounters": [], "enemies": []}
+            self.chapters.append(self.chapter)
+        elif kind == "encounter":
+            self.encounter = {"title": text, "page": number, "text": [], "enemies": []}
+            self.current_chapter(number)["encounters"].append(self.encounter)
+        else:
+            self.add_text(text)
+
+    def current_chapter(self, number):
+        if self.chapter is None:
+            # Encounters before any chapter heading
+            self.chapter = {"title": "", "page": number, "intro": [], "encounters": [], "enemies": []}
+            self.chapters.append(self.chapter)
+        return self.chapter
+
+    def add_text(self, text):
+        if self.encounter is not None:
+            self.encounter["text"].append(text)
+        elif self.chapter is not None:
+            self.chapter["intro"].append(text)
+
+    def start_enemy(self, number, name):
+        self.end_enemy()
+        self.enemy = {
+            "name": name, "page": number, "lines": [name], "abilities": [], "section": None,
+            "special_abilities": [], "actions": [], "legendary_actions": [],
+        }
+
+    def stat_line(self, text):
+        enemy = self.enemy
+        enemy["lines"].append(text)
+        lower = text.lower()
+        if "size" not in enemy and (match := SIZE_TYPE_RE.match(text)):
+            enemy["size"], enemy["creature_type"] = match[1].lower(), match[2].lower()
+        elif lower in STAT_SECTIONS:
+            enemy["section"] = STAT_SECTIONS[lower]
+        elif match := PROFICIENCY_RE.match(text):
+            enemy["proficiency_bonus"] = int(match[1])
+        elif enemy["section"]:
+            enemy[enemy["section"]].append(text)
+        elif match := ARMOR_CLASS_RE.match(text):
+            enemy["armor_class"] = int(match[1])
+        elif match := HIT_POINTS_RE.match(text):
+            enemy["hit_points"] = int(match[1])
+            enemy["hit_dice"] = (match[2] or "").replace(" ", "")
+        elif match := SPEED_RE.match(text):
+            enemy["speed"] = match[1]
+        elif match := CHALLENGE_RE.match(text):
+            enemy["challenge_rating"] = match[1]
+            if match := PROFICIENCY_RE.search(text):
+                enemy["proficiency_bonus"] = int(match[1])
+            # Traits follow the challenge rating
+            enemy["section"] = "special_abilities"
+        elif len(enemy["abilities"]) < len(ABILITIES) and (scores := ABILITY_RE.findall(text)):
+            enemy["abilities"] += [int(score) for score in scores][:len(ABILITIES) - len(enemy["abilities"])]
+        else:
+            for prefix, field in DETAIL_FIELDS:
+                if lower.startswith(prefix):
+                    enemy[field] = text[len(prefix):].strip()
+                    break
+
+    def end_enemy(self):
+        enemy, self.enemy = self.enemy, None
+        if enemy is None:
+            return
+        if "armor_class" not in enemy or "hit_points" not in enemy:
+            # A short line before a size and type, but not a stat block after all
+            for text in enemy["lines"]:
+                self.add_text(text)
+            return
+
+        owner = self.encounter if self.encounter is not None else self.chapter
+        if owner is not None and enemy["name"] not in owner["enemies"]:
+            owner["enemies"].append(enemy["name"])
+        del enemy["lines"], enemy["section"]
+        enemy.update(zip(ABILITIES, enemy.pop("abilities")))
+        enemy.setdefault("proficiency_bonus", proficiency_bonus(enemy.get("challenge_rating", "0")))
+        for field in ("special_abilities", "actions", "legendary_actions"):
+            enemy[field] = "\n".join(enemy[field])
+        # The first stat block for a name wins; later ones are usually reprints
+        self.enemies.setdefault(enemy["name"].lower(), enemy)
+
+
+def proficiency_bonus(challenge_rating):
+    """The bonus for a challenge rating, for stat blocks that don't print it"""
+    try:
+        rating = int(Fraction(challenge_rating))
+    except (ValueError, ZeroDivisionError):
+        rating = 0
+    return 2 + max(rating - 1, 0) // 4
+
+
+def file_sha256(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_pdf(upload, user):
+    """The ``AdventurePDF`` for an uploaded file, saving the file only if it is new"""
+    from ..models import AdventurePDF
+
+    sha256 = file_sha256(upload)
+    existing = AdventurePDF.objects.filter(sha256=sha256).first()
+    if existing:
+        return existing
+
+    pdf = AdventurePDF(sha256=sha256, name=upload.name[:255], uploaded_by=user)
+    pdf.file.save(f"{sha256}.pdf", upload, save=False)
+    try:
+        with transaction.atomic():
+            pdf.save()
+    except IntegrityError:
+        # The same file was uploaded at the same moment
+        pdf.file.delete(save=False)
+        return AdventurePDF.objects.get(sha256=sha256)
+    return pdf
+
+
+@contextmanager
+def local_path(field_file):
+    """A filesystem path for a stored file, copied to a temporary file if storage is remote"""
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        path = None
+    if path:
+        yield path
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as copy:
+        with field_file.open("rb") as source:
+            for chunk in source.chunks():
+                copy.write(chunk)
+        copy.flush()
+        yield copy.name
+
+
+def pdf_outline(pdf, workers=1):
+    """The outline of an ``AdventurePDF``, reading the file unless it is cached"""
+    from ..models import AdventurePDF
+
+    if pdf.outline and pdf.outline.get("version") == OUTLINE_VERSION:
+        return pdf.outline
+
+    parser, pages = OutlineParser(), 0
+    with local_path(pdf.file) as path:
+        for pages, lines in iter_pages(path, workers):
+            parser.feed_page(pages, lines)
+    outline = parser.finish()
+    AdventurePDF.objects.filter(pk=pdf.pk).update(outline=outline, page_count=pages)
+    pdf.outline, pdf.page_count = outline, pages
+    return outline
+
+
+def _clip(text, length):
+    return text if len(text) <= length else text[:length - 1].rstrip() + "…"
+
+
+def _summary(lines):
+    return _clip(" ".join(lines), SUMMARY_CHARS)
+
+
+def _draft_note(source, page):
+    return f"Draft imported from {source}, page {page}. Review before play."
+
+
+def create_drafts(outline, campaign, owner, source):
+    """
+    Add an outline's chapters, encounters and enemies to ``campaign``.
+    Enemies already in the campaign under the same name are linked rather
+    than added again. Returns the number of chapters, encounters and new
+    enemies.
+    """
+    from ..models import Chapter, Encounter, Enemy
+    from .export import new_version
+
+    chapters = [c for c in outline["chapters"] if c["intro"] or c["encounters"] or c["enemies"]]
+    # bulk_create skips the signals that give new rows their export version
+    version = new_version()
+    with transaction.atomic():
+        start = (campaign.chapters.aggregate(last=Max("order"))["last"] or 0) + 1
+        chapter_rows = Chapter.objects.bulk_create([
+            Chapter(
+                campaign=campaign, owner=owner, order=start + index, export_version=version,
+                title=_clip(chapter["title"] or source, 200),
+                summary=_summary(chapter["intro"]),
+                intro="\n".join(chapter["intro"]),
+                dm_notes=_draft_note(source, chapter["page"]),
+            )
+            for index, chapter in enumerate(chapters)
+        ])
+        encounters = [
+            (chapter_row, order, encounter)
+            for chapter_row, chapter in zip(chapter_rows, chapters)
+            for order, encounter in enumerate(chapter["encounters"], 1)
+        ]
+        encounter_rows = Encounter.objects.bulk_create([
+            Encounter(
+                chapter=chapter_row, owner=owner, order=order, export_version=version,
+                title=_clip(encounter["title"], 200),
+                type="combat" if encounter["enemies"] else "exploration",
+                summary=_summary(encounter["text"]) or encounter["title"],
+                dm_notes="\n\n".join([_draft_note(source, encounter["page"]), "\n".join(encounter["text"])]).strip(),
+            )
+            for chapter_row, order, encounter in encounters
+        ])
+
+        enemies = {enemy.name.lower(): enemy for enemy in Enemy.objects.filter(campaign=campaign)}
+        new_enemies = [
+            Enemy(
+                campaign=campaign, owner=owner,
+                name=_clip(stats["name"], 200),
+                size=stats.get("size", "medium"),
+                creature_type=stats.get("creature_type", "humanoid"),
+                description=_draft_note(source, stats["page"]),
+                armor_class=stats["armor_class"],
+                hit_points=stats["hit_points"],
+                hit_dice=_clip(stats.get("hit_dice", ""), 50),
+                speed=_clip(stats.get("speed", "30 ft."), 100),
+                challenge_rating=stats.get("challenge_rating", "0"),
+                proficiency_bonus=stats["proficiency_bonus"],
+                special_abilities=stats["special_abilities"],
+                actions=stats["actions"],
+                legendary_actions=stats["legendary_actions"],
+                **{field: stats[field] for field in ABILITIES if field in stats},
+                **{field: _clip(stats[field], 300 if field == "skills" else 200)
+                   for _, field in DETAIL_FIELDS if field in stats},
+            )
+            for key, stats in ((stats["name"].lower(), stats) for stats in outline["enemies"])
+            if key not in enemies
+        ]
+        for enemy in Enemy.objects.bulk_create(new_enemies):
+            enemies[enemy.name.lower()] = enemy
+
+        def links(through, target_field, rows_and_sections):
+            through.objects.bulk_create([
+                through(**{"enemy_id": enemies[name.lower()].pk, f"{target_field}_id": row.pk})
+                for row, section in rows_and_sections
+                for name in section["enemies"]
+                if name.lower() in enemies
+            ], ignore_conflicts=True)
+
+        links(Enemy.encounters.through, "encounter", [(row, e) for row, (_, _, e) in zip(encounter_rows, encounters)])
+        chapter_sections = [
+            (row, {"enemies": chapter["enemies"] + [name for e in chapter["encounters"] for name in e["enemies"]]})
+            for row, chapter in zip(chapter_rows, chapters)
+        ]
+        links(Enemy.chapters.through, "chapter", chapter_sections)
+
+    return len(chapter_rows), len(encounter_rows), len(new_enemies)
@@ -0,0 +1,172 @@
+"""
+Session-time solver.
+
+Finds the best start times for a session given everyone's availability, a
+minimum quorum and players who must attend. Each player's selected slots
+are laid out on an hourly timeline per date, so a session longer than one
+slot counts a player as free when their slots cover the whole session.
+
+Coverage is computed with prefix sums: for every player and every candidate
+start, "free for the whole session" is one subtraction, so all players and
+all candidate starts are scored in a single NumPy operation. The timeline
+only depends on the slot layout, so it is cached per shared ``SlotUniverse``.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from .availability import AvailabilityIndex
+
+
+class SessionSolver:
+    """Rank session start times for a schedule's slot universe and responses"""
+
+    def __init__(self, universe, responses, index=None):
+        self.universe = universe
+        self.index = index or AvailabilityIndex(universe, responses)
+        self.responses = self.index.responses
+
+        self.slot_start_tick, self.slot_end_tick, self.day_end_tick, self.tick_count = _timeline(universe)
+        tick = self.tick_count
+
+        # Player x tick coverage via a difference array, then prefix sums
+        players, bits = np.nonzero(self.index.selected)
+        size = len(self.responses) * (tick + 1)
+        row = players * (tick + 1)
+        diff = (
+            np.bincount(row + self.slot_start_tick[bits], minlength=size)
+            - np.bincount(row + self.slot_end_tick[bits], minlength=size)
+        ).reshape(len(self.responses), tick + 1)
+        covered = (np.cumsum(diff, axis=1)[:, :tick] > 0).astype(np.int32)
+        self.prefix = np.zeros((len(self.responses), tick + 1), dtype=np.int32)
+        np.cumsum(covered, axis=1, out=self.prefix[:, 1:])
+
+        self.player_numbers = {response.pk: player for player, response in enumerate(self.responses)}
+
+    def availability(self, session_hours):
+        """
+        Boolean matrix ``players x slots``: whether each player is free for a
+        session of ``session_hours`` starting at each slot's start time.
+        Starts whose session would run past the end of the day are all False.
+        """
+        starts = self.slot_start_tick
+        ends = starts + session_hours
+        fits = ends <= self.day_end_tick
+        ends = np.minimum(ends, self.tick_count)
+        free = (self.prefix[:, ends] - self.prefix[:, starts]) == session_hours
+        return free & fits[None, :]
+
+    def _candidate(self, bit, free_column, session_hours):
+        date_str, label = self.universe.keys[bit]
+        slot = self.universe.slots[bit]
+        day = self.universe.slot_dates[bit]
+        start = datetime.combine(day, slot["start_time"])
+        end = start + timedelta(hours=session_hours)
+        return {
+            "date": day,
+            "date_str": date_str,
+            "time_slot": label,
+            "start_time": slot["start_time"],
+            "end_time": end.time(),
+            "time_display": f"{start:%H:%M} - {end:%H:%M}",
+            "count": int(free_column.sum()),
+            "players": [r.player_name for r, free in zip(self.responses, free_column) if free],
+            "missing": [r.player_name for r, free in zip(self.responses, free_column) if not free],
+        }
+
+    def _feasible(self, free, quorum, required):
+        counts = free.sum(axis=0)
+        feasible = counts >= max(quorum, 1)
+        required = [self.player_numbers[pk] for pk in required if pk in self.player_numbers]
+        if required:
+            feasible &= free[required].all(axis=0)
+        return counts, feasible
+
+    def best_times(self, session_hours=None, quorum=1, required=(), limit=5):
+        """
+        The ``limit`` best start times, most players first and earliest
+        first on ties. Only starts that reach ``quorum`` and include every
+        response whose pk is in ``required`` are considered.
+        """
+        session_hours = session_hours or self.universe.slot_duration_hours
+        free = self.availability(session_hours)
+        counts, feasible = self._feasible(free, quorum, required)
+        candidates = np.flatnonzero(feasible)
+        # Stable sort on descending count keeps chronological order for ties
+        ranked = candidates[np.argsort(-counts[candidates], kind="stable")][:limit]
+        return [self._candidate(bit, free[:, bit], session_hours) for bit in ranked]
+
+    def recurring(self, interval_days=7, session_hours=None, quorum=1, required=(), limit=3):
+        """
+        Propose repeating series, e.g. "every 7 days at 19:00". Every start
+        time is grouped with the same start time ``interval_days`` apart; the
+        series with the most workable dates wins, then total attendance.
+        """
+        session_hours = session_hours or self.universe.slot_duration_hours
+        free = self.availability(session_hours)
+        counts, feasible = self._feasible(free, quorum, required)
+        if not self.universe.days:
+            return []
+        first_date = self.universe.days[0]["date"]
+
+        series = {}
+        for bit, day in enumerate(self.universe.slot_dates):
+            key = ((day - first_date).days % interval_days, self.universe.slots[bit]["start_time"])
+            series.setdefault(key, []).append(bit)
+
+        scored = []
+        for (_, start_time), bits in series.items():
+            bits = np.array(bits)
+            workable = bits[feasible[bits]]
+            if workable.size:
+                score = (int(workable.size), int(counts[workable].sum()))
+                scored.append((score, start_time, bits, workable))
+        # Stable sort keeps the earliest series first on equal scores
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        return [
+            {
+                "start_time": start_time,
+                "interval_days": interval_days,
+                "sessions": [self._candidate(bit, free[:, bit], session_hours) for bit in workable],
+                "skipped": [self.universe.keys[bit][0] for bit in bits if not feasible[bit]],
+                "score": score,
+            }
+            for score, start_time, bits, workable in scored[:limit]
+        ]
+
+
+@lru_cache(maxsize=256)
+def _timeline(universe):
+    """
+    Hourly tick positions for a slot universe: each date gets a run of ticks
+    starting at its first slot. Returns the start and end tick of every slot,
+    the last tick of each slot's day and the total tick count.
+    """
+    slot_start_tick = np.zeros(len(universe), dtype=np.int64)
+    slot_end_tick = np.zeros(len(universe), dtype=np.int64)
+    day_end_tick = np.zeros(len(universe), dtype=np.int64)
+    tick = 0
+    for day in universe.days:
+        slots = day["time_slots"]
+        if not slots:
+            continue
+        base = datetime.combine(day["date"], slots[0]["start_time"])
+        day_length = 0
+        bits = [universe.bit_for(day["date_str"], slot["label"]) for slot in slots]
+        for bit, slot in zip(bits, slots):
+            start = _hours(datetime.combine(day["date"], slot["start_time"]) - base)
+            end = _hours(datetime.combine(day["date"], slot["end_time"]) - base)
+            slot_start_tick[bit] = tick + start
+            slot_end_tick[bit] = tick + end
+            day_length = max(day_length, end)
+        day_end_tick[bits] = tick + day_length
+        tick += day_length
+    for array in (slot_start_tick, slot_end_tick, day_end_tick):
+        array.flags.writeable = False
+    return slot_start_tick, slot_end_tick, day_end_tick, tick
+
+
+def _hours(delta):
+    return int(delta.total_seconds() // 3600)
@@ -0,0 +1,230 @@
+"""
+Monte Carlo combat simulator.
+
+Runs thousands of fights between the campaign's party and an encounter's
+enemies at once. Every fight is a row in a NumPy array, so a round of
+attacks is a handful of vectorized operations across all fights rather than
+a Python loop per fight.
+
+Enemies attack with the first weapon attack found in their ``actions`` text
+(``+4 to hit ... Hit: 5 (1d6 + 2)``) and honour ``Multiattack``. Characters
+only carry AC, HP and initiative, so they are modelled as a baseline martial
+character of their level. The result is a rough balance signal, not a rules
+engine: there is no healing, spellcasting or positioning.
+"""
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .combat import CombatRosterBuilder
+
+PARTY = 0
+ENEMIES = 1
+MAX_ROUNDS = 50
+
+Combatant = namedtuple('Combatant', [
+    'name', 'side', 'hit_points', 'armor_class', 'initiative_modifier',
+    'attack_bonus', 'attacks', 'dice_count', 'dice_size', 'damage_bonus',
+])
+
+ATTACK_BONUS_RE = re.compile(r'([+-])\s*(\d+)\s+to hit', re.IGNORECASE)
+HIT_DAMAGE_RE = re.compile(
+    r'Hit:\s*\d+\s*\(\s*(\d+)\s*d\s*(\d+)\s*(?:([+-])\s*(\d+))?\s*\)', re.IGNORECASE
+)
+MULTIATTACK_RE = re.compile(r'makes\s+(two|three|four|five|\d+)\b', re.IGNORECASE)
+NUMBER_WORDS = {'two': 2, 'three': 3, 'four': 4, 'five': 5}
+
+
+def ability_modifier(score):
+    return (int(score or 10) - 10) // 2
+
+
+def enemy_combatant(enemy):
+    """Build a combatant from an Enemy's stat block"""
+    modifier = ability_modifier(max(enemy.strength or 10, enemy.dexterity or 10))
+    attack_bonus = (enemy.proficiency_bonus or 2) + modifier
+    dice_count, dice_size, damage_bonus = 1, 6, max(modifier, 0)
+    attacks = 1
+
+    actions = enemy.actions or ''
+    match = ATTACK_BONUS_RE.search(actions)
+    if match:
+        attack_bonus = int(match.group(2)) * (-1 if match.group(1) == '-' else 1)
+    match = HIT_DAMAGE_RE.search(actions)
+    if match:
+        dice_count, dice_size = int(match.group(1)), int(match.group(2))
+        damage_bonus = int(match.group(4) or 0) * (-1 if match.group(3) == '-' else 1)
+    if 'multiattack' in actions.lower():
+        match = MULTIATTACK_RE.search(actions)
+        if match:
+            count = match.group(1).lower()
+            attacks = NUMBER_WORDS.get(count) or int(count)
+
+    return Combatant(
+        name=enemy.name,
+        side=ENEMIES,
+        hit_points=enemy.hit_points or 1,
+        armor_class=enemy.armor_class or 10,
+        initiative_modifier=ability_modifier(enemy.dexterity),
+        attack_bonus=attack_bonus,
+        attacks=attacks,
+        dice_count=dice_count,
+        dice_size=dice_size,
+        damage_bonus=damage_bonus,
+    )
+
+
+def character_combatant(character):
+    """Build a combatant from a CharacterSummary as a baseline martial character"""
+    level = min(max(character.level or 1, 1), 20)
+    proficiency = 2 + (level - 1) // 4
+    ability = 3 + (level >= 4) + (level >= 8)
+    return Combatant(
+        name=character.character_name,
+        side=PARTY,
+        hit_points=(
+            character.maximum_hit_points or character.current_hit_points
+            or CombatRosterBuilder.DEFAULT_PLAYER_HP
+        ),
+        armor_class=character.armor_class or 10,
+        initiative_modifier=character.initiative_modifier,
+        attack_bonus=proficiency + ability,
+        attacks=2 if level >= 5 else 1,
+        dice_count=1,
+        dice_size=8,
+        damage_bonus=ability,
+    )
+
+
+def simulate_fights(combatants, fights=1000, max_rounds=MAX_ROUNDS, seed=None):
+    """
+    Simulate ``fights`` independent fights between the combatants.
+
+    Returns the party's win rate, the expected number of rounds and the
+    expected number of characters dropped to 0 HP. Fights still running
+    after ``max_rounds`` count as losses.
+    """
+    rng = np.random.default_rng(seed)
+    combatant_count = len(combatants)
+    side = np.array([c.side for c in combatants])
+    armor_class = np.array([c.armor_class for c in combatants])
+    attack_bonus = np.array([c.attack_bonus for c in combatants])
+    attacks = np.array([c.attacks for c in combatants])
+    dice_count = np.array([c.dice_count for c in combatants])
+    dice_size = np.array([c.dice_size for c in combatants])
+    damage_bonus = np.array([c.damage_bonus for c in combatants])
+    party = side == PARTY
+
+    result = {'fights': fights, 'win_rate': 0.0, 'expected_rounds': 0.0, 'expected_pc_downs': 0.0}
+    if not fights or not party.any() or party.all():
+        return result
+
+    hp = np.tile(np.array([c.hit_points for c in combatants]), (fights, 1))
+    # Random fraction breaks initiative ties without crossing whole numbers
+    initiative = (
+        rng.integers(1, 21, (fights, combatant_count))
+        + np.array([c.initiative_modifier for c in combatants])
+        + rng.random((fights, combatant_count))
+    )
+    order = np.argsort(-initiative, axis=1)
+    rows = np.arange(fights)
+    max_dice = int(dice_count.max()) * 2  # room for critical hits
+    dice_slots = np.arange(max_dice)[None, :]
+    max_attacks = int(attacks.max())
+
+    rounds = np.full(fights, max_rounds)
+    finished = np.zeros(fights, dtype=bool)
+    party_won = np.zeros(fights, dtype=bool)
+
+    for round_number in range(1, max_rounds + 1):
+        for slot in range(combatant_count):
+            # Only fights that are still running and whose actor is standing
+            fight = np.flatnonzero(~finished & (hp[rows, order[:, slot]] > 0))
+            if not fight.size:
+                continue
+            actor = order[fight, slot]
+            local = np.arange(fight.size)
+            targetable = (hp[fight] > 0) & (side[None, :] != side[actor][:, None])
+
+            for swing in range(max_attacks):
+                swinging = targetable.any(axis=1) & (swing < attacks[actor])
+                if not swinging.any():
+                    break
+                target = np.argmax(rng.random(targetable.shape) * targetable, axis=1)
+
+                d20 = rng.integers(1, 21, fight.size)
+                critical = d20 == 20
+                hit = swinging & (d20 != 1) & (critical | (d20 + attack_bonus[actor] >= armor_class[target]))
+
+                dice = (rng.random((fight.size, max_dice)) * dice_size[actor][:, None]).astype(int) + 1
+                rolled = dice_count[actor] * (1 + critical)
+                damage = (dice * (dice_slots < rolled[:, None])).sum(axis=1)
+                damage = np.maximum(damage + damage_bonus[actor], 0)
+
+                hp[fight, target] -= np.where(hit, damage, 0)
+                targetable[local, target] &= hp[fight, target] > 0
+
+            party_standing = (hp[fight][:, party] > 0).any(axis=1)
+            enemies_standing = (hp[fight][:, ~party] > 0).any(axis=1)
+            ended = ~(party_standing & enemies_standing)
+            rounds[fight[ended]] = round_number
+            party_won[fight[ended]] = party_standing[ended]
+            finished[fight[ended]] = True
+
+        if finished.all():
+            break
+
+    result.update(
+        win_rate=float(party_won.mean()),
+        expected_rounds=float(rounds.mean()),
+        expected_pc_downs=float((hp[:, party] <= 0).sum(axis=1).mean()),
+    )
+    return result
+
+
+def _simulate_job(job):
+    key, combatants, fights, seed = job
+    return key, simulate_fights(combatants, fights, seed=seed)
+
+
+def simulate_rosters(rosters, fights=1000, processes=1, seed=None):
+    """
+    Simulate several rosters, ``{key: [Combatant, ...]}``.
+
+    With ``processes`` above 1 the rosters are spread over a process pool, so
+    a whole chapter is simulated in parallel. Each roster gets its own seed
+    spawned from ``seed`` so results are reproducible either way.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(rosters))
+    jobs = [
+        (key, combatants, fights, child_seed)
+        for (key, combatants), child_seed in zip(rosters.items(), seeds)
+    ]
+    if processes and processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return dict(pool.map(_simulate_job, jobs))
+    return dict(_simulate_job(job) for job in jobs)
+
+
+def chapter_rosters(chapter):
+    """Combatants for every encounter in a chapter, keyed by encounter id"""
+    from ..models import CharacterSummary, Enemy
+
+    party = [
+        character_combatant(character)
+        for character in CharacterSummary.objects.filter(campaign_id=chapter.campaign_id, alive=True)
+    ]
+    rosters = {encounter_id: list(party) for encounter_id in chapter.encounters.values_list('pk', flat=True)}
+    links = Enemy.encounters.through.objects.filter(
+        encounter__chapter=chapter
+    ).select_related('enemy')
+    for link in links:
+        rosters[link.encounter_id].append(enemy_combatant(link.enemy))
+    return rosters
+
+
+def simulate_chapter(chapter, fights=1000, processes=1, seed=None):
+    """Simulate every encounter in a chapter, returning ``{encounter_id: result}``"""
+    return simulate_rosters(chapter_rosters(chapter), fights, processes, seed)
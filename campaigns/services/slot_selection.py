@@ -0,0 +1,131 @@
+"""
+Atomic slot selection for player availability.
+
+Every selected slot is an ``AvailabilitySlot`` row, so selecting a slot is
+an insert and clearing it is a delete: a click never rewrites the player's
+other choices. Each write first touches the player's ``PlayerAvailability``
+row, which serializes writers for that player (a row lock on PostgreSQL,
+the database write lock on SQLite) before the current selection is read.
+``availability_data`` is then rebuilt from the rows inside the same
+transaction and stored with a single UPDATE, so pages that read the JSON
+always see the last committed selection. The schedule's heatmap is
+patched with the net change in the same transaction.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+
+from .heatmap import record_slot_changes
+
+
+def _lock(availability):
+    """Serialize writers for one player by updating their row first"""
+    from ..models import PlayerAvailability
+
+    PlayerAvailability.objects.filter(pk=availability.pk).update(updated_at=timezone.now())
+
+
+def _selected_keys(availability, dates=None):
+    from ..models import AvailabilitySlot
+
+    rows = AvailabilitySlot.objects.filter(availability=availability)
+    if dates is not None:
+        rows = rows.filter(date__in=[date.fromisoformat(date_str) for date_str in dates])
+    return {(day.isoformat(), label) for day, label in rows.values_list("date", "time_slot")}
+
+
+def _write_keys(availability, added, removed):
+    from ..models import AvailabilitySlot
+
+    AvailabilitySlot.objects.bulk_create(
+        [
+            AvailabilitySlot(availability=availability, date=date.fromisoformat(date_str), time_slot=label)
+            for date_str, label in added
+        ],
+        ignore_conflicts=True,
+    )
+    removed_by_date = defaultdict(list)
+    for date_str, label in removed:
+        removed_by_date[date_str].append(label)
+    for date_str, labels in removed_by_date.items():
+        AvailabilitySlot.objects.filter(
+            availability=availability, date=date.fromisoformat(date_str), time_slot__in=labels
+        ).delete()
+
+
+def _store_availability_data(availability):
+    """Rebuild ``availability_data`` from the slot rows and write only that field"""
+    from ..models import PlayerAvailability
+
+    data = {}
+    for date_str, label in sorted(_selected_keys(availability)):
+        data.setdefault(date_str, []).append(label)
+    PlayerAvailability.objects.filter(pk=availability.pk).update(availability_data=data)
+    availability.availability_data = data
+    return data
+
+
+def apply_slot_changes(availability, changes):
+    """
+    Apply ``(date_str, label, selected)`` changes for one player atomically.
+
+    ``selected=None`` flips the slot. Changes are applied in order, so a
+    batch that selects and then clears a slot leaves it cleared. Returns the
+    net changes as ``(date_str, label, selected)`` tuples, sorted.
+    """
+    changes = list(changes)
+    if not changes:
+        return []
+
+    with transaction.atomic():
+        _lock(availability)
+        before = _selected_keys(availability, {date_str for date_str, _, _ in changes})
+        after = set(before)
+        for date_str, label, selected in changes:
+            key = (date_str, label)
+            if selected is None:
+                selected = key not in after
+            if selected:
+                after.add(key)
+            else:
+                after.discard(key)
+
+        added, removed = after - before, before - after
+        if added or removed:
+            _write_keys(availability, added, removed)
+            _store_availability_data(availability)
+            record_slot_changes(availability.session_schedule_id, availability.pk, added, removed)
+
+    return sorted(
+        [(date_str, label, True) for date_str, label in added]
+        + [(date_str, label, False) for date_str, label in removed]
+    )
+
+
+def toggle_slot(availability, date_str, label):
+    """Flip one slot, returning whether it is now selected"""
+    ((_, _, selected),) = apply_slot_changes(availability, [(date_str, label, None)])
+    return selected
+
+
+def sync_slot_rows(availability):
+    """
+    Make the slot rows match ``availability_data`` after the whole document
+    was saved, ignoring slots that aren't part of the schedule.
+    """
+    universe = availability.session_schedule.get_slot_universe()
+    wanted = {
+        (date_str, label)
+        for date_str, labels in (availability.availability_data or {}).items()
+        for label in labels
+        if universe.bit_for(date_str, label) is not None
+    }
+    with transaction.atomic():
+        _lock(availability)
+        current = _selected_keys(availability)
+        if wanted != current:
+            added, removed = wanted - current, current - wanted
+            _write_keys(availability, added, removed)
+            record_slot_changes(availability.session_schedule_id, availability.pk, added, removed)
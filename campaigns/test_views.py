@@ -3,13 +3,17 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import Http404
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from unittest.mock import patch, MagicMock
 import json
 
 from campaigns.models import (
     Campaign, Chapter, Encounter, Location, NPC, 
-    CharacterSummary, SessionNote, ChatMessage, ChapterChatMessage
+    CharacterSummary, SessionNote, ChatMessage, ChapterChatMessage,
+    Enemy, CombatSession, StatusEffect
 )
+from campaigns.services.combat import CombatRosterBuilder
 
 
 class BaseViewTestCase(TestCase):
@@ -857,3 +861,78 @@ class ConcurrencyTest(BaseViewTestCase):
         # Check they have different content
         contents = [note.content for note in notes]
         self.assertEqual(len(set(contents)), 3)  # All unique
+
+
+class CombatSessionDetailViewTest(BaseViewTestCase):
+    """Test the combat tracker page"""
+    
+    def setUp(self):
+        super().setUp()
+        self.enemy = Enemy.objects.create(
+            campaign=self.campaign, name='Goblin', armor_class=15, hit_points=8,
+            speed='30 ft.', challenge_rating='1/4', owner=self.user1
+        )
+        self.client.login(username='testuser1', password='testpass123')
+    
+    def create_combat(self, enemy_count):
+        combat_session = CombatSession.objects.create(
+            encounter=self.encounter, name=f'{enemy_count} goblins', owner=self.user1, status='active'
+        )
+        participants = CombatRosterBuilder(combat_session).add_enemy(self.enemy, enemy_count).build()
+        for participant in participants:
+            StatusEffect.objects.create(participant=participant, name='Frightened', rounds_remaining=2)
+            participant.take_damage(5)
+        return combat_session
+    
+    def detail_url(self, combat_session):
+        return reverse('campaigns:combat_session_detail', kwargs={
+            'campaign_id': self.campaign.id,
+            'chapter_id': self.chapter.id,
+            'encounter_id': self.encounter.id,
+            'session_id': combat_session.id,
+        })
+    
+    def test_detail_view_context(self):
+        """Test current and bloodied participants are derived from the loaded rows"""
+        combat_session = self.create_combat(3)
+        
+        response = self.client.get(self.detail_url(combat_session))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['current_participant'], response.context['participants'][0])
+        self.assertEqual(len(response.context['bloodied_participants']), 3)
+        self.assertContains(response, 'Frightened (2)', count=3)
+    
+    def test_detail_view_query_count_is_constant(self):
+        """Test the number of queries does not grow with the number of participants"""
+        small = self.create_combat(2)
+        large = self.create_combat(20)
+        
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.get(self.detail_url(small))
+        with self.assertNumQueries(len(small_queries.captured_queries)):
+            self.client.get(self.detail_url(large))
+
+
+class ChapterDifficultyViewTest(BaseViewTestCase):
+    """Test computed encounter difficulty on the chapter page"""
+    
+    def test_chapter_detail_shows_encounter_difficulty(self):
+        """Test each encounter is scored against the campaign's party"""
+        goblin = Enemy.objects.create(
+            campaign=self.campaign, name='Goblin', armor_class=15, hit_points=7,
+            speed='30 ft.', challenge_rating='1/4', owner=self.user1
+        )
+        self.encounter.enemies.add(goblin)
+        self.client.login(username='testuser1', password='testpass123')
+        
+        response = self.client.get(reverse('campaigns:chapter_detail', kwargs={
+            'campaign_id': self.campaign.id,
+            'chapter_id': self.chapter.id,
+        }))
+        
+        self.assertEqual(response.status_code, 200)
+        difficulty = response.context['encounters'][0].difficulty
+        self.assertEqual(difficulty['monster_count'], 1)
+        self.assertEqual(difficulty['base_xp'], 50)
+        self.assertContains(response, 'adjusted XP')
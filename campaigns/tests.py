@@ -1,17 +1,47 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from unittest.mock import patch, MagicMock
+import io
 import json
+import shutil
+import tempfile
+import time
+import zipfile
 from datetime import date, timedelta
 
 from campaigns.models import (
     Campaign, Chapter, Encounter, Location, NPC, 
-    CharacterSummary, SessionNote, ChatMessage, ChapterChatMessage
+    CharacterSummary, SessionNote, ChatMessage, ChapterChatMessage,
+    Enemy, CombatSession, CombatParticipant, StatusEffect, CombatAction,
+    CombatEvent, CombatSnapshot, SessionSchedule, PlayerAvailability,
+    AvailabilitySlot, LLMJob, CachedLLMResponse, LLMUsage, ExportSection, AdventurePDF
 )
 from campaigns.services.llm import generate_session_summary
+from campaigns.services.difficulty import (
+    campaign_encounter_difficulties, challenge_rating_xp,
+    encounter_multiplier, score_encounter
+)
+from campaigns.services.availability import AvailabilityIndex, SlotIndex
+from campaigns.services.scheduling import SessionSolver
+from campaigns.services.slot_selection import apply_slot_changes
+from campaigns.services.heatmap import build_heatmap
+from campaigns.services.archive import ArchiveError, campaign_archive, campaign_records, import_campaign
+from campaigns.services.export import campaign_markdown, encounter_markdown
+from campaigns.services.jobs import HANDLERS, claim_job, enqueue, requeue_stale_jobs, run_job, run_pending
+from campaigns.services import pdf_ingest
+from campaigns.services import llm
+from campaigns.services.llm import FakeLLMClient
+from campaigns.services.dice import DiceExpressionError, compile_dice, roll_many
+from campaigns.services.simulation import (
+    character_combatant, enemy_combatant, simulate_chapter, simulate_fights
+)
+from campaigns.views.combat import combat_event_stream
 
 
 class BaseTestCase(TestCase):
@@ -697,4 +727,2121 @@ class ModelMethodTest(BaseTestCase):
         # Test Chapter URL
         chapter_url = self.chapter.get_absolute_url()
         expected_chapter_url = reverse('campaigns:chapter_detail', args=[self.chapter.id])
-        self.assertEqual(chapter_url, expected_chapter_url)
\ No newline at end of file
+        self.assertEqual(chapter_url, expected_chapter_url)
+
+
+class CombatTestCase(TestCase):
+    """Base test case with a small combat encounter"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Combat Campaign', owner=self.user)
+        self.chapter = Chapter.objects.create(
+            campaign=self.campaign, order=1, title='Ambush', owner=self.user
+        )
+        self.encounter = Encounter.objects.create(
+            chapter=self.chapter, title='Goblin Ambush', summary='Goblins attack', owner=self.user
+        )
+        self.goblin = Enemy.objects.create(
+            campaign=self.campaign, name='Goblin', armor_class=15, hit_points=7,
+            speed='30 ft.', dexterity=14, challenge_rating='1/4', owner=self.user
+        )
+        self.combat_session = CombatSession.objects.create(
+            encounter=self.encounter, name='Ambush Combat', owner=self.user
+        )
+    
+    def add_participants(self, count):
+        participants = []
+        for index in range(count):
+            participants.append(CombatParticipant.objects.create(
+                combat_session=self.combat_session,
+                participant_type='enemy',
+                enemy=self.goblin,
+                name=f'Goblin {index + 1}',
+                current_hp=7,
+                max_hp=7,
+                initiative_order=index,
+            ))
+        return participants
+
+
+class CombatTurnOrderTest(CombatTestCase):
+    """Test the initiative ring used for turn advancement"""
+    
+    def test_next_turn_wraps_into_new_round(self):
+        """Test turns advance in initiative order and wrap to the next round"""
+        participants = self.add_participants(3)
+        
+        self.assertEqual(self.combat_session.get_current_participant(), participants[0])
+        self.combat_session.next_turn()
+        self.assertEqual(self.combat_session.get_current_participant(), participants[1])
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        
+        self.assertEqual(self.combat_session.current_round, 2)
+        self.assertEqual(self.combat_session.get_current_participant(), participants[0])
+    
+    def test_next_turn_does_not_query_participants(self):
+        """Test advancing a turn is one event insert and one session update"""
+        self.add_participants(10)
+        self.combat_session.get_initiative_ring()
+        self.combat_session.ensure_snapshot()
+        
+        with self.assertNumQueries(2):
+            self.combat_session.next_turn()
+        with self.assertNumQueries(1):
+            self.combat_session.get_current_participant()
+    
+    def test_new_round_does_not_replay_the_log(self):
+        """Test wrapping into a new round is an insert, an effects read and a save, with no replay"""
+        first, second = self.add_participants(2)
+        self.combat_session.ensure_snapshot()
+        self.combat_session.next_turn()
+        with self.assertNumQueries(3) as short:
+            self.combat_session.next_turn()
+        
+        for _ in range(50):
+            first.heal(1)
+        self.combat_session.next_turn()
+        with self.assertNumQueries(len(short.captured_queries)):
+            self.combat_session.next_turn()
+        self.assertEqual(self.combat_session.current_round, 3)
+    
+    def test_downed_participant_leaves_turn_order(self):
+        """Test a participant at 0 HP is skipped without moving the current turn"""
+        participants = self.add_participants(3)
+        self.combat_session.next_turn()
+        
+        participants[0].take_damage(10)
+        self.combat_session.refresh_from_db()
+        
+        self.assertEqual(self.combat_session.get_current_participant(), participants[1])
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        self.assertEqual(self.combat_session.current_round, 2)
+        self.assertEqual(self.combat_session.get_current_participant(), participants[1])
+    
+    def test_healed_participant_rejoins_turn_order(self):
+        """Test reviving a participant puts them back in initiative order"""
+        participants = self.add_participants(3)
+        participants[0].take_damage(10)
+        self.combat_session.refresh_from_db()
+        self.combat_session.next_turn()
+        self.assertEqual(self.combat_session.get_current_participant(), participants[2])
+        
+        participants[0].heal(3)
+        self.combat_session.refresh_from_db()
+        
+        self.assertEqual(self.combat_session.get_current_participant(), participants[2])
+        self.combat_session.next_turn()
+        self.assertEqual(self.combat_session.get_current_participant(), participants[0])
+
+
+class CombatInitiativeTest(CombatTestCase):
+    """Test batched initiative rolling"""
+    
+    def test_roll_initiative_orders_participants(self):
+        """Test every enemy gets a roll and a unique initiative order"""
+        self.add_participants(5)
+        self.combat_session.roll_initiative()
+        
+        participants = list(self.combat_session.participants.order_by('initiative_order'))
+        self.assertTrue(self.combat_session.initiative_rolled)
+        self.assertEqual([p.initiative_order for p in participants], list(range(5)))
+        rolls = [p.initiative_roll for p in participants]
+        self.assertTrue(all(3 <= roll <= 22 for roll in rolls))
+        self.assertEqual(rolls, sorted(rolls, reverse=True))
+    
+    def test_roll_initiative_constant_query_count(self):
+        """Test rolling for a large encounter costs the same queries as a small one"""
+        self.add_participants(3)
+        with self.assertNumQueries(5) as small:
+            self.combat_session.roll_initiative()
+        
+        self.combat_session.participants.all().delete()
+        self.combat_session.initiative_rolled = False
+        self.add_participants(35)
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.combat_session.roll_initiative()
+
+
+class CombatRosterTest(CombatTestCase):
+    """Test bulk creation of combat participants"""
+    
+    def test_roster_spawns_numbered_copies_in_one_insert(self):
+        """Test spawning several copies of an enemy numbers them without extra queries"""
+        from campaigns.services.combat import CombatRosterBuilder
+        
+        roster = CombatRosterBuilder(self.combat_session).add_enemy(self.goblin, 2)
+        with self.assertNumQueries(3) as small:
+            roster.build()
+        
+        self.combat_session.participants.all().delete()
+        roster = CombatRosterBuilder(self.combat_session).add_enemy(self.goblin, 12)
+        with self.assertNumQueries(len(small.captured_queries)):
+            roster.build()
+        
+        names = set(self.combat_session.participants.values_list('name', flat=True))
+        self.assertEqual(names, {f'Goblin {n}' for n in range(1, 13)})
+    
+    def test_create_view_uses_enemy_counts(self):
+        """Test the create view spawns the requested number of each enemy"""
+        self.encounter.enemies.add(self.goblin)
+        CharacterSummary.objects.create(
+            campaign=self.campaign, player_name='Sam', character_name='Aria',
+            race='Elf', current_hit_points=24
+        )
+        self.client.login(username='dm', password='testpass123')
+        url = reverse('campaigns:combat_session_create', kwargs={
+            'campaign_id': self.campaign.id,
+            'chapter_id': self.chapter.id,
+            'encounter_id': self.encounter.id,
+        })
+        
+        self.assertContains(self.client.get(url), f'name="enemy_count_{self.goblin.id}"')
+        response = self.client.post(url, {'name': 'Big Fight', f'enemy_count_{self.goblin.id}': 3})
+        
+        self.assertEqual(response.status_code, 302)
+        combat_session = CombatSession.objects.get(name='Big Fight')
+        self.assertEqual(combat_session.participants.filter(participant_type='enemy').count(), 3)
+        self.assertTrue(combat_session.participants.filter(name='Aria', max_hp=24).exists())
+    
+    def test_roster_rolls_hit_points_from_hit_dice(self):
+        """Test rolled HP stays within the hit dice range and falls back when unparseable"""
+        from campaigns.services.combat import CombatRosterBuilder
+        
+        self.goblin.hit_dice = '2d6'
+        participants = CombatRosterBuilder(self.combat_session).add_enemy(
+            self.goblin, 20, roll_hit_points=True
+        ).build()
+        for participant in participants:
+            self.assertTrue(2 <= participant.max_hp <= 12)
+            self.assertEqual(participant.current_hp, participant.max_hp)
+        
+        self.goblin.hit_dice = 'lots'
+        participants = CombatRosterBuilder(self.combat_session).add_enemy(
+            self.goblin, 2, roll_hit_points=True
+        ).build()
+        self.assertEqual([p.max_hp for p in participants], [7, 7])
+
+
+class CombatRoundAdvanceTest(CombatTestCase):
+    """Test ticking status effects for a whole round"""
+    
+    def test_advance_round_applies_effects_in_bulk(self):
+        """Test damage, healing and expiry are applied and logged"""
+        goblin, troll = self.add_participants(2)
+        StatusEffect.objects.create(participant=goblin, name='Poisoned', auto_damage_per_turn=3, rounds_remaining=2)
+        StatusEffect.objects.create(participant=goblin, name='Burning', auto_damage_per_turn=2, rounds_remaining=1)
+        troll.current_hp = 2
+        troll.save()
+        StatusEffect.objects.create(participant=troll, name='Regeneration', auto_healing_per_turn=4)
+        
+        self.combat_session.advance_round()
+        
+        goblin.refresh_from_db()
+        troll.refresh_from_db()
+        self.assertEqual(goblin.current_hp, 2)
+        self.assertEqual(troll.current_hp, 6)
+        self.assertEqual(
+            set(StatusEffect.objects.values_list('name', 'rounds_remaining')),
+            {('Poisoned', 1), ('Regeneration', None)}
+        )
+        self.assertEqual(CombatAction.objects.filter(action_type='damage').count(), 2)
+        self.assertEqual(CombatAction.objects.filter(action_type='heal').count(), 1)
+        self.assertTrue(CombatAction.objects.filter(description='Burning wears off').exists())
+    
+    def test_advance_round_constant_query_count(self):
+        """Test the number of queries does not grow with the number of effects"""
+        for participant in self.add_participants(3):
+            StatusEffect.objects.create(participant=participant, name='Bleeding', auto_damage_per_turn=1, rounds_remaining=1)
+        self.combat_session.ensure_snapshot()
+        with self.assertNumQueries(7) as few:
+            self.combat_session.advance_round()
+        
+        for participant in self.add_participants(20):
+            StatusEffect.objects.create(participant=participant, name='Bleeding', auto_damage_per_turn=1, rounds_remaining=1)
+        with self.assertNumQueries(len(few.captured_queries)):
+            self.combat_session.advance_round()
+    
+    def test_effects_tick_when_round_wraps(self):
+        """Test a participant killed by an effect drops out of the turn order"""
+        goblin, archer = self.add_participants(2)
+        StatusEffect.objects.create(participant=goblin, name='Poisoned', auto_damage_per_turn=10)
+        
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        
+        goblin.refresh_from_db()
+        self.assertFalse(goblin.is_active)
+        self.assertEqual(self.combat_session.current_round, 2)
+        self.assertEqual(self.combat_session.get_current_participant(), archer)
+
+
+class CombatEventLogTest(CombatTestCase):
+    """Test the append-only combat event log"""
+    
+    def setUp(self):
+        super().setUp()
+        self.goblin_one, self.goblin_two = self.add_participants(2)
+        self.combat_session.snapshot()
+    
+    def assertStateMatchesRows(self, state):
+        for participant in self.combat_session.participants.all():
+            saved = state['participants'][str(participant.pk)]
+            self.assertEqual(
+                (saved['hp'], saved['temp_hp'], saved['active']),
+                (participant.current_hp, participant.temp_hp, participant.is_active)
+            )
+    
+    def test_state_is_a_fold_over_events(self):
+        """Test folding the log gives the same state as the participant rows"""
+        self.goblin_one.add_temp_hp(3)
+        self.goblin_one.take_damage(5)
+        self.goblin_two.take_damage(9)
+        self.goblin_two.heal(2)
+        self.goblin_one.add_status_effect('Poisoned', auto_damage_per_turn=1, duration_rounds=2)
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        
+        state = self.combat_session.build_state()
+        
+        self.assertStateMatchesRows(state)
+        self.assertEqual(state['round'], 2)
+        self.assertEqual([e['rounds_remaining'] for e in state['effects'].values()], [1])
+    
+    def test_undo_restores_previous_state(self):
+        """Test undoing events rolls back damage and effects"""
+        self.goblin_one.take_damage(3)
+        self.goblin_one.take_damage(10)
+        effect = self.goblin_two.add_status_effect('Blessed', effect_type='buff')
+        
+        self.assertEqual(self.combat_session.undo_last_event().event_type, 'effect_add')
+        self.assertFalse(StatusEffect.objects.filter(pk=effect.pk).exists())
+        self.combat_session.undo_last_event()
+        
+        self.goblin_one.refresh_from_db()
+        self.assertEqual(self.goblin_one.current_hp, 4)
+        self.assertTrue(self.goblin_one.is_active)
+        self.assertEqual(self.combat_session.get_current_participant(), self.goblin_one)
+    
+    def test_undo_restores_expired_effect(self):
+        """Test undoing an expiry brings the effect back"""
+        effect = self.goblin_one.add_status_effect('Burning', auto_damage_per_turn=1, duration_rounds=1)
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        self.assertFalse(StatusEffect.objects.filter(pk=effect.pk).exists())
+        
+        self.combat_session.undo_last_event()
+        
+        self.assertEqual(StatusEffect.objects.get(pk=effect.pk).name, 'Burning')
+    
+    def test_replay_from_snapshot_is_bounded(self):
+        """Test long logs are compacted so rebuilds only replay the tail"""
+        for _ in range(250):
+            self.goblin_one.heal(1)
+        
+        self.combat_session.build_state()
+        self.assertEqual(CombatSnapshot.objects.filter(combat_session=self.combat_session).count(), 2)
+        
+        self.goblin_one.take_damage(2)
+        state = self.combat_session.build_state()
+        self.assertEqual(state['participants'][str(self.goblin_one.pk)]['hp'], 5)
+        self.assertEqual(len(list(self.combat_session.replay())), 251)
+
+
+
+class CombatUndoTest(CombatTestCase):
+    """Test undo keeps the turn order in step with the restored rows"""
+    
+    def test_first_event_takes_the_baseline_snapshot(self):
+        """Test a session without a snapshot gets one before its first event"""
+        goblin, = self.add_participants(1)
+        self.assertFalse(self.combat_session.snapshots.exists())
+        
+        goblin.take_damage(3)
+        
+        self.assertEqual(self.combat_session.snapshots.get().state['participants'][str(goblin.pk)]['hp'], 7)
+        self.combat_session.undo_last_event()
+        goblin.refresh_from_db()
+        self.assertEqual(goblin.current_hp, 7)
+    
+    def test_undo_keeps_turn_after_unlogged_shift(self):
+        """Test undoing an event after someone drops leaves the turn where it was"""
+        first, second, third, fourth = self.add_participants(4)
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        first.take_damage(10)
+        third.take_damage(1)
+        self.combat_session.refresh_from_db()
+        self.assertEqual(self.combat_session.get_current_participant(), third)
+        
+        self.combat_session.undo_last_event()
+        self.assertEqual(self.combat_session.get_current_participant(), third)
+        self.combat_session.undo_last_event()
+        self.assertEqual(self.combat_session.get_current_participant(), third)
+        self.combat_session.undo_last_event()
+        self.assertEqual(self.combat_session.get_current_participant(), second)
+    
+    def test_undoing_a_drop_gives_the_turn_back(self):
+        """Test reviving the participant whose turn it was makes it their turn again"""
+        first, second = self.add_participants(2)
+        self.combat_session.next_turn()
+        second.take_damage(10)
+        self.combat_session.refresh_from_db()
+        self.assertEqual(self.combat_session.get_current_participant(), first)
+        
+        self.combat_session.undo_last_event()
+        
+        self.assertEqual(self.combat_session.get_current_participant(), second)
+    
+    def test_undoing_a_tick_removes_its_action(self):
+        """Test undoing a round's effect damage also takes its line out of the action log"""
+        goblin, archer = self.add_participants(2)
+        goblin.add_status_effect('Burning', auto_damage_per_turn=2)
+        self.combat_session.next_turn()
+        self.combat_session.next_turn()
+        self.assertEqual(CombatAction.objects.count(), 1)
+        
+        self.assertEqual(self.combat_session.undo_last_event().event_type, 'damage')
+        
+        self.assertFalse(CombatAction.objects.exists())
+        goblin.refresh_from_db()
+        self.assertEqual(goblin.current_hp, 7)
+        self.assertEqual(self.combat_session.undo_last_event().event_type, 'turn_advance')
+        self.assertEqual((self.combat_session.current_round, self.combat_session.get_current_participant()), (1, archer))
+    
+    def test_undo_without_snapshot_is_refused(self):
+        """Test events older than every snapshot are left alone"""
+        goblin, = self.add_participants(1)
+        event = CombatEvent.objects.create(
+            combat_session=self.combat_session, event_type='damage', participant=goblin,
+            round_number=1, payload={'amount': 3}
+        )
+        
+        self.assertIsNone(self.combat_session.undo_last_event())
+        self.assertTrue(CombatEvent.objects.filter(pk=event.pk).exists())
+        goblin.take_damage(2)
+        self.assertEqual(self.combat_session.undo_last_event().event_type, 'damage')
+        self.assertIsNone(self.combat_session.undo_last_event())
+
+@patch('campaigns.views.combat.STREAM_POLL_SECONDS', 0)
+@patch('campaigns.views.combat.STREAM_MAX_SECONDS', 0)
+class CombatStreamTest(CombatTestCase):
+    """Test the live combat tracker event stream"""
+    
+    def stream_url(self):
+        return reverse('campaigns:combat_session_stream', kwargs={
+            'campaign_id': self.campaign.id,
+            'chapter_id': self.chapter.id,
+            'encounter_id': self.encounter.id,
+            'session_id': self.combat_session.id,
+        })
+    
+    def read_stream(self, **headers):
+        self.client.login(username='dm', password='testpass123')
+        response = self.client.get(self.stream_url(), **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join(response.streaming_content).decode()
+    
+    def test_stream_sends_deltas_after_cursor(self):
+        """Test HP, turn and action changes since Last-Event-ID are pushed"""
+        goblin, archer = self.add_participants(2)
+        StatusEffect.objects.create(participant=archer, name='Bleeding', auto_damage_per_turn=2)
+        self.combat_session.next_turn()
+        goblin.take_damage(3)
+        self.combat_session.next_turn()
+        
+        body = self.read_stream(HTTP_LAST_EVENT_ID='0-0')
+        
+        self.assertIn('event: participants', body)
+        self.assertIn('"hp":4', body)
+        self.assertIn('event: actions', body)
+        self.assertIn('Takes 2 damage from Bleeding', body)
+    
+    def test_new_stream_starts_from_current_state(self):
+        """Test a fresh tracker only receives changes made after it connected"""
+        goblin, _ = self.add_participants(2)
+        goblin.take_damage(3)
+        
+        body = self.read_stream()
+        
+        self.assertIn('event: hello', body)
+        self.assertNotIn('event: participants', body)
+    
+    def test_turn_delta_does_not_save_a_dropped_ring(self):
+        """Test a turn change read by the stream leaves a dropped ring unsaved"""
+        self.add_participants(2)
+        stream = combat_event_stream(self.combat_session)
+        next(stream)
+        next(stream)
+        
+        self.combat_session.next_turn()
+        CombatSession.objects.filter(pk=self.combat_session.pk).update(
+            initiative_ring=None, updated_at=timezone.now()
+        )
+        body = ''.join(stream)
+        
+        self.assertIn('event: turn', body)
+        self.combat_session.refresh_from_db()
+        self.assertIsNone(self.combat_session.initiative_ring)
+    
+    def test_stream_requires_owner(self):
+        """Test other users cannot subscribe to a combat session"""
+        User.objects.create_user(username='intruder', password='testpass123')
+        self.client.login(username='intruder', password='testpass123')
+        
+        response = self.client.get(self.stream_url())
+        self.assertNotEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+
+
+class EncounterDifficultyTest(CombatTestCase):
+    """Test the encounter XP budget engine"""
+    
+    def add_party(self, *levels):
+        for index, level in enumerate(levels):
+            CharacterSummary.objects.create(
+                campaign=self.campaign, player_name=f'Player {index}',
+                character_name=f'Hero {index}', race='Human', level=level
+            )
+    
+    def test_challenge_rating_lookup(self):
+        """Test fractional and decimal CR strings share the same XP values"""
+        self.assertEqual(challenge_rating_xp('1/4'), 50)
+        self.assertEqual(challenge_rating_xp('0.25'), 50)
+        self.assertEqual(challenge_rating_xp('CR 5'), 1800)
+        self.assertEqual(challenge_rating_xp('unknown'), 0)
+    
+    def test_multiplier_adjusts_for_party_size(self):
+        """Test small parties step up and large parties step down the ladder"""
+        self.assertEqual(encounter_multiplier(1, 4), 1)
+        self.assertEqual(encounter_multiplier(4, 4), 2)
+        self.assertEqual(encounter_multiplier(4, 2), 2.5)
+        self.assertEqual(encounter_multiplier(1, 6), 0.5)
+        self.assertEqual(encounter_multiplier(20, 2), 5)
+    
+    def test_score_encounter(self):
+        """Test a roster is rated against the party's thresholds"""
+        result = score_encounter(['1/4'] * 4, [1, 1, 1, 1])
+        
+        self.assertEqual(result['base_xp'], 200)
+        self.assertEqual(result['adjusted_xp'], 400)
+        self.assertEqual(result['thresholds']['deadly'], 400)
+        self.assertEqual(result['rating'], 'deadly')
+        self.assertEqual(result['danger_level'], 'deadly')
+        self.assertIsNone(score_encounter([], [1, 1]))
+        self.assertIsNone(score_encounter(['1'], [])['rating'])
+    
+    def test_difficulty_is_cached_and_invalidated_on_roster_change(self):
+        """Test the roster budget is cached and cleared when enemies change"""
+        self.add_party(3, 3, 3, 3)
+        self.encounter.enemies.add(self.goblin)
+        
+        self.assertEqual(self.encounter.get_difficulty()['rating'], 'trivial')
+        self.encounter.refresh_from_db()
+        self.assertEqual(self.encounter.difficulty_cache, {'monster_count': 1, 'base_xp': 50})
+        
+        ogre = Enemy.objects.create(
+            campaign=self.campaign, name='Ogre', armor_class=11, hit_points=59,
+            speed='40 ft.', challenge_rating='2', owner=self.user
+        )
+        ogre.encounters.add(self.encounter)
+        self.encounter.refresh_from_db()
+        self.assertIsNone(self.encounter.difficulty_cache)
+        self.assertEqual(self.encounter.get_difficulty()['base_xp'], 500)
+        
+        ogre.challenge_rating = '5'
+        ogre.save()
+        self.encounter.refresh_from_db()
+        self.assertIsNone(self.encounter.difficulty_cache)
+        self.assertEqual(self.encounter.get_difficulty()['rating'], 'deadly')
+    
+    def test_campaign_batch_scores_all_encounters_in_fixed_queries(self):
+        """Test batch scoring does not issue a query per encounter"""
+        self.add_party(1, 1)
+        for index in range(5):
+            encounter = Encounter.objects.create(
+                chapter=self.chapter, title=f'Wave {index}', summary='More goblins',
+                owner=self.user, order=index + 2
+            )
+            encounter.enemies.add(self.goblin)
+        
+        # Party levels, encounters, roster rows, bulk update
+        with self.assertNumQueries(4):
+            results = campaign_encounter_difficulties(self.campaign.id)
+        self.assertEqual(len(results), 6)
+        self.assertIsNone(results[self.encounter.id])
+        
+        # Cached budgets skip the roster query and the update
+        with self.assertNumQueries(2):
+            results = campaign_encounter_difficulties(self.campaign.id)
+        self.assertEqual(
+            {result['rating'] for result in results.values() if result}, {'easy'}
+        )
+
+
+class CombatSimulationTest(CombatTestCase):
+    """Test the Monte Carlo combat simulator"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hero = CharacterSummary.objects.create(
+            campaign=self.campaign, player_name='Player', character_name='Hero',
+            race='Human', level=5, armor_class=18, maximum_hit_points=44
+        )
+    
+    def test_enemy_attack_is_read_from_actions(self):
+        """Test the first weapon attack and multiattack are parsed from the stat block"""
+        self.goblin.actions = (
+            "Multiattack. The goblin makes two attacks.\n"
+            "Scimitar. Melee Weapon Attack: +4 to hit, reach 5 ft., one target. "
+            "Hit: 5 (1d6 + 2) slashing damage."
+        )
+        combatant = enemy_combatant(self.goblin)
+        
+        self.assertEqual(combatant.attack_bonus, 4)
+        self.assertEqual(combatant.attacks, 2)
+        self.assertEqual((combatant.dice_count, combatant.dice_size, combatant.damage_bonus), (1, 6, 2))
+    
+    def test_simulation_reports_outcomes(self):
+        """Test lopsided fights produce the expected outcomes"""
+        hero = character_combatant(self.hero)
+        goblin = enemy_combatant(self.goblin)
+        
+        easy = simulate_fights([hero, hero, hero, goblin], fights=500, seed=1)
+        self.assertEqual(easy['fights'], 500)
+        self.assertEqual(easy['win_rate'], 1.0)
+        self.assertGreaterEqual(easy['expected_rounds'], 1)
+        
+        hopeless = simulate_fights([hero] + [goblin] * 30, fights=500, seed=1)
+        self.assertLess(hopeless['win_rate'], 0.5)
+        self.assertGreater(hopeless['expected_pc_downs'], 0.5)
+    
+    def test_simulation_is_reproducible_with_seed(self):
+        """Test seeded runs give identical results"""
+        combatants = [character_combatant(self.hero)] + [enemy_combatant(self.goblin)] * 6
+        
+        self.assertEqual(
+            simulate_fights(combatants, fights=200, seed=7),
+            simulate_fights(combatants, fights=200, seed=7),
+        )
+    
+    def test_simulate_chapter(self):
+        """Test every encounter in a chapter is simulated, in parallel or not"""
+        self.encounter.enemies.add(self.goblin)
+        Encounter.objects.create(
+            chapter=self.chapter, title='Empty Room', summary='Nothing here', owner=self.user, order=2
+        )
+        
+        serial = simulate_chapter(self.chapter, fights=100, seed=3)
+        parallel = simulate_chapter(self.chapter, fights=100, processes=2, seed=3)
+        
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial), 2)
+        self.assertEqual(serial[self.encounter.id]['win_rate'], 1.0)
+
+
+class DiceEngineTest(TestCase):
+    """Test dice expression parsing, rolling and distributions"""
+    
+    def test_compiled_plans_are_cached(self):
+        """Test the same expression compiles to the same plan"""
+        self.assertIs(compile_dice('2d8+2'), compile_dice('2d8+2'))
+    
+    def test_rolls_stay_in_range(self):
+        """Test batched rolls respect each expression's bounds"""
+        for expression, low, high in (
+            ('2d8+2', 4, 18), ('4d6kh3', 3, 18), ('d20 adv', 1, 20), ('1d8+1d6-1', 1, 13), ('d%', 1, 100)
+        ):
+            plan = compile_dice(expression)
+            self.assertEqual((plan.minimum, plan.maximum), (low, high))
+            totals = plan.roll(2000)
+            self.assertGreaterEqual(totals.min(), low)
+            self.assertLessEqual(totals.max(), high)
+    
+    def test_roll_many_keeps_order(self):
+        """Test mixed expressions come back in the order they were given"""
+        totals = roll_many(['5', '1d4+10', '5', '-2'])
+        self.assertEqual(totals[0], 5)
+        self.assertTrue(11 <= totals[1] <= 14)
+        self.assertEqual(totals[2:], [5, -2])
+    
+    def test_exact_distributions(self):
+        """Test distributions and expected values match the closed forms"""
+        self.assertAlmostEqual(compile_dice('2d6').distribution()[7], 6 / 36)
+        self.assertAlmostEqual(compile_dice('2d8+2').expected_value(), 11)
+        self.assertAlmostEqual(compile_dice('d20 adv').expected_value(), 13.825)
+        self.assertAlmostEqual(compile_dice('d20 dis').expected_value(), 7.175)
+        self.assertAlmostEqual(compile_dice('4d6kh3').expected_value(), 15869 / 1296)
+        self.assertAlmostEqual(sum(compile_dice('4d6dl1+1d4').distribution().values()), 1)
+    
+    def test_invalid_expressions(self):
+        """Test malformed notation raises DiceExpressionError"""
+        for expression in ('', '2d', 'd0', '2d6+', 'fireball', '2d6kh3', '3d20 adv'):
+            with self.assertRaises(DiceExpressionError):
+                compile_dice(expression)
+
+
+class SchedulingTestCase(TestCase):
+    """Base test case with a three-day availability poll (Friday to Sunday)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Scheduling Campaign', owner=self.user)
+        self.schedule = SessionSchedule.objects.create(
+            campaign=self.campaign, owner=self.user,
+            date_range_start=date(2030, 1, 4), date_range_end=date(2030, 1, 6),
+        )
+    
+    def respond(self, name, availability_data):
+        return PlayerAvailability.objects.create(
+            session_schedule=self.schedule, player_name=name,
+            email=f'{name.lower()}@example.com', availability_data=availability_data
+        )
+
+
+class AvailabilityIndexTest(SchedulingTestCase):
+    """Test the bitset availability index"""
+    
+    def build_index(self):
+        slot_index = SlotIndex(self.schedule.get_all_time_slots_by_date())
+        responses = list(self.schedule.player_availabilities.all())
+        return AvailabilityIndex(slot_index, responses)
+    
+    def test_encode_round_trips_and_ignores_unknown_slots(self):
+        """Test availability data survives encoding, minus slots outside the schedule"""
+        slot_index = SlotIndex(self.schedule.get_all_time_slots_by_date())
+        data = {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00', '13:00 - 16:00']}
+        
+        mask = slot_index.encode(dict(data, **{'2030-02-01': ['19:00 - 22:00']}))
+        
+        self.assertEqual(mask.bit_count(), 3)
+        self.assertEqual(slot_index.decode(mask), data)
+    
+    def test_popular_slots_and_everyone_available(self):
+        """Test slots are ranked by head-count and the common slots are found"""
+        self.respond('Ana', {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00']})
+        self.respond('Ben', {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00']})
+        self.respond('Cy', {'2030-01-05': ['12:00 - 15:00', '19:00 - 22:00']})
+        index = self.build_index()
+        
+        popular = index.popular_slots()
+        self.assertEqual(
+            [(slot['date'], slot['time_slot'], slot['count']) for slot in popular],
+            [
+                (date(2030, 1, 5), '12:00 - 15:00', 3),
+                (date(2030, 1, 4), '19:00 - 22:00', 2),
+                (date(2030, 1, 5), '19:00 - 22:00', 1),
+            ]
+        )
+        self.assertEqual(popular[1]['players'], ['Ana', 'Ben'])
+        self.assertEqual(index.everyone_available(), [('2030-01-05', '12:00 - 15:00')])
+    
+    def test_detail_view_renders_grid_from_index(self):
+        """Test the organizer page shows each player's slots and the best options"""
+        self.respond('Ana', {'2030-01-04': ['19:00 - 22:00']})
+        self.respond('Ben', {'2030-01-04': ['19:00 - 22:00'], '2030-01-06': ['13:00 - 16:00']})
+        self.client.login(username='dm', password='testpass123')
+        
+        response = self.client.get(reverse('campaigns:session_schedule_detail', kwargs={
+            'campaign_id': self.campaign.id, 'schedule_id': self.schedule.id,
+        }))
+        
+        self.assertEqual(response.status_code, 200)
+        friday = response.context['availability_grid']['2030-01-04']['rows']
+        self.assertEqual([row['slot']['label'] for row in friday], ['19:00 - 22:00'])
+        self.assertEqual(friday[0]['cells'], [True, True])
+        self.assertEqual(response.context['popular_slots'][0]['count'], 2)
+        self.assertContains(response, '1 time slot works for everyone')
+
+
+class SlotUniverseTest(SchedulingTestCase):
+    """Test the shared, precomputed slot layout of a schedule"""
+    
+    def test_universe_is_shared_across_requests(self):
+        """Test reloading the schedule reuses the same precomputed universe"""
+        universe = self.schedule.get_slot_universe()
+        reloaded = SessionSchedule.objects.get(pk=self.schedule.pk)
+        
+        self.assertIs(reloaded.get_slot_universe(), universe)
+        self.assertEqual([day['day_name'] for day in universe.days], ['Friday', 'Saturday', 'Sunday'])
+        self.assertEqual(universe.bit_for('2030-01-04', '19:00 - 22:00'), 0)
+        with self.assertRaises(TypeError):
+            universe.days[0]['time_slots'][0]['label'] = 'changed'
+    
+    def test_editing_schedule_invalidates_universe(self):
+        """Test a configuration change builds a new universe"""
+        universe = self.schedule.get_slot_universe()
+        
+        self.schedule.slot_duration_hours = 4
+        self.schedule.slot_overlap_hours = 0
+        self.schedule.save()
+        edited = SessionSchedule.objects.get(pk=self.schedule.pk).get_slot_universe()
+        
+        self.assertIsNot(edited, universe)
+        self.assertEqual(
+            [slot['label'] for slot in edited.slots_by_date['2030-01-05']],
+            ['12:00 - 16:00', '16:00 - 20:00'],
+        )
+        self.assertIsNone(edited.bit_for('2030-01-04', '19:00 - 22:00'))
+    
+    def test_player_form_and_toggle_use_universe(self):
+        """Test the player form marks saved slots and the toggle rejects unknown ones"""
+        self.respond('Ana', {'2030-01-05': ['13:00 - 16:00']})
+        
+        response = self.client.get(
+            reverse('campaigns:player_availability', args=[self.schedule.shareable_token]),
+            {'email': 'ana@example.com'}
+        )
+        saturday = response.context['dates_with_slots'][1]
+        self.assertEqual(
+            [slot['label'] for slot in saturday['time_slots'] if slot['selected']], ['13:00 - 16:00']
+        )
+        
+        toggle_url = reverse('campaigns:toggle_time_slot', args=[self.schedule.shareable_token])
+        response = self.client.post(toggle_url, {
+            'email': 'ana@example.com', 'date': '2030-01-05', 'time_slot': '03:00 - 06:00'
+        })
+        self.assertContains(response, 'not part of this poll')
+        
+        self.client.post(toggle_url, {
+            'email': 'ana@example.com', 'date': '2030-01-04', 'time_slot': '19:00 - 22:00'
+        })
+        availability = PlayerAvailability.objects.get(email='ana@example.com')
+        self.assertEqual(availability.availability_data['2030-01-04'], ['19:00 - 22:00'])
+
+
+class SessionSolverTest(SchedulingTestCase):
+    """Test ranking session times with quorum and required players"""
+    
+    def build_solver(self):
+        return SessionSolver(self.schedule.get_slot_universe(), self.schedule.player_availabilities.all())
+    
+    def test_quorum_and_required_players(self):
+        """Test starts below quorum or missing a required player are dropped"""
+        self.respond('Ana', {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00']})
+        self.respond('Ben', {'2030-01-04': ['19:00 - 22:00']})
+        cy = self.respond('Cy', {'2030-01-05': ['12:00 - 15:00', '19:00 - 22:00']})
+        solver = self.build_solver()
+        
+        best = solver.best_times(quorum=2)
+        self.assertEqual([(c['date_str'], c['time_slot']) for c in best], [
+            ('2030-01-04', '19:00 - 22:00'), ('2030-01-05', '12:00 - 15:00'),
+        ])
+        self.assertEqual(best[0]['missing'], ['Cy'])
+        
+        best = solver.best_times(quorum=2, required=[cy.pk])
+        self.assertEqual([(c['date_str'], c['players']) for c in best], [('2030-01-05', ['Ana', 'Cy'])])
+    
+    def test_long_session_needs_covering_slots(self):
+        """Test a session longer than a slot counts players whose slots cover it"""
+        self.respond('Ana', {'2030-01-05': ['12:00 - 15:00', '13:00 - 16:00', '19:00 - 22:00']})
+        self.respond('Ben', {'2030-01-05': ['12:00 - 15:00']})
+        
+        best = self.build_solver().best_times(session_hours=4)
+        
+        self.assertEqual(len(best), 1)
+        self.assertEqual(best[0]['time_display'], '12:00 - 16:00')
+        self.assertEqual(best[0]['players'], ['Ana'])
+    
+    def test_recurring_series(self):
+        """Test start times are grouped into series and skipped dates are reported"""
+        every_day = {day: ['19:00 - 22:00'] for day in ('2030-01-04', '2030-01-05', '2030-01-06')}
+        self.respond('Ana', every_day)
+        self.respond('Ben', {'2030-01-05': ['19:00 - 22:00'], '2030-01-06': ['19:00 - 22:00']})
+        
+        series = self.build_solver().recurring(interval_days=1, quorum=2)
+        
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['start_time'].strftime('%H:%M'), '19:00')
+        self.assertEqual([session['date_str'] for session in series[0]['sessions']], ['2030-01-05', '2030-01-06'])
+        self.assertEqual(series[0]['skipped'], ['2030-01-04'])
+    
+    def test_detail_view_applies_constraints(self):
+        """Test the organizer page ranks times using the constraint form"""
+        self.respond('Ana', {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00']})
+        ben = self.respond('Ben', {'2030-01-05': ['12:00 - 15:00']})
+        self.respond('Cy', {'2030-01-04': ['19:00 - 22:00']})
+        self.client.login(username='dm', password='testpass123')
+        
+        url = reverse('campaigns:session_schedule_detail', args=[self.campaign.pk, self.schedule.pk])
+        response = self.client.get(url, {
+            'required_players': [ben.pk], 'repeat_every': '7',
+        })
+        
+        self.assertEqual(
+            [slot['date_str'] for slot in response.context['popular_slots']], ['2030-01-05']
+        )
+        self.assertEqual(response.context['recurring_series'][0]['skipped'], [])
+        self.assertContains(response, 'Missing:')
+
+
+class SlotSelectionTest(SchedulingTestCase):
+    """Test atomic slot toggling and the batched toggle endpoint"""
+    
+    def slot_rows(self, availability):
+        return [
+            (slot.date.isoformat(), slot.time_slot)
+            for slot in AvailabilitySlot.objects.filter(availability=availability)
+        ]
+    
+    def test_saved_document_creates_slot_rows(self):
+        """Test saving availability_data mirrors valid slots into rows"""
+        availability = self.respond('Ana', {
+            '2030-01-05': ['13:00 - 16:00', '12:00 - 15:00'], '2030-02-01': ['19:00 - 22:00'],
+        })
+        
+        self.assertEqual(self.slot_rows(availability), [
+            ('2030-01-05', '12:00 - 15:00'), ('2030-01-05', '13:00 - 16:00'),
+        ])
+    
+    def test_stale_writers_do_not_lose_updates(self):
+        """Test two writers holding stale copies both keep their change"""
+        self.respond('Ana', {'2030-01-05': ['12:00 - 15:00']})
+        first = PlayerAvailability.objects.get(email='ana@example.com')
+        second = PlayerAvailability.objects.get(email='ana@example.com')
+        
+        apply_slot_changes(first, [('2030-01-04', '19:00 - 22:00', True)])
+        changed = apply_slot_changes(second, [
+            ('2030-01-06', '19:00 - 22:00', None), ('2030-01-05', '12:00 - 15:00', False),
+        ])
+        
+        self.assertEqual(changed, [
+            ('2030-01-05', '12:00 - 15:00', False), ('2030-01-06', '19:00 - 22:00', True),
+        ])
+        availability = PlayerAvailability.objects.get(email='ana@example.com')
+        self.assertEqual(availability.availability_data, {
+            '2030-01-04': ['19:00 - 22:00'], '2030-01-06': ['19:00 - 22:00'],
+        })
+    
+    def test_toggle_endpoint_flips_one_slot(self):
+        """Test the single toggle selects, clears and keeps other slots"""
+        availability = self.respond('Ana', {'2030-01-05': ['12:00 - 15:00']})
+        url = reverse('campaigns:toggle_time_slot', args=[self.schedule.shareable_token])
+        data = {'email': 'ana@example.com', 'player_name': 'Ana B', 'date': '2030-01-05', 'time_slot': '13:00 - 16:00'}
+        
+        response = self.client.post(url, data)
+        self.assertContains(response, 'selected')
+        self.assertEqual(self.slot_rows(availability), [
+            ('2030-01-05', '12:00 - 15:00'), ('2030-01-05', '13:00 - 16:00'),
+        ])
+        
+        self.client.post(url, data)
+        availability.refresh_from_db()
+        self.assertEqual(availability.player_name, 'Ana B')
+        self.assertEqual(availability.availability_data, {'2030-01-05': ['12:00 - 15:00']})
+    
+    def test_batch_endpoint_applies_changes(self):
+        """Test many slot changes are applied in one request"""
+        url = reverse('campaigns:toggle_time_slots', args=[self.schedule.shareable_token])
+        changes = [
+            {'date': '2030-01-05', 'time_slot': '12:00 - 15:00', 'selected': True},
+            {'date': '2030-01-05', 'time_slot': '13:00 - 16:00', 'selected': True},
+            {'date': '2030-01-06', 'time_slot': '19:00 - 22:00', 'selected': True},
+            {'date': '2030-01-05', 'time_slot': '12:00 - 15:00', 'selected': False},
+        ]
+        
+        response = self.client.post(url, {
+            'email': 'cy@example.com', 'player_name': 'Cy', 'changes': json.dumps(changes),
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['selected'], {
+            '2030-01-05': ['13:00 - 16:00'], '2030-01-06': ['19:00 - 22:00'],
+        })
+        self.assertEqual(len(response.json()['changed']), 2)
+        availability = PlayerAvailability.objects.get(email='cy@example.com')
+        self.assertEqual(availability.player_name, 'Cy')
+        self.assertEqual(len(self.slot_rows(availability)), 2)
+    
+    def test_batch_endpoint_rejects_unknown_slots(self):
+        """Test a batch with a slot outside the poll changes nothing"""
+        url = reverse('campaigns:toggle_time_slots', args=[self.schedule.shareable_token])
+        changes = [
+            {'date': '2030-01-05', 'time_slot': '12:00 - 15:00', 'selected': True},
+            {'date': '2030-01-05', 'time_slot': '03:00 - 06:00', 'selected': True},
+        ]
+        
+        response = self.client.post(url, {'email': 'cy@example.com', 'changes': json.dumps(changes)})
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PlayerAvailability.objects.filter(email='cy@example.com').exists())
+    
+    def test_batch_endpoint_rejects_non_boolean_selection(self):
+        """Test a selected flag that is not a JSON boolean changes nothing"""
+        url = reverse('campaigns:toggle_time_slots', args=[self.schedule.shareable_token])
+        for selected in ('false', 1, 'yes'):
+            changes = [{'date': '2030-01-05', 'time_slot': '12:00 - 15:00', 'selected': selected}]
+            
+            response = self.client.post(url, {'email': 'cy@example.com', 'changes': json.dumps(changes)})
+            
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid slot changes'})
+        self.assertFalse(PlayerAvailability.objects.filter(email='cy@example.com').exists())
+
+
+class AvailabilityHeatmapTest(SchedulingTestCase):
+    """Test the materialized per-schedule availability heatmap"""
+    
+    def stored_heatmap(self):
+        return SessionSchedule.objects.get(pk=self.schedule.pk).availability_heatmap
+    
+    def test_heatmap_is_built_once_then_patched(self):
+        """Test toggles, renames and new respondents patch the stored heatmap"""
+        ana = self.respond('Ana', {'2030-01-05': ['12:00 - 15:00']})
+        self.assertIsNone(self.stored_heatmap())
+        
+        self.schedule.get_availability_heatmap()
+        self.assertEqual(self.stored_heatmap(), {
+            'respondents': [[ana.pk, 'Ana']], 'slots': {'2030-01-05': {'12:00 - 15:00': [ana.pk]}},
+        })
+        
+        token = self.schedule.shareable_token
+        self.client.post(reverse('campaigns:toggle_time_slots', args=[token]), {
+            'email': 'ben@example.com', 'player_name': 'Ben', 'changes': json.dumps([
+                {'date': '2030-01-05', 'time_slot': '12:00 - 15:00', 'selected': True},
+                {'date': '2030-01-04', 'time_slot': '19:00 - 22:00', 'selected': True},
+            ]),
+        })
+        self.client.post(reverse('campaigns:toggle_time_slot', args=[token]), {
+            'email': 'ana@example.com', 'date': '2030-01-05', 'time_slot': '12:00 - 15:00',
+        })
+        self.client.post(reverse('campaigns:save_player_info', args=[token]), {
+            'email': 'ana@example.com', 'player_name': 'Ana B',
+        })
+        
+        ben = PlayerAvailability.objects.get(email='ben@example.com')
+        heatmap = self.stored_heatmap()
+        self.assertEqual(heatmap, {
+            'respondents': [[ana.pk, 'Ana B'], [ben.pk, 'Ben']],
+            'slots': {'2030-01-04': {'19:00 - 22:00': [ben.pk]}, '2030-01-05': {'12:00 - 15:00': [ben.pk]}},
+        })
+        self.assertEqual(heatmap, build_heatmap(self.schedule.pk))
+    
+    def test_form_post_and_delete_patch_heatmap(self):
+        """Test whole-document saves and deleted responses keep the heatmap exact"""
+        ana = self.respond('Ana', {'2030-01-05': ['12:00 - 15:00']})
+        self.respond('Ben', {'2030-01-05': ['12:00 - 15:00', '13:00 - 16:00']})
+        self.schedule.get_availability_heatmap()
+        
+        self.client.post(reverse('campaigns:player_availability', args=[self.schedule.shareable_token]), {
+            'email': 'ana@example.com', 'player_name': 'Ana',
+            'times_2030-01-06': ['19:00 - 22:00'],
+        })
+        PlayerAvailability.objects.get(email='ben@example.com').delete()
+        
+        self.assertEqual(self.stored_heatmap(), {
+            'respondents': [[ana.pk, 'Ana']], 'slots': {'2030-01-06': {'19:00 - 22:00': [ana.pk]}},
+        })
+        self.assertEqual(self.stored_heatmap(), build_heatmap(self.schedule.pk))
+    
+    def test_detail_view_reads_heatmap(self):
+        """Test the organizer grid is rendered from the stored heatmap"""
+        self.respond('Ana', {'2030-01-04': ['19:00 - 22:00']})
+        self.respond('Ben', {'2030-01-04': ['19:00 - 22:00'], '2030-01-05': ['12:00 - 15:00']})
+        self.client.login(username='dm', password='testpass123')
+        url = reverse('campaigns:session_schedule_detail', args=[self.campaign.pk, self.schedule.pk])
+        
+        response = self.client.get(url)
+        
+        self.assertIsNotNone(self.stored_heatmap())
+        self.assertEqual([r.player_name for r in response.context['respondents']], ['Ana', 'Ben'])
+        friday = response.context['availability_grid']['2030-01-04']['rows'][0]
+        saturday = response.context['availability_grid']['2030-01-05']['rows'][0]
+        self.assertEqual(friday['cells'], [True, True])
+        self.assertEqual(saturday['cells'], [False, True])
+        self.assertEqual(response.context['everyone_available'], [('2030-01-04', '19:00 - 22:00')])
+
+
+class LLMJobQueueTest(TestCase):
+    """Test the database-backed queue for AI summaries and note compression"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Job Campaign', owner=self.user)
+        self.chapter = Chapter.objects.create(campaign=self.campaign, order=1, title='The Crypt', owner=self.user)
+        self.encounter = Encounter.objects.create(
+            chapter=self.chapter, title='Ghouls', type='combat', order=1, owner=self.user
+        )
+        self.note = SessionNote.objects.create(
+            encounter=self.encounter, owner=self.user,
+            content='- The party cleared the crypt\n- Mira lost her torch',
+        )
+        self.client.login(username='dm', password='testpass123')
+    
+    def note_url(self, name, **kwargs):
+        return reverse(f'campaigns:{name}', kwargs=dict(
+            campaign_id=self.campaign.pk, chapter_id=self.chapter.pk, encounter_id=self.encounter.pk, **kwargs
+        ))
+    
+    def test_summary_is_queued_then_written_by_worker(self):
+        """Test the view returns at once and the worker fills SessionNote.summary"""
+        url = self.note_url('encounter_note_summarize', note_id=self.note.pk)
+        
+        response = self.client.post(url)
+        self.client.post(url)
+        
+        job = LLMJob.objects.get()
+        self.assertEqual(job.status, 'queued')
+        self.assertContains(response, reverse('campaigns:llm_job_status', args=[job.pk]))
+        
+        with patch('campaigns.services.llm.client', FakeLLMClient()):
+            self.assertEqual(run_pending(), 1)
+        
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.summary, '- The party cleared the crypt\n- Mira lost her torch')
+        response = self.client.get(reverse('campaigns:llm_job_status', args=[job.pk]))
+        self.assertContains(response, 'AI Summary')
+        self.assertNotContains(response, 'hx-trigger')
+    
+    @override_settings(LLM_JOB_RETRY_DELAY=10)
+    def test_failed_attempt_backs_off_and_retries(self):
+        """Test a failed call is retried after the backoff delay"""
+        job = enqueue('session_summary', self.user, target=f'note:{self.note.pk}', note_id=self.note.pk)
+        
+        with patch('campaigns.services.llm.client', FakeLLMClient(failures=2)):
+            run_pending()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=9))
+            self.assertEqual(run_pending(), 0)
+            
+            LLMJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            run_pending()
+            job.refresh_from_db()
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=19))
+            
+            LLMJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            run_pending()
+        
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 3))
+    
+    def test_deleted_note_fails_without_retry(self):
+        """Test a job whose target is gone fails on its first attempt"""
+        job = enqueue('session_summary', self.user, target=f'note:{self.note.pk}', note_id=self.note.pk)
+        self.note.delete()
+        
+        with patch('campaigns.services.llm.client', FakeLLMClient()):
+            run_pending()
+        
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertIn('deleted', job.error)
+    
+    @override_settings(LLM_JOB_CONCURRENCY=1, LLM_JOB_LEASE_SECONDS=60)
+    def test_concurrency_limit_and_expired_leases(self):
+        """Test only the allowed number of jobs run and abandoned jobs are re-queued"""
+        enqueue('session_summary', self.user, target='note:1', note_id=1)
+        enqueue('session_summary', self.user, target='note:2', note_id=2)
+        
+        first = claim_job('worker-a')
+        self.assertIsNotNone(first)
+        self.assertIsNone(claim_job('worker-b'))
+        
+        LLMJob.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(LLMJob.objects.get(pk=first.pk).status, 'queued')
+        self.assertIsNotNone(claim_job('worker-b'))
+    
+    def test_run_that_lost_its_lease_keeps_quiet(self):
+        """Test a re-queued job's first run can't overwrite the run that replaced it"""
+        enqueue('session_summary', self.user, note_id=self.note.pk)
+        first = claim_job('worker')
+        LLMJob.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        requeue_stale_jobs()
+        second = claim_job('worker')
+        
+        with patch.dict(HANDLERS, {'session_summary': lambda job: f'attempt {job.attempts}'}):
+            self.assertFalse(run_job(first))
+            self.assertEqual(LLMJob.objects.get(pk=first.pk).status, 'running')
+            self.assertTrue(run_job(second))
+        
+        job = LLMJob.objects.get(pk=first.pk)
+        self.assertEqual((job.status, job.result), ('succeeded', 'attempt 2'))
+    
+    def test_compress_adds_combined_note(self):
+        """Test compressing keeps the originals and adds one combined note"""
+        SessionNote.objects.create(encounter=self.encounter, owner=self.user, content='- The ghoul king fled')
+        
+        self.client.post(self.note_url('encounter_notes_compress'))
+        with patch('campaigns.services.llm.client', FakeLLMClient()):
+            run_pending()
+        
+        self.assertEqual(self.encounter.session_notes.count(), 3)
+        self.assertTrue(
+            self.encounter.session_notes.filter(content__contains='The ghoul king fled').filter(
+                content__contains='Mira lost her torch'
+            ).exists()
+        )
+
+
+class LLMJobLeaseTest(TransactionTestCase):
+    """Test a running job's lease is renewed, in a test that commits so the heartbeat thread sees it"""
+    
+    @override_settings(LLM_JOB_LEASE_SECONDS=1)
+    def test_slow_job_is_not_requeued(self):
+        """Test a job running past its lease keeps it while the handler is busy"""
+        user = User.objects.create_user(username='dm', password='testpass123')
+        enqueue('session_summary', user, note_id=1)
+        
+        def slow(job):
+            time.sleep(1.6)
+            return f'requeued {requeue_stale_jobs()}'
+        
+        with patch.dict(HANDLERS, {'session_summary': slow}):
+            self.assertEqual(run_pending(), 1)
+        
+        job = LLMJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.result), ('succeeded', 1, 'requeued 0'))
+
+@patch('campaigns.services.llm.client')
+class LLMResponseCacheTest(TestCase):
+    """Test identical LLM requests are answered from the response cache"""
+    
+    def setUp(self):
+        self.hits = llm.cache_stats['hits']
+        self.misses = llm.cache_stats['misses']
+    
+    def fake(self, client):
+        fake = FakeLLMClient()
+        client.chat.completions.create.side_effect = fake.create
+        return fake
+    
+    def test_identical_requests_call_the_api_once(self, client):
+        """Test a repeated summary is served from the cache"""
+        fake = self.fake(client)
+        
+        first = generate_session_summary('- The lich fell', 'Finale')
+        second = generate_session_summary('- The lich fell', 'Finale')
+        
+        self.assertEqual(first, second)
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(llm.cache_stats['hits'] - self.hits, 1)
+        self.assertEqual(llm.cache_stats['misses'] - self.misses, 1)
+        self.assertEqual(CachedLLMResponse.objects.get().hits, 1)
+        
+        generate_session_summary('- The lich fell', 'Epilogue')
+        llm.compress_session_notes(['- The lich fell'], 'Finale')
+        self.assertEqual(len(fake.calls), 3)
+    
+    def test_prompt_change_invalidates(self, client):
+        """Test editing a prompt template stops older replies from matching"""
+        fake = self.fake(client)
+        generate_session_summary('- The lich fell')
+        
+        with patch.object(llm, 'SESSION_SUMMARY_PROMPT', llm.SESSION_SUMMARY_PROMPT + '\nBe brief.'):
+            generate_session_summary('- The lich fell')
+        
+        self.assertEqual(len(fake.calls), 2)
+        self.assertEqual(CachedLLMResponse.objects.values('prompt_version').distinct().count(), 2)
+    
+    @override_settings(LLM_CACHE_MAX_ENTRIES=2, LLM_CACHE_MAX_AGE_DAYS=30)
+    def test_age_and_size_eviction(self, client):
+        """Test expired replies are refetched and the least recently used are evicted"""
+        fake = self.fake(client)
+        generate_session_summary('- One')
+        CachedLLMResponse.objects.update(created_at=timezone.now() - timedelta(days=31))
+        generate_session_summary('- One')
+        self.assertEqual(len(fake.calls), 2)
+        self.assertEqual(CachedLLMResponse.objects.count(), 1)
+        
+        generate_session_summary('- Two')
+        generate_session_summary('- One')
+        generate_session_summary('- Three')
+        
+        self.assertEqual(CachedLLMResponse.objects.count(), 2)
+        generate_session_summary('- One')
+        self.assertEqual(len(fake.calls), 4)
+        generate_session_summary('- Two')
+        self.assertEqual(len(fake.calls), 5)
+
+
+class StreamingSummaryTest(TestCase):
+    """Test summaries are streamed to the browser and saved when complete"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Stream Campaign', owner=self.user)
+        self.chapter = Chapter.objects.create(campaign=self.campaign, order=1, title='The Vault', owner=self.user)
+        self.encounter = Encounter.objects.create(
+            chapter=self.chapter, title='Mimic', type='combat', order=1, owner=self.user
+        )
+        self.note = SessionNote.objects.create(
+            encounter=self.encounter, owner=self.user,
+            content='- The chest bit Tomas\n- The party escaped with the key',
+        )
+        self.url = reverse('campaigns:encounter_note_summary', kwargs={
+            'campaign_id': self.campaign.pk, 'chapter_id': self.chapter.pk,
+            'encounter_id': self.encounter.pk, 'note_id': self.note.pk,
+        })
+        self.client.login(username='dm', password='testpass123')
+    
+    def test_summary_streams_then_saves(self):
+        """Test the reply arrives in pieces and is saved once the stream ends"""
+        fake = FakeLLMClient()
+        with patch('campaigns.services.llm.client', fake):
+            response = self.client.post(self.url)
+            self.assertTrue(response.streaming)
+            stream = iter(response.streaming_content)
+            first = next(stream)
+            
+            self.note.refresh_from_db()
+            self.assertEqual(self.note.summary, '')
+            self.assertEqual(first, b'-')
+            
+            body = first + b''.join(stream)
+        
+        self.assertTrue(fake.calls[0]['stream'])
+        self.note.refresh_from_db()
+        self.assertEqual(body.decode(), '- The chest bit Tomas\n- The party escaped with the key')
+        self.assertEqual(self.note.summary, body.decode())
+        self.assertContains(self.client.get(self.url), 'AI Summary')
+    
+    def test_cached_summary_streams_whole(self):
+        """Test a repeated request is answered from the response cache in one piece"""
+        fake = FakeLLMClient()
+        with patch('campaigns.services.llm.client', fake):
+            list(llm.stream_session_summary(self.note.content, 'The Vault'))
+            pieces = list(llm.stream_session_summary(self.note.content, 'The Vault'))
+        
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(pieces, ['- The chest bit Tomas\n- The party escaped with the key'])
+    
+    def test_failure_is_reported_in_stream(self):
+        """Test an API error ends the stream with a marker and saves nothing"""
+        with patch('campaigns.services.llm.client', FakeLLMClient(failures=1)):
+            body = b''.join(self.client.post(self.url).streaming_content)
+        
+        self.assertEqual(body, b'\x1eFake LLM failure')
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.summary, '')
+
+
+@patch('campaigns.services.llm.client')
+class HierarchicalCompressionTest(TestCase):
+    """Test large note sets are compressed by summarizing chunks and then the summaries"""
+    
+    def setUp(self):
+        self.notes = [f'- Round {i}: ' + 'the ogre swings wildly ' * (i % 5 + 1) for i in range(30)]
+    
+    def fake(self, client):
+        fake = FakeLLMClient()
+        client.chat.completions.create.side_effect = fake.create
+        return fake
+    
+    def prompts(self, fake, name):
+        system = {'chunk': llm.CHUNK_SUMMARY_SYSTEM, 'final': llm.COMPRESS_NOTES_SYSTEM}[name]
+        return [call for call in fake.calls if call['messages'][0]['content'] == system]
+    
+    def test_small_note_sets_use_one_request(self, client):
+        """Test notes that fit in the budget are compressed in a single call"""
+        fake = self.fake(client)
+        llm.compress_session_notes(['- Goblins attacked', '- The goblins fled'], 'Ambush')
+        
+        self.assertEqual(len(fake.calls), 1)
+        self.assertIn('--- Note Separator ---', fake.calls[0]['messages'][1]['content'])
+    
+    @override_settings(LLM_SUMMARY_CHUNK_TOKENS=300, LLM_SUMMARY_WORKERS=3)
+    def test_large_note_sets_are_reduced_in_chunks(self, client):
+        """Test every note reaches the final note through chunk summaries"""
+        fake = self.fake(client)
+        result = llm.compress_session_notes(self.notes, 'Ogre Fight')
+        
+        self.assertGreater(len(self.prompts(fake, 'chunk')), 2)
+        self.assertEqual(len(self.prompts(fake, 'final')), 1)
+        self.assertEqual(fake.calls[-1]['messages'][0]['content'], llm.COMPRESS_NOTES_SYSTEM)
+        for i in range(30):
+            self.assertIn(f'Round {i}:', result)
+    
+    @override_settings(LLM_SUMMARY_CHUNK_TOKENS=300)
+    def test_new_note_only_resummarizes_its_branch(self, client):
+        """Test unchanged chunks are served from the cache after adding a note"""
+        fake = self.fake(client)
+        llm.compress_session_notes(self.notes, 'Ogre Fight')
+        first_run = len(self.prompts(fake, 'chunk'))
+        
+        fake.calls.clear()
+        llm.compress_session_notes(self.notes + ['- The ogre surrendered'], 'Ogre Fight')
+        
+        self.assertLess(len(self.prompts(fake, 'chunk')), first_run / 2)
+        self.assertEqual(len(self.prompts(fake, 'final')), 1)
+    
+    def test_chunk_boundaries_are_local(self, client):
+        """Test inserting a note changes only the chunks next to it"""
+        before = llm.chunk_notes(self.notes, 300)
+        after = llm.chunk_notes(self.notes[:12] + ['- A bard arrived'] + self.notes[12:], 300)
+        
+        changed = [chunk for chunk in after if chunk not in before]
+        self.assertLessEqual(len(changed), 2)
+        self.assertIn('- A bard arrived', changed[0])
+        self.assertEqual(after[-3:], before[-3:])
+        self.assertTrue(all(len(chunk) > 1 for chunk in before[:-1]))
+    
+    def test_long_note_is_split(self, client):
+        """Test a note over the budget is split at line breaks without losing text"""
+        note = '\n'.join(f'- Event {i} ' + 'x' * 40 for i in range(200))
+        pieces = llm.split_text(note, 100)
+        
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(''.join(pieces), note)
+        self.assertTrue(all(llm.estimate_tokens(piece) <= 100 for piece in pieces))
+
+
+class TokenAccountingTest(TestCase):
+    """Test LLM calls are measured and charged to their user and campaign"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Costly Campaign', owner=self.user)
+        self.chapter = Chapter.objects.create(campaign=self.campaign, order=1, title='The Mine', owner=self.user)
+        self.encounter = Encounter.objects.create(
+            chapter=self.chapter, title='Cave-in', type='exploration', order=1, owner=self.user
+        )
+        self.note = SessionNote.objects.create(
+            encounter=self.encounter, owner=self.user, content='- The tunnel collapsed\n- Bram dug everyone out',
+        )
+    
+    def test_job_usage_is_charged_to_owner_and_campaign(self):
+        """Test reported token counts are added to today's counters"""
+        fake = FakeLLMClient()
+        with patch('campaigns.services.llm.client', fake):
+            enqueue('session_summary', self.user, target=f'note:{self.note.pk}', note_id=self.note.pk)
+            run_pending()
+            with llm.usage_for(self.user, self.campaign):
+                generate_session_summary(self.note.content, 'The Mine')
+        
+        usage = LLMUsage.objects.get()
+        prompt_tokens = sum(len(message['content'].split()) for message in fake.calls[0]['messages'])
+        self.assertEqual((usage.user, usage.campaign, usage.day), (self.user, self.campaign, timezone.localdate()))
+        self.assertEqual((usage.calls, usage.cache_hits), (1, 1))
+        self.assertEqual(usage.prompt_tokens, prompt_tokens)
+        self.assertEqual(usage.completion_tokens, 9)
+    
+    def test_streamed_usage_and_estimates(self):
+        """Test streamed calls report usage and unreported counts are estimated"""
+        with patch('campaigns.services.llm.client', FakeLLMClient()):
+            with llm.usage_for(self.user):
+                list(llm.stream_session_summary(self.note.content))
+        
+        usage = LLMUsage.objects.get(campaign=None)
+        self.assertEqual((usage.user, usage.calls, usage.completion_tokens), (self.user, 1, 9))
+        
+        with patch('campaigns.services.llm.client') as client:
+            client.chat.completions.create.return_value.choices[0].message.content = 'A short summary'
+            generate_session_summary('- Another note')
+        
+        usage = LLMUsage.objects.get(user=None)
+        self.assertEqual(usage.completion_tokens, llm.estimate_tokens('A short summary'))
+        self.assertGreater(usage.prompt_tokens, 100)
+    
+    def test_oversized_inputs_are_fitted(self):
+        """Test inputs beyond the context window are truncated and long notes condensed first"""
+        inputs = {'bullet_points': 'x' * 100000, 'chapter_title': 'The Mine'}
+        fitted = llm.fit_inputs('system', llm.SESSION_SUMMARY_PROMPT, inputs, 'gpt-3.5-turbo', 500)
+        
+        self.assertTrue(fitted['bullet_points'].endswith(llm.TRUNCATION_NOTE))
+        prompt = llm.SESSION_SUMMARY_PROMPT.format(**fitted)
+        self.assertLessEqual(llm.estimate_tokens('system') + llm.estimate_tokens(prompt) + 500, 16385)
+        
+        fake = FakeLLMClient()
+        notes = '\n'.join(f'- Shift {i}: the miners hauled ore from the deep seam' for i in range(100))
+        with patch('campaigns.services.llm.client', fake), override_settings(LLM_SUMMARY_CHUNK_TOKENS=300):
+            generate_session_summary(notes, 'The Mine')
+        
+        systems = [call['messages'][0]['content'] for call in fake.calls]
+        self.assertGreater(systems.count(llm.CHUNK_SUMMARY_SYSTEM), 1)
+        self.assertEqual(systems[-1], llm.SESSION_SUMMARY_SYSTEM)
+    
+    def test_admin_lists_heaviest_callers(self):
+        """Test the usage changelist ranks users and campaigns by tokens"""
+        other = User.objects.create_user(username='light', password='testpass123')
+        LLMUsage.objects.create(
+            day=timezone.localdate(), user=self.user, campaign=self.campaign, calls=3,
+            prompt_tokens=9000, completion_tokens=1000,
+        )
+        LLMUsage.objects.create(day=timezone.localdate(), user=other, calls=1, prompt_tokens=50, completion_tokens=5)
+        admin_user = User.objects.create_superuser(username='root', password='testpass123', email='root@example.com')
+        self.client.force_login(admin_user)
+        
+        response = self.client.get(reverse('admin:campaigns_llmusage_changelist'))
+        
+        self.assertEqual(response.status_code, 200)
+        users = [row['user__username'] for row in response.context['heaviest_users']]
+        self.assertEqual(users, ['dm', 'light'])
+        self.assertEqual(response.context['heaviest_campaigns'][0]['tokens'], 10000)
+        self.assertContains(response, 'Costly Campaign')
+
+
+class CampaignMarkdownExportTest(TestCase):
+    """Test the campaign export is streamed with a fixed number of queries"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Long Road', description='An epic', owner=self.user)
+        self.url = reverse('campaigns:export_markdown', args=[self.campaign.pk])
+    
+    def add_content(self, chapters, encounters, notes):
+        location = Location.objects.create(campaign=self.campaign, name='Harbor', owner=self.user)
+        NPC.objects.create(campaign=self.campaign, name='Quartermaster', location=location, owner=self.user)
+        start = self.campaign.chapters.count()
+        for c in range(start, start + chapters):
+            chapter = Chapter.objects.create(campaign=self.campaign, order=c, title=f'Chapter {c}', owner=self.user)
+            for e in range(encounters):
+                encounter = Encounter.objects.create(
+                    chapter=chapter, title=f'Stop {c}.{e}', type='social', order=e, owner=self.user
+                )
+                for n in range(notes):
+                    SessionNote.objects.create(
+                        encounter=encounter, owner=self.user, content=f'Note {c}.{e}.{n}', date=date(2024, 1, n + 1)
+                    )
+    
+    def export(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/markdown')
+        return b''.join(response.streaming_content).decode()
+    
+    def test_query_count_does_not_grow(self):
+        """Test a large campaign costs the same queries as a small one"""
+        self.add_content(chapters=1, encounters=1, notes=1)
+        with self.assertNumQueries(9):
+            self.export()
+        
+        self.add_content(chapters=5, encounters=4, notes=3)
+        with self.assertNumQueries(9):
+            content = self.export()
+        
+        self.assertEqual(content.count('<details>'), 61)
+        self.assertIn('- **Location:** Harbor', content)
+    
+    def test_document_order(self):
+        """Test notes appear under their own encounter and chapter in order"""
+        self.add_content(chapters=2, encounters=2, notes=2)
+        Chapter.objects.create(campaign=self.campaign, order=5, title='Empty Chapter', owner=self.user)
+        content = self.export()
+        
+        positions = [content.index(text) for text in [
+            '# Long Road', '## 📍 Locations', '## 👤 NPCs', 'Chapter 0: Chapter 0', 'Stop 0.0', 'Note 0.0.0',
+            'Note 0.0.1', 'Stop 0.1', 'Note 0.1.1', 'Chapter 1: Chapter 1', 'Stop 1.1', 'Note 1.1.1', 'Empty Chapter',
+        ]]
+        self.assertEqual(positions, sorted(positions))
+        self.assertFalse(content.endswith('\n\n\n'))
+    
+    def test_chunks_are_bounded(self):
+        """Test the document is produced in chunks near the requested size"""
+        self.add_content(chapters=3, encounters=3, notes=3)
+        chunks = list(campaign_markdown(self.campaign, chunk_size=500))
+        
+        self.assertGreater(len(chunks), 3)
+        self.assertTrue(all(len(chunk) < 1000 for chunk in chunks))
+        self.assertEqual(''.join(chunks), self.export())
+
+
+class ExportCacheTest(TestCase):
+    """Test rendered export sections are reused until their content changes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Long Road', description='An epic', owner=self.user)
+        self.npc = NPC.objects.create(campaign=self.campaign, name='Quartermaster', owner=self.user)
+        self.encounters = []
+        for c in range(3):
+            chapter = Chapter.objects.create(campaign=self.campaign, order=c, title=f'Chapter {c}', owner=self.user)
+            for e in range(3):
+                encounter = Encounter.objects.create(
+                    chapter=chapter, title=f'Stop {c}.{e}', type='social', order=e, owner=self.user
+                )
+                SessionNote.objects.create(encounter=encounter, owner=self.user, content=f'Note {c}.{e}', date=date(2024, 1, 1))
+                self.encounters.append(encounter)
+    
+    def export(self):
+        return ''.join(campaign_markdown(Campaign.objects.get(pk=self.campaign.pk)))
+    
+    def sections(self, kind):
+        return dict(ExportSection.objects.filter(kind=kind).values_list('object_id', 'version'))
+    
+    def test_repeat_export_reads_stored_sections(self):
+        """Test an unchanged campaign is reassembled without rendering or writes"""
+        first = self.export()
+        self.assertEqual(ExportSection.objects.count(), 1 + 3 + 9)
+        
+        campaign = Campaign.objects.get(pk=self.campaign.pk)
+        with self.assertNumQueries(4):
+            second = ''.join(campaign_markdown(campaign))
+        self.assertEqual(first, second)
+    
+    def test_note_edit_renders_only_its_encounter(self):
+        """Test editing one note re-renders that encounter and nothing else"""
+        self.export()
+        encounters, chapters = self.sections('encounter'), self.sections('chapter')
+        header = self.sections('campaign')
+        
+        note = SessionNote.objects.get(encounter=self.encounters[4])
+        note.content = 'Rewritten note'
+        note.save()
+        content = self.export()
+        
+        self.assertIn('Rewritten note', content)
+        self.assertNotIn('Note 1.1', content)
+        changed = [pk for pk, version in self.sections('encounter').items() if encounters[pk] != version]
+        self.assertEqual(changed, [self.encounters[4].pk])
+        self.assertEqual(self.sections('chapter'), chapters)
+        self.assertEqual(self.sections('campaign'), header)
+    
+    def test_summary_update_marks_encounter_stale(self):
+        """Test a summary written with update() still reaches the export"""
+        self.export()
+        note = SessionNote.objects.get(encounter=self.encounters[0])
+        enqueue('session_summary', self.user, note_id=note.pk)
+        with patch('campaigns.services.llm.client', FakeLLMClient()):
+            run_pending()
+        
+        summary = SessionNote.objects.get(pk=note.pk).summary
+        self.assertTrue(summary)
+        self.assertIn(summary.strip(), self.export())
+    
+    def test_npc_rename_refreshes_header(self):
+        """Test world changes mark the campaign header stale"""
+        self.export()
+        self.npc.name = 'Harbormaster'
+        self.npc.save()
+        content = self.export()
+        
+        self.assertIn('### **Harbormaster**', content)
+        self.assertNotIn('Quartermaster', content)
+    
+    def test_stale_instance_save_does_not_revive_old_section(self):
+        """Test a save from an out-of-date instance still gets a new version"""
+        encounter = Encounter.objects.get(pk=self.encounters[0].pk)
+        self.export()
+        Encounter.objects.filter(pk=encounter.pk).update(title='Renamed')
+        encounter.title = 'Renamed again'
+        encounter.save(update_fields=['title'])
+        
+        self.assertIn('Renamed again', self.export())
+    
+    def encounter_export(self, encounter):
+        return encounter_markdown(Encounter.objects.select_related('chapter__campaign').get(pk=encounter.pk))
+    
+    def test_encounter_export_is_stored_until_changed(self):
+        """Test the single-encounter export is read back until one of its parts changes"""
+        encounter = Encounter.objects.select_related('chapter__campaign').get(pk=self.encounters[0].pk)
+        first = encounter_markdown(encounter)
+        with self.assertNumQueries(1):
+            self.assertEqual(encounter_markdown(encounter), first)
+        
+        SessionNote.objects.create(encounter=encounter, owner=self.user, content='Late arrival', date=date(2024, 2, 1))
+        self.assertIn('Late arrival', self.encounter_export(encounter))
+        self.npc.name = 'Harbormaster'
+        self.npc.save()
+        encounter.npcs.add(self.npc)
+        self.assertIn('**NPCs:** Harbormaster', self.encounter_export(encounter))
+    
+    def test_reorder_renumbers_stored_chapters(self):
+        """Test reordering chapters, which uses update(), reaches both exports"""
+        self.export()
+        self.encounter_export(self.encounters[0])
+        chapters = list(self.campaign.chapters.order_by('order'))
+        
+        self.client.login(username='dm', password='testpass123')
+        response = self.client.post(
+            reverse('campaigns:chapter_reorder', args=[self.campaign.pk]),
+            {'chapter_order': [chapter.pk for chapter in reversed(chapters)]}
+        )
+        self.assertEqual(response.status_code, 200)
+        
+        content = self.export()
+        positions = [content.index(f'### Chapter {n}: Chapter {3 - n}') for n in (1, 2, 3)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn('# Chapter 3: Chapter 0', self.encounter_export(self.encounters[0]))
+    
+    def test_encounter_export_is_cached(self):
+        """Test the single-encounter export is stored and refreshed on change"""
+        self.client.login(username='dm', password='testpass123')
+        encounter = self.encounters[0]
+        url = reverse('campaigns:encounter_export', args=[self.campaign.pk, encounter.chapter_id, encounter.pk])
+        first = self.client.get(url).content.decode()
+        self.assertIn('Note 0.0', first)
+        self.assertTrue(ExportSection.objects.filter(kind='encounter_document', object_id=encounter.pk).exists())
+        self.assertEqual(self.client.get(url).content.decode(), first)
+        
+        encounter.npcs.add(self.npc)
+        self.assertIn('**NPCs:** Quartermaster', self.client.get(url).content.decode())
+        
+        chapter = encounter.chapter
+        chapter.intro = 'The road begins'
+        chapter.save()
+        self.assertIn('The road begins', self.client.get(url).content.decode())
+
+
+class CampaignArchiveTestCase(TestCase):
+    """Base test case with a campaign that has one of everything an archive holds"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Long Road', description='An epic', owner=self.user)
+        self.hero = CharacterSummary.objects.create(
+            campaign=self.campaign, player_name='Sam', character_name='Aria', race='Elf'
+        )
+        self.goblin = Enemy.objects.create(
+            campaign=self.campaign, name='Goblin', armor_class=15, hit_points=7,
+            speed='30 ft.', challenge_rating='1/4', owner=self.user
+        )
+        self.add_content(1)
+    
+    def add_content(self, chapters):
+        start = self.campaign.chapters.count()
+        for c in range(start, start + chapters):
+            chapter = Chapter.objects.create(campaign=self.campaign, order=c, title=f'Chapter {c}', owner=self.user)
+            location = Location.objects.create(
+                campaign=self.campaign, name=f'Harbor {c}', owner=self.user,
+                map_image=SimpleUploadedFile(f'harbor{c}.png', b'map bytes ' * 1000, content_type='image/png'),
+            )
+            location.chapters.add(chapter)
+            npc = NPC.objects.create(campaign=self.campaign, name=f'Captain {c}', location=location, owner=self.user)
+            encounter = Encounter.objects.create(
+                chapter=chapter, title=f'Stop {c}', type='combat', order=1, location=location, owner=self.user
+            )
+            encounter.npcs.add(npc)
+            self.goblin.encounters.add(encounter)
+            SessionNote.objects.create(encounter=encounter, owner=self.user, content=f'Note {c}', date=date(2024, 1, 1))
+            combat = CombatSession.objects.create(encounter=encounter, name=f'Fight {c}', owner=self.user)
+            goblin = CombatParticipant.objects.create(
+                combat_session=combat, participant_type='enemy', enemy=self.goblin,
+                name='Goblin', current_hp=7, max_hp=7,
+            )
+            combat.record_event('damage', goblin, amount=3)
+    
+    def records(self):
+        lines = ''.join(campaign_records(self.campaign)).splitlines()
+        return json.loads(lines[0]), [json.loads(line) for line in lines[1:]]
+
+
+class CampaignArchiveTest(CampaignArchiveTestCase):
+    """Test the JSON Lines and ZIP campaign archives"""
+    
+    def test_records_cover_campaign_in_dependency_order(self):
+        """Test every object is exported once, after the objects it points at"""
+        other = Campaign.objects.create(title='Other', owner=self.user)
+        Chapter.objects.create(campaign=other, order=1, title='Elsewhere', owner=self.user)
+        header, records = self.records()
+        
+        self.assertEqual(header['format'], 'dnd-companion.campaign')
+        self.assertEqual(header['campaign'], self.campaign.pk)
+        models = [record['model'] for record in records]
+        for model in ['campaigns.campaign', 'campaigns.chapter', 'campaigns.location', 'campaigns.npc',
+                      'campaigns.encounter', 'campaigns.enemy', 'campaigns.charactersummary',
+                      'campaigns.sessionnote', 'campaigns.combatsession', 'campaigns.combatparticipant',
+                      'campaigns.combatevent']:
+            self.assertIn(model, models)
+        self.assertEqual(models.count('campaigns.campaign'), 1)
+        self.assertNotIn('Elsewhere', json.dumps(records))
+        
+        encounter = next(record for record in records if record['model'] == 'campaigns.encounter')
+        self.assertEqual(len(encounter['fields']['npcs']), 1)
+        self.assertNotIn('difficulty_cache', encounter['fields'])
+        self.assertNotIn('export_version', encounter['fields'])
+        enemy = next(record for record in records if record['model'] == 'campaigns.enemy')
+        self.assertEqual(enemy['fields']['encounters'], [encounter['pk']])
+        
+        seen = set()
+        for record in records:
+            seen.add((record['model'], record['pk']))
+            if record['model'] == 'campaigns.encounter':
+                self.assertIn(('campaigns.chapter', record['fields']['chapter']), seen)
+            if record['model'] == 'campaigns.combatparticipant':
+                self.assertIn(('campaigns.enemy', record['fields']['enemy']), seen)
+    
+    def test_query_count_does_not_grow(self):
+        """Test a large campaign costs the same queries as a small one"""
+        with self.assertNumQueries(19):
+            list(campaign_records(self.campaign))
+        
+        self.add_content(5)
+        with self.assertNumQueries(19):
+            _, records = self.records()
+        self.assertEqual(sum(record['model'] == 'campaigns.encounter' for record in records), 6)
+    
+    def test_zip_bundles_map_images(self):
+        """Test the ZIP holds the records and every map, read from storage"""
+        self.add_content(2)
+        pieces = list(campaign_archive(self.campaign))
+        self.assertGreater(len(pieces), 3)
+        
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(pieces)))
+        self.assertIsNone(archive.testzip())
+        # Everything after the header, which carries the export time
+        records = archive.read('campaign.jsonl').decode().splitlines()[1:]
+        self.assertEqual(records, ''.join(campaign_records(self.campaign)).splitlines()[1:])
+        for location in Location.objects.filter(campaign=self.campaign):
+            self.assertEqual(archive.read(f'media/{location.map_image.name}'), b'map bytes ' * 1000)
+    
+    def test_view_is_owner_only(self):
+        """Test only the campaign owner can download the archive"""
+        url = reverse('campaigns:export_archive', args=[self.campaign.pk])
+        response = self.client.get(url)
+        self.assertRedirects(response, f'{settings.LOGIN_URL}?next={url}', fetch_redirect_response=False)
+        
+        User.objects.create_user(username='player', password='testpass123')
+        self.client.login(username='player', password='testpass123')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        
+        self.client.login(username='dm', password='testpass123')
+        response = self.client.get(url, {'format': 'zip'})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIn('campaign.jsonl', archive.namelist())
+
+
+class CampaignImportTest(CampaignArchiveTestCase):
+    """Test campaigns are imported from archives with their references remapped"""
+    
+    def setUp(self):
+        super().setUp()
+        self.importer = User.objects.create_user(username='newdm', password='testpass123')
+    
+    def import_text(self, text):
+        return import_campaign(io.BytesIO(text.encode()), self.importer)
+    
+    def test_round_trip_remaps_references(self):
+        """Test the copy is complete and only points at its own objects"""
+        combat = CombatSession.objects.get(name='Fight 0')
+        participant = combat.participants.get()
+        participant.add_status_effect('Poisoned', duration_rounds=3)
+        combat.snapshot()
+        combat.record_event('heal', participant, amount=2)
+        
+        copy = self.import_text(''.join(campaign_records(self.campaign)))
+        
+        self.assertNotEqual(copy.pk, self.campaign.pk)
+        self.assertEqual(copy.owner, self.importer)
+        self.assertEqual(copy.title, 'Long Road')
+        encounter = Encounter.objects.get(chapter__campaign=copy)
+        self.assertEqual(encounter.owner, self.importer)
+        self.assertEqual(list(encounter.npcs.values_list('campaign', flat=True)), [copy.pk])
+        self.assertEqual(encounter.location.campaign, copy)
+        self.assertEqual(list(Location.objects.get(campaign=copy).chapters.all()), [encounter.chapter])
+        enemy = Enemy.objects.get(campaign=copy)
+        self.assertEqual(list(enemy.encounters.all()), [encounter])
+        self.assertEqual(SessionNote.objects.get(encounter=encounter).content, 'Note 0')
+        self.assertIsNone(CharacterSummary.objects.get(campaign=copy).owner)
+        
+        copied_combat = CombatSession.objects.get(encounter=encounter)
+        copied_participant = copied_combat.participants.get()
+        self.assertEqual(copied_participant.enemy, enemy)
+        effect = StatusEffect.objects.get(participant=copied_participant)
+        snapshot = copied_combat.snapshots.latest('last_event_id')
+        self.assertEqual(list(snapshot.state['participants']), [str(copied_participant.pk)])
+        self.assertEqual(list(snapshot.state['effects']), [str(effect.pk)])
+        self.assertEqual(snapshot.state['effects'][str(effect.pk)]['participant'], copied_participant.pk)
+        effect_event = copied_combat.events.get(event_type='effect_add')
+        self.assertEqual(effect_event.payload['effect_id'], effect.pk)
+        self.assertEqual(copied_combat.events.filter(pk__gt=snapshot.last_event_id).get().event_type, 'heal')
+        
+        state = copied_combat.build_state()
+        original = combat.build_state()
+        self.assertEqual(state['participants'][str(copied_participant.pk)], original['participants'][str(participant.pk)])
+    
+    def test_query_count_does_not_grow(self):
+        """Test objects are inserted in batches, not one query each"""
+        small = ''.join(campaign_records(self.campaign))
+        self.add_content(10)
+        large = ''.join(campaign_records(self.campaign))
+        
+        with CaptureQueriesContext(connection) as small_queries:
+            self.import_text(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            copy = self.import_text(large)
+        
+        self.assertEqual(len(large_queries), len(small_queries))
+        self.assertEqual(Encounter.objects.filter(chapter__campaign=copy).count(), 11)
+    
+    def test_zip_restores_map_images(self):
+        """Test bundled maps are copied into storage for the new locations"""
+        copy = import_campaign(io.BytesIO(b''.join(campaign_archive(self.campaign))), self.importer)
+        
+        location = Location.objects.get(campaign=copy)
+        original = Location.objects.get(campaign=self.campaign)
+        self.assertNotEqual(location.map_image.name, original.map_image.name)
+        with location.map_image.open('rb') as image:
+            self.assertEqual(image.read(), b'map bytes ' * 1000)
+    
+    def test_rejects_references_outside_archive(self):
+        """Test a record pointing at another campaign's objects imports nothing"""
+        other = Campaign.objects.create(title='Private', owner=self.user)
+        private = Chapter.objects.create(campaign=other, order=1, title='Secret', owner=self.user)
+        lines = ''.join(campaign_records(self.campaign)).splitlines()
+        for index, line in enumerate(lines):
+            record = json.loads(line)
+            if record.get('model') == 'campaigns.encounter':
+                record['fields']['chapter'] = private.pk
+                lines[index] = json.dumps(record)
+        
+        with self.assertRaises(ArchiveError):
+            self.import_text('\n'.join(lines))
+        self.assertFalse(Campaign.objects.filter(owner=self.importer).exists())
+        self.assertEqual(private.encounters.count(), 0)
+    
+    def test_rejects_other_models(self):
+        """Test an archive can't create accounts or other instance data"""
+        header = ''.join(campaign_records(self.campaign)).splitlines()[0]
+        user = json.dumps({'model': 'auth.user', 'pk': 99, 'fields': {'username': 'intruder', 'password': 'x'}})
+        
+        with self.assertRaises(ArchiveError):
+            self.import_text(f'{header}\n{user}\n')
+        with self.assertRaises(ArchiveError):
+            self.import_text('{"model": "campaigns.campaign"}\n')
+        self.assertFalse(User.objects.filter(username='intruder').exists())
+    
+    def test_upload_view(self):
+        """Test uploading an archive creates the campaign for the uploader"""
+        self.client.login(username='newdm', password='testpass123')
+        upload = SimpleUploadedFile('backup.zip', b''.join(campaign_archive(self.campaign)))
+        response = self.client.post(reverse('campaigns:campaign_import'), {'archive': upload})
+        
+        copy = Campaign.objects.get(owner=self.importer)
+        self.assertRedirects(response, copy.get_absolute_url(), fetch_redirect_response=False)
+        
+        response = self.client.post(
+            reverse('campaigns:campaign_import'), {'archive': SimpleUploadedFile('notes.txt', b'hello')}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'This is not a campaign archive')
+    
+    def test_damaged_files_are_rejected(self):
+        """Test undecodable, mistyped and invalid records give an archive error, not a crash"""
+        header, *lines = ''.join(campaign_records(self.campaign)).splitlines()
+        campaign = json.loads(lines[0])
+        campaign['fields']['title'] = None
+        versioned = json.loads(header)
+        versioned['version'] = '1'
+        
+        for damaged in [
+            b'\xff\xfe\x00\x01 not text at all\n' * 50,
+            f'{header}\n'.encode() + b'\xff\xfe\x00\x01\n',
+            f'{json.dumps(versioned)}\n'.encode(),
+            '\n'.join([header, json.dumps(campaign), *lines[1:]]).encode(),
+        ]:
+            with self.assertRaises(ArchiveError):
+                import_campaign(io.BytesIO(damaged), self.importer)
+        self.assertFalse(Campaign.objects.filter(owner=self.importer).exists())
+        
+        self.client.login(username='newdm', password='testpass123')
+        upload = SimpleUploadedFile('backup.jsonl', '\n'.join([header, json.dumps(campaign)]).encode())
+        response = self.client.post(reverse('campaigns:campaign_import'), {'archive': upload})
+        self.assertContains(response, 'The archive is damaged')
+    
+    def test_jsonl_import_does_not_adopt_other_files(self):
+        """Test a map name from outside the archive is only kept if the importer already uses it"""
+        stranger = User.objects.create_user(username='stranger', password='testpass123')
+        private = Campaign.objects.create(title='Private', owner=stranger)
+        Location.objects.create(
+            campaign=private, name='Lair', owner=stranger,
+            map_image=SimpleUploadedFile('lair.png', b'secret map'),
+        )
+        secret = Location.objects.get(campaign=private).map_image.name
+        records = ''.join(campaign_records(self.campaign))
+        mine = Location.objects.get(campaign=self.campaign).map_image.name
+        
+        copy = import_campaign(io.BytesIO(records.replace(mine, secret).encode()), self.importer)
+        self.assertEqual(Location.objects.get(campaign=copy).map_image.name, '')
+        
+        copy = import_campaign(io.BytesIO(records.encode()), self.user)
+        self.assertEqual(Location.objects.get(campaign=copy).map_image.name, mine)
+
+
+def build_adventure_pdf(chapters=2, pages_per_chapter=1):
+    """A small module laid out like a printed adventure, as PDF bytes"""
+    import pymupdf
+    
+    document = pymupdf.open()
+    for c in range(1, chapters + 1):
+        for p in range(pages_per_chapter):
+            page = document.new_page()
+            lines = []
+            if p == 0:
+                lines += [(f'Chapter {c}: The Road {c}', 24, True),
+                          ('The party travels along the old road toward the ruined keep.', 10, False)]
+            lines += [
+                (f'A{c}{p}. Guard Room', 14, True),
+                ('Two goblins play dice by a brazier. They attack anyone who enters.', 10, False),
+                ('Goblin', 12, True),
+                ('Small humanoid (goblinoid), neutral evil', 10, False),
+                ('Armor Class 15 (leather armor, shield)', 10, False),
+                ('Hit Points 7 (2d6)', 10, False),
+                ('Speed 30 ft.', 10, False),
+                ('STR DEX CON INT WIS CHA', 10, False),
+                ('8 (-1) 14 (+2) 10 (+0) 10 (+0) 8 (-1) 8 (-1)', 10, False),
+                ('Skills Stealth +6', 10, False),
+                ('Challenge 1/4 (50 XP)', 10, False),
+                ('Nimble Escape. The goblin can take the Disengage or Hide action.', 10, False),
+                ('Actions', 12, True),
+                ('Scimitar. Melee Weapon Attack: +4 to hit, reach 5 ft.', 10, False),
+                (f'B{c}{p}. Hall of Echoes', 14, True),
+                ('Voices repeat here. The walls are carved with old runes.', 10, False),
+                (str(len(document)), 8, False),
+            ]
+            y = 60
+            for text, size, bold in lines:
+                page.insert_text((50, y), text, fontsize=size, fontname='hebo' if bold else 'helv')
+                y += size + 6
+    return document.tobytes()
+
+
+class PDFIngestionTest(TestCase):
+    """Test adventure PDFs are read into chapter, encounter and enemy drafts"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, PDF_INGEST_WORKERS=1)
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.user = User.objects.create_user(username='dm', password='testpass123')
+        self.campaign = Campaign.objects.create(title='Keep on the Road', owner=self.user)
+        Chapter.objects.create(campaign=self.campaign, order=1, title='Session Zero', owner=self.user)
+        self.client.login(username='dm', password='testpass123')
+        self.pdf = build_adventure_pdf()
+    
+    def upload(self, campaign, pdf):
+        url = reverse('campaigns:chapter_upload', args=[campaign.pk])
+        return self.client.post(url, {'pdf_file': SimpleUploadedFile('keep.pdf', pdf, content_type='application/pdf')})
+    
+    def test_outline_detects_sections(self):
+        """Test chapters, keyed encounters and stat blocks are recognised"""
+        path = f'{self.media_root}/keep.pdf'
+        with open(path, 'wb') as output:
+            output.write(self.pdf)
+        parser = pdf_ingest.OutlineParser()
+        for number, lines in pdf_ingest.iter_pages(path):
+            parser.feed_page(number, lines)
+        outline = parser.finish()
+        
+        self.assertEqual([c['title'] for c in outline['chapters']], ['Chapter 1: The Road 1', 'Chapter 2: The Road 2'])
+        encounters = outline['chapters'][0]['encounters']
+        self.assertEqual([e['title'] for e in encounters], ['A10. Guard Room', 'B10. Hall of Echoes'])
+        self.assertEqual(encounters[0]['enemies'], ['Goblin'])
+        self.assertNotIn('Armor Class 15 (leather armor, shield)', encounters[0]['text'])
+        self.assertEqual(encounters[1]['text'], ['Voices repeat here. The walls are carved with old runes.'])
+        
+        [goblin] = outline['enemies']
+        self.assertEqual((goblin['size'], goblin['creature_type']), ('small', 'humanoid'))
+        self.assertEqual((goblin['armor_class'], goblin['hit_points'], goblin['hit_dice']), (15, 7, '2d6'))
+        self.assertEqual((goblin['dexterity'], goblin['challenge_rating']), (14, '1/4'))
+        self.assertIn('Nimble Escape', goblin['special_abilities'])
+        self.assertIn('Scimitar', goblin['actions'])
+    
+    def test_upload_requires_login(self):
+        """Test anonymous users are sent to the login page"""
+        self.client.logout()
+        url = reverse('campaigns:chapter_upload', args=[self.campaign.pk])
+        
+        response = self.client.get(url)
+        self.assertRedirects(response, f'{settings.LOGIN_URL}?next={url}', fetch_redirect_response=False)
+    
+    def test_upload_creates_drafts_in_background(self):
+        """Test the upload only queues a job, which adds the drafts"""
+        response = self.upload(self.campaign, self.pdf)
+        self.assertContains(response, 'Reading the PDF')
+        self.assertEqual(self.campaign.chapters.count(), 1)
+        
+        run_pending()
+        job = LLMJob.objects.get(kind='ingest_pdf')
+        self.assertEqual(job.status, 'succeeded')
+        self.assertIn('2 chapters, 4 encounters and 1 new enemies', job.result)
+        
+        chapters = list(self.campaign.chapters.order_by('order'))
+        self.assertEqual([c.order for c in chapters], [1, 2, 3])
+        self.assertTrue(all(c.export_version for c in chapters))
+        self.assertFalse(Encounter.objects.filter(chapter__campaign=self.campaign, export_version=0).exists())
+        self.assertIn('Draft imported from keep.pdf, page 1', chapters[1].dm_notes)
+        guard_room = Encounter.objects.get(chapter=chapters[2], title='A20. Guard Room')
+        self.assertEqual(guard_room.type, 'combat')
+        goblin = Enemy.objects.get(campaign=self.campaign)
+        self.assertEqual(goblin.owner, self.user)
+        self.assertEqual(goblin.proficiency_bonus, 2)
+        self.assertEqual(goblin.encounters.count(), 2)
+        self.assertEqual(goblin.chapters.count(), 2)
+    
+    def test_outline_is_cached_by_file_hash(self):
+        """Test the same file uploaded again, to any campaign, isn't read twice"""
+        self.upload(self.campaign, self.pdf)
+        run_pending()
+        other = Campaign.objects.create(title='Second Table', owner=self.user)
+        Enemy.objects.create(
+            campaign=other, name='Goblin', armor_class=13, hit_points=5, speed='30 ft.',
+            challenge_rating='1/4', owner=self.user
+        )
+        
+        with patch('campaigns.services.pdf_ingest.iter_pages', side_effect=AssertionError('read again')):
+            self.upload(other, self.pdf)
+            run_pending()
+        
+        self.assertEqual(AdventurePDF.objects.count(), 1)
+        self.assertEqual(AdventurePDF.objects.get().page_count, 2)
+        self.assertEqual(LLMJob.objects.filter(status='succeeded').count(), 2)
+        self.assertEqual(Encounter.objects.filter(chapter__campaign=other).count(), 4)
+        # The campaign's own Goblin is used rather than a second one
+        goblin = Enemy.objects.get(campaign=other)
+        self.assertEqual(goblin.armor_class, 13)
+        self.assertEqual(goblin.encounters.count(), 2)
+    
+    def test_proficiency_bonus_is_read_or_derived(self):
+        """Test a printed proficiency bonus is used, and otherwise worked out from the CR"""
+        def stat_block(name, *lines):
+            return [(12, True, name), (10, False, 'Large giant, chaotic evil'), (10, False, 'Armor Class 11'),
+                    (10, False, 'Hit Points 59 (7d10 + 21)'), *[(10, False, line) for line in lines],
+                    (10, False, 'Brute. A melee weapon deals one extra die of damage.')]
+        
+        parser = pdf_ingest.OutlineParser()
+        parser.feed_page(1, [
+            (10, False, 'Giants roam the hills above the village in small and hungry bands.'),
+            *stat_block('Ogre', 'Challenge 2 (450 XP)', 'Proficiency Bonus +4'),
+            *stat_block('Hill Chief', 'Challenge 7 (2,900 XP) Proficiency Bonus +3'),
+            *stat_block('Stone Giant', 'Challenge 9 (5,000 XP)'),
+        ])
+        enemies = {enemy['name']: enemy for enemy in parser.finish()['enemies']}
+        
+        self.assertEqual(
+            {name: enemy['proficiency_bonus'] for name, enemy in enemies.items()},
+            {'Ogre': 4, 'Hill Chief': 3, 'Stone Giant': 4}
+        )
+        self.assertEqual(enemies['Ogre']['special_abilities'], 'Brute. A melee weapon deals one extra die of damage.')
+        self.assertEqual([pdf_ingest.proficiency_bonus(cr) for cr in ['1/8', '4', '5', '17', '30']], [2, 2, 3, 6, 9])
+    
+    def test_process_pool_matches_inline_reading(self):
+        """Test pages read in worker processes come back complete and in order"""
+        path = f'{self.media_root}/long.pdf'
+        with open(path, 'wb') as output:
+            output.write(build_adventure_pdf(chapters=3, pages_per_chapter=2))
+        
+        with patch.object(pdf_ingest, 'PAGES_PER_TASK', 2):
+            pooled = list(pdf_ingest.iter_pages(path, workers=2))
+        self.assertEqual(pooled, list(pdf_ingest.iter_pages(path)))
+        self.assertEqual([number for number, _ in pooled], [1, 2, 3, 4, 5, 6])
+    
+    def test_rejects_files_that_are_not_pdfs(self):
+        """Test other uploads are refused before anything is queued"""
+        response = self.upload(self.campaign, b'just some notes')
+        
+        self.assertContains(response, 'Upload a PDF file.')
+        self.assertFalse(LLMJob.objects.exists())
+        self.assertFalse(AdventurePDF.objects.exists())
+    
+    def test_unreadable_pdf_fails_without_retrying(self):
+        """Test a damaged file fails its job on the first attempt"""
+        self.upload(self.campaign, b'%PDF-1.4 this is not really a PDF')
+        run_pending()
+        
+        job = LLMJob.objects.get(kind='ingest_pdf')
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertEqual(self.campaign.chapters.count(), 1)
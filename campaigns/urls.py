@@ -6,6 +6,7 @@ from .views import (
     CampaignListView,
     CampaignDetailView,
     CampaignCreateView,
+    CampaignImportView,
     CampaignUpdateView,
     CampaignDeleteView,
     ChapterDeleteView,
@@ -16,6 +17,10 @@ from .views import (
     EncounterNoteEditView,
     EncounterNoteUpdateView,
     EncounterNoteDeleteView,
+    SessionNoteSummarizeView,
+    SessionNoteSummaryView,
+    EncounterNotesCompressView,
+    LLMJobStatusView,
     HomeView,
     empty_fragment,
     ChapterStatusToggleView,
@@ -34,6 +39,7 @@ from .views import (
 from .views.encounters import EncounterPlayView
 from .views import (
     ChapterCreateView,
+    ChapterUploadView,
     ChapterQuickCreateView,
     ChapterUpdateView,
     ChapterDetailView,
@@ -69,7 +75,7 @@ from .views import (
     CombatSessionUpdateView,
     CombatSessionDeleteView,
 )
-from .views.combat import start_combat, roll_initiative, next_turn, end_combat
+from .views.combat import start_combat, roll_initiative, next_turn, end_combat, combat_session_stream
 from .views import ChapterNPCListView, ChapterLocationListView, ChapterCharacterListView
 from .views import (
     CampaignNPCListView,
@@ -80,6 +86,7 @@ from .views import (
 from .views import LoginView
 from .views import (
     export_campaign_markdown,
+    export_campaign_archive,
     export_encounter_markdown,
     save_campaign_summary,
 )
@@ -104,6 +111,7 @@ urlpatterns = [
     # Campaign Management
     path("campaigns/", CampaignListView.as_view(), name="campaign_list"),
     path("campaigns/create/", CampaignCreateView.as_view(), name="campaign_create"),
+    path("campaigns/import/", CampaignImportView.as_view(), name="campaign_import"),
     path(
         "campaigns/<int:campaign_id>/",
         CampaignDetailView.as_view(),
@@ -124,6 +132,11 @@ urlpatterns = [
         export_campaign_markdown,
         name="export_markdown",
     ),
+    path(
+        "campaigns/<int:campaign_id>/export/archive/",
+        export_campaign_archive,
+        name="export_archive",
+    ),
     path(
         "campaigns/<int:campaign_id>/save-summary/",
         save_campaign_summary,
@@ -172,6 +185,11 @@ urlpatterns = [
         ChapterQuickCreateView.as_view(),
         name="chapter_quick_create",
     ),
+    path(
+        "campaigns/<int:campaign_id>/chapters/upload/",
+        ChapterUploadView.as_view(),
+        name="chapter_upload",
+    ),
     path(
         "campaigns/<int:campaign_id>/chapters/reorder/",
         ChapterReorderView.as_view(),
@@ -270,6 +288,26 @@ urlpatterns = [
         EncounterNoteDeleteView.as_view(),
         name="encounter_note_delete",
     ),
+    path(
+        "campaigns/<int:campaign_id>/chapters/<int:chapter_id>/encounters/<int:encounter_id>/notes/<int:note_id>/summarize/",
+        SessionNoteSummarizeView.as_view(),
+        name="encounter_note_summarize",
+    ),
+    path(
+        "campaigns/<int:campaign_id>/chapters/<int:chapter_id>/encounters/<int:encounter_id>/notes/<int:note_id>/summary/",
+        SessionNoteSummaryView.as_view(),
+        name="encounter_note_summary",
+    ),
+    path(
+        "campaigns/<int:campaign_id>/chapters/<int:chapter_id>/encounters/<int:encounter_id>/notes/compress/",
+        EncounterNotesCompressView.as_view(),
+        name="encounter_notes_compress",
+    ),
+    path(
+        "llm-jobs/<int:job_id>/",
+        LLMJobStatusView.as_view(),
+        name="llm_job_status",
+    ),
     # Combat Sessions (Nested under Encounter)
     path(
         "campaigns/<int:campaign_id>/chapters/<int:chapter_id>/encounters/<int:encounter_id>/combat/start/",
@@ -312,6 +350,11 @@ urlpatterns = [
         end_combat,
         name="combat_session_end",
     ),
+    path(
+        "campaigns/<int:campaign_id>/chapters/<int:chapter_id>/encounters/<int:encounter_id>/combat/<int:session_id>/stream/",
+        combat_session_stream,
+        name="combat_session_stream",
+    ),
     # Campaign World Resources (Nested under Campaign)
     path(
         "campaigns/<int:campaign_id>/locations/add/",
@@ -441,6 +484,11 @@ urlpatterns = [
         htmx_views.toggle_time_slot,
         name="toggle_time_slot",
     ),
+    path(
+        "schedule/<uuid:token>/toggle-slots/",
+        htmx_views.toggle_time_slots,
+        name="toggle_time_slots",
+    ),
     path(
         "schedule/<uuid:token>/save-info/",
         htmx_views.save_player_info,
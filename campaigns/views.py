@@ -12,7 +12,7 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.views import View
 from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -38,6 +38,7 @@ from .forms import (
 from .llm import (
     generate_session_summary,
 )
+from .services.export import campaign_markdown, encounter_markdown, new_version
 
 logger = logging.getLogger(__name__)
 logger.setLevel(level="DEBUG")
@@ -365,79 +366,8 @@ class EncounterNoteCreateView(View):
 
 def export_campaign_markdown(request, campaign_id):
     campaign = get_object_or_404(Campaign, pk=campaign_id)
-    lines = [
-        f"# {campaign.title}",
-        "",
-        campaign.description or "",
-        "",
-        "---",
-        "",
-        "## 📍 Locations",
-    ]
-
-    for loc in campaign.locations.all():
-        lines += [
-            f"### **{loc.name}**",
-            f"- **Region:** {loc.region or '_Unknown_'}",
-            f"- **Tags:** {loc.tags or '_None_'}",
-            "",
-            f"{loc.description.strip() if loc.description else '_No description_'}",
-            "",
-        ]
-
-    lines += ["", "## 👤 NPCs"]
-
-    for npc in campaign.npcs.all():
-        lines += [
-            f"### **{npc.name}**",
-            f"- **Role:** {npc.role or '_Unknown_'}",
-            f"- **Status:** {npc.status.capitalize()}",
-            f"- **Location:** {npc.location.name if npc.location else '_Unknown_'}",
-            f"- **Tags:** {npc.tags or '_None_'}",
-            "",
-            f"{npc.description.strip() if npc.description else '_No description_'}",
-            "",
-        ]
-
-    lines += ["", "---", "", "## 📖 Chapters"]
-
-    for chapter in campaign.chapters.order_by("order"):
-        lines += [
-            f"### Chapter {chapter.order}: {chapter.title}",
-            f"**Status:** {chapter.status.replace('_', ' ').capitalize()}",
-            "",
-            chapter.summary or "_No summary yet_",
-            "",
-        ]
-
-        # Export encounters with their session notes
-        for encounter in chapter.encounters.order_by("order"):
-            lines += [
-                f"#### {encounter.order}. {encounter.title} ({encounter.type})",
-                f"**Summary:** {encounter.summary}",
-                "",
-            ]
-
-            # Add session notes for this encounter
-            session_notes = encounter.session_notes.order_by("date")
-            for note in session_notes:
-                lines += [
-                    "<details>",
-                    f"<summary><strong>Session on {note.date}</strong></summary>",
-                    "",
-                    "#### Raw Notes:",
-                    note.content.strip(),
-                    "",
-                    "#### Summary:",
-                    note.summary.strip() if note.summary else "_No summary available_",
-                    "",
-                    "</details>",
-                    "",
-                ]
-
-    # Generate response
-    markdown_text = "\n".join(lines)
-    response = HttpResponse(markdown_text, content_type="text/markdown")
+    # Streamed in chunks; see services/export.py for how the queries are kept constant
+    response = StreamingHttpResponse(campaign_markdown(campaign), content_type="text/markdown")
     response["Content-Disposition"] = (
         f'attachment; filename="{campaign.title.lower().replace(" ", "_")}_export.md"'
     )
@@ -450,172 +380,18 @@ def export_encounter_markdown(request, campaign_id, chapter_id, encounter_id):
     """
     # Get the encounter and verify ownership
     encounter = get_object_or_404(
-        Encounter.objects.select_related('chapter__campaign'),
+        Encounter.objects.select_related('chapter__campaign', 'location'),
         pk=encounter_id,
         chapter_id=chapter_id,
         chapter__campaign_id=campaign_id,
         chapter__campaign__owner=request.user
     )
 
-    chapter = encounter.chapter
-    campaign = chapter.campaign
-
-    # Build markdown content
-    lines = [
-        f"# Chapter {chapter.order}: {chapter.title}",
-        "",
-        f"**Campaign:** {campaign.title}",
-        f"**Status:** {chapter.status.replace('_', ' ').capitalize()}",
-        f"**Level Range:** {chapter.level_range or '_Not specified_'}",
-        "",
-        "## Chapter Summary",
-        "",
-        chapter.summary.strip() if chapter.summary else "_No summary available_",
-        "",
-    ]
-
-    # Add chapter intro if present
-    if chapter.intro:
-        lines += [
-            "## Chapter Introduction",
-            "",
-            chapter.intro.strip(),
-            "",
-        ]
-
-    # Add chapter DM notes if present
-    if chapter.dm_notes:
-        lines += [
-            "## Chapter DM Notes",
-            "",
-            chapter.dm_notes.strip(),
-            "",
-        ]
-
-    lines += [
-        "---",
-        "",
-        f"## Encounter: {encounter.title}",
-        "",
-        f"**Type:** {encounter.get_type_display()}",
-        f"**Danger Level:** {encounter.get_danger_level_display() if encounter.danger_level else '_Not specified_'}",
-    ]
-
-    # Add location if set
-    if encounter.location:
-        lines += [f"**Location:** {encounter.location.name}"]
-
-    # Add NPCs if any
-    npcs = encounter.npcs.all()
-    if npcs:
-        npc_names = ", ".join([npc.name for npc in npcs])
-        lines += [f"**NPCs:** {npc_names}"]
-
-    # Add tags if present
-    if encounter.tags:
-        lines += [f"**Tags:** {encounter.tags}"]
-
-    lines += ["", ""]
-
-    # Add encounter summary
-    lines += [
-        "### Summary",
-        "",
-        encounter.summary.strip() if encounter.summary else "_No summary available_",
-        "",
-    ]
-
-    # Add setup details
-    if encounter.setup:
-        lines += [
-            "### Setup",
-            "",
-            encounter.setup.strip(),
-            "",
-        ]
-
-    # Add read-aloud text
-    if encounter.read_aloud:
-        lines += [
-            "### Read-Aloud Text",
-            "",
-            "> " + encounter.read_aloud.strip().replace("\n", "\n> "),
-            "",
-        ]
-
-    # Add DM notes
-    if encounter.dm_notes:
-        lines += [
-            "### DM Notes",
-            "",
-            encounter.dm_notes.strip(),
-            "",
-        ]
-
-    # Add map reference if present
-    if encounter.map_reference:
-        lines += [
-            f"**Map Reference:** {encounter.map_reference}",
-            "",
-        ]
-
-    # Add session notes
-    session_notes = encounter.session_notes.order_by("date")
-    if session_notes:
-        lines += [
-            "---",
-            "",
-            "## Session Notes",
-            "",
-        ]
-
-        for note in session_notes:
-            lines += [
-                f"### Session on {note.date.strftime('%B %d, %Y')}",
-                "",
-                "#### Session Content",
-                "",
-                note.content.strip(),
-                "",
-            ]
-
-            # Add AI summary if available
-            if note.summary:
-                lines += [
-                    "#### AI Summary",
-                    "",
-                    note.summary.strip(),
-                    "",
-                ]
-
-            lines += ["---", ""]
-    else:
-        lines += [
-            "---",
-            "",
-            "## Session Notes",
-            "",
-            "_No session notes recorded for this encounter yet._",
-            "",
-        ]
-
-    # Add chapter conclusion if present
-    if chapter.conclusion:
-        lines += [
-            "---",
-            "",
-            "## Chapter Conclusion",
-            "",
-            chapter.conclusion.strip(),
-            "",
-        ]
-
     # Generate filename
-    filename = f"chapter_{chapter.order}_{encounter.title.lower().replace(' ', '_')}_notes.md"
+    filename = f"chapter_{encounter.chapter.order}_{encounter.title.lower().replace(' ', '_')}_notes.md"
 
     # Generate response
-    markdown_text = "\n".join(lines)
-    response = HttpResponse(markdown_text, content_type="text/markdown")
+    response = HttpResponse(encounter_markdown(encounter), content_type="text/markdown")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
@@ -820,12 +596,12 @@ class ChapterReorderView(LoginRequiredMixin, View):
         # Get the new order from the request
         chapter_ids = request.POST.getlist('chapter_order')
         
-        # Update each chapter's order
+        # Update each chapter's order; update() skips the signals that mark the export stale
         for index, chapter_id in enumerate(chapter_ids):
             Chapter.objects.filter(
                 id=chapter_id, 
                 campaign=campaign
-            ).update(order=index + 1)
+            ).update(order=index + 1, export_version=new_version())
         
         messages.success(request, "Chapter order updated successfully.")
         return JsonResponse({'status': 'success'})
@@ -4,14 +4,17 @@ from .campaigns import (
     CampaignListView,
     CampaignDetailView,
     CampaignCreateView,
+    CampaignImportView,
     CampaignUpdateView,
     CampaignDeleteView,
     export_campaign_markdown,
+    export_campaign_archive,
     export_encounter_markdown,
     save_campaign_summary
 )
 from .chapters import (
     ChapterCreateView,
+    ChapterUploadView,
     ChapterQuickCreateView, 
     ChapterDeleteView,
     ChapterUpdateView,
@@ -29,6 +32,10 @@ from .encounters import (
     EncounterNoteEditView,
     EncounterNoteUpdateView,
     EncounterNoteDeleteView,
+    SessionNoteSummarizeView,
+    SessionNoteSummaryView,
+    EncounterNotesCompressView,
+    LLMJobStatusView,
     EncounterPlayView,
 )
 from .world import (
@@ -87,12 +94,15 @@ __all__ = [
     'CampaignCreateView',
     'CampaignUpdateView',
     'CampaignDeleteView',
+    'CampaignImportView',
     'export_campaign_markdown',
+    'export_campaign_archive',
     'export_encounter_markdown',
     'save_campaign_summary',
     
     # Chapter views
     'ChapterCreateView',
+    'ChapterUploadView',
     'ChapterQuickCreateView', 
     'ChapterDeleteView',
     'ChapterUpdateView',
@@ -110,6 +120,10 @@ __all__ = [
     'EncounterNoteEditView',
     'EncounterNoteUpdateView',
     'EncounterNoteDeleteView',
+    'SessionNoteSummarizeView',
+    'SessionNoteSummaryView',
+    'EncounterNotesCompressView',
+    'LLMJobStatusView',
     'EncounterPlayView',
     
     # World views
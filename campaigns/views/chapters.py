@@ -6,7 +6,44 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 
 from ..models import Campaign, Chapter, Encounter
-from ..forms import ChapterForm, EncounterFormSet
+from ..forms import ChapterForm, ChapterUploadForm, EncounterFormSet
+from ..services.difficulty import campaign_encounter_difficulties
+from ..services.export import new_version
+from ..services.jobs import enqueue
+from ..services.pdf_ingest import store_pdf
+
+
+class ChapterUploadView(LoginRequiredMixin, View):
+    """
+    Import chapters, encounters and enemies from an adventure PDF. The file
+    is saved and queued here; the ``ingest_pdf`` job reads it in the
+    background, and the page polls the job until the drafts exist.
+    """
+    template_name = "chapters/chapter_upload.html"
+
+    def dispatch(self, request, *args, **kwargs):
+        # The campaign lookup needs a user, so check login before LoginRequiredMixin would
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.campaign = get_object_or_404(
+            Campaign.objects.filter(owner=self.request.user),
+            pk=self.kwargs["campaign_id"]
+        )
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, campaign_id):
+        return render(request, self.template_name, {"campaign": self.campaign, "form": ChapterUploadForm()})
+
+    def post(self, request, campaign_id):
+        form = ChapterUploadForm(request.POST, request.FILES)
+        job = None
+        if form.is_valid():
+            pdf = store_pdf(form.cleaned_data["pdf_file"], request.user)
+            job = enqueue(
+                'ingest_pdf', request.user, target=f'campaign:{self.campaign.pk}:pdf:{pdf.pk}',
+                pdf_id=pdf.pk, campaign_id=self.campaign.pk
+            )
+        return render(request, self.template_name, {"campaign": self.campaign, "form": form, "job": job})
 
 
 class ChapterCreateView(LoginRequiredMixin, CreateView):
@@ -192,7 +229,13 @@ class ChapterDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["encounters"] = self.object.encounters.order_by('order')
+        encounters = list(self.object.encounters.order_by('order'))
+        difficulties = campaign_encounter_difficulties(
+            self.object.campaign_id, encounters=encounters
+        )
+        for encounter in encounters:
+            encounter.difficulty = difficulties[encounter.pk]
+        context["encounters"] = encounters
         return context
 
 
@@ -232,12 +275,12 @@ class ChapterReorderView(LoginRequiredMixin, View):
         # Get the new order from the request
         chapter_ids = request.POST.getlist('chapter_order')
         
-        # Update each chapter's order
+        # Update each chapter's order; update() skips the signals that mark the export stale
         for index, chapter_id in enumerate(chapter_ids):
             Chapter.objects.filter(
                 id=chapter_id, 
                 campaign=campaign
-            ).update(order=index + 1)
+            ).update(order=index + 1, export_version=new_version())
         
         messages.success(request, "Chapter order updated successfully.")
         return JsonResponse({'status': 'success'})
\ No newline at end of file
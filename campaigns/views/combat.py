@@ -1,15 +1,24 @@
+import json
+import time
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import CreateView, DetailView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import OuterRef, Subquery
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 
-from ..models import Campaign, Chapter, Encounter, CombatSession, CombatParticipant, Enemy, CharacterSummary
+from ..models import (
+    Campaign, Chapter, Encounter, CombatSession, CombatAction, CombatEvent,
+    Enemy, CharacterSummary
+)
 from ..forms.combat import CombatSessionForm
+from ..services.combat import CombatRosterBuilder, build_tracker_context
 
 
 class CombatSessionCreateView(LoginRequiredMixin, CreateView):
@@ -23,12 +32,18 @@ class CombatSessionCreateView(LoginRequiredMixin, CreateView):
         self.encounter = get_object_or_404(Encounter, id=kwargs['encounter_id'], chapter=self.chapter)
         return super().dispatch(request, *args, **kwargs)
     
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['enemies'] = self.encounter.enemies.all()
+        return kwargs
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['campaign'] = self.campaign
         context['chapter'] = self.chapter
         context['encounter'] = self.encounter
-        context['available_enemies'] = self.encounter.enemies.all()
+        context['available_enemies'] = context['form'].enemies
+        context['enemy_fields'] = context['form'].enemy_fields()
         context['available_characters'] = self.campaign.characters.all()
         return context
     
@@ -40,29 +55,16 @@ class CombatSessionCreateView(LoginRequiredMixin, CreateView):
         if not form.instance.name:
             form.instance.name = f"{self.encounter.title} Combat"
         
-        response = super().form_valid(form)
-        
-        # Create combat participants from encounter enemies
-        for enemy in self.encounter.enemies.all():
-            CombatParticipant.objects.create(
-                combat_session=self.object,
-                participant_type='enemy',
-                enemy=enemy,
-                name=enemy.name,
-                current_hp=enemy.hit_points,
-                max_hp=enemy.hit_points
-            )
-        
-        # Create combat participants from campaign characters
-        for character in self.campaign.characters.all():
-            CombatParticipant.objects.create(
-                combat_session=self.object,
-                participant_type='player',
-                character=character,
-                name=character.character_name,
-                current_hp=character.current_hit_points or 20,  # Default if not set
-                max_hp=character.current_hit_points or 20
-            )
+        with transaction.atomic():
+            response = super().form_valid(form)
+            
+            # Create all combat participants in one insert
+            roster = CombatRosterBuilder(self.object)
+            for enemy, count in form.enemy_counts():
+                roster.add_enemy(enemy, count, roll_hit_points=form.cleaned_data['roll_hit_points'])
+            for character in self.campaign.characters.all():
+                roster.add_character(character)
+            roster.build()
         
         messages.success(self.request, f"Combat session '{self.object.name}' created successfully!")
         return response
@@ -92,7 +94,7 @@ class CombatSessionDetailView(LoginRequiredMixin, DetailView):
         return CombatSession.objects.filter(
             encounter=self.encounter,
             owner=self.request.user
-        ).prefetch_related('participants__enemy', 'participants__character')
+        )
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -100,16 +102,8 @@ class CombatSessionDetailView(LoginRequiredMixin, DetailView):
         context['chapter'] = self.chapter
         context['encounter'] = self.encounter
         
-        # Get participants organized by type and initiative order
-        participants = self.object.participants.all().order_by('initiative_order')
-        context['participants'] = participants
-        context['active_participants'] = participants.filter(is_active=True)
-        context['current_participant'] = self.object.get_current_participant()
-        
-        # Combat actions for this round
-        context['current_round_actions'] = self.object.actions.filter(
-            round_number=self.object.current_round
-        ).order_by('timestamp')
+        # Participants, effects and this round's actions in a fixed number of queries
+        context.update(build_tracker_context(self.object))
         
         return context
 
@@ -175,6 +169,19 @@ class CombatSessionDeleteView(LoginRequiredMixin, DeleteView):
         })
 
 
+def _get_combat_session(request, campaign_id, chapter_id, encounter_id, session_id):
+    """Fetch a combat session and check the whole ownership chain in one query"""
+    return get_object_or_404(
+        CombatSession.objects.select_related('encounter__chapter__campaign'),
+        id=session_id,
+        owner=request.user,
+        encounter_id=encounter_id,
+        encounter__chapter_id=chapter_id,
+        encounter__chapter__campaign_id=campaign_id,
+        encounter__chapter__campaign__owner=request.user,
+    )
+
+
 # HTMX/Ajax endpoints for combat actions
 @require_POST
 @csrf_exempt
@@ -215,10 +222,7 @@ def next_turn(request, campaign_id, chapter_id, encounter_id, session_id):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=403)
     
-    campaign = get_object_or_404(Campaign, id=campaign_id, owner=request.user)
-    chapter = get_object_or_404(Chapter, id=chapter_id, campaign=campaign)
-    encounter = get_object_or_404(Encounter, id=encounter_id, chapter=chapter)
-    combat_session = get_object_or_404(CombatSession, id=session_id, encounter=encounter, owner=request.user)
+    combat_session = _get_combat_session(request, campaign_id, chapter_id, encounter_id, session_id)
     
     combat_session.next_turn()
     current_participant = combat_session.get_current_participant()
@@ -243,4 +247,132 @@ def end_combat(request, campaign_id, chapter_id, encounter_id, session_id):
     combat_session = get_object_or_404(CombatSession, id=session_id, encounter=encounter, owner=request.user)
     
     combat_session.end_combat()
-    return JsonResponse({'status': 'success', 'message': 'Combat ended!'})
\ No newline at end of file
+    return JsonResponse({'status': 'success', 'message': 'Combat ended!'})
+
+
+# Live combat tracker stream
+#
+# Each open tracker holds one server-sent event stream. While nothing changes
+# the stream costs a single indexed query per poll; deltas are only built
+# when the session row, the event log or the action log has moved on.
+
+STREAM_POLL_SECONDS = 1
+STREAM_MAX_SECONDS = 300  # Browsers reconnect with Last-Event-ID after this
+STREAM_RETRY_MS = 2000
+
+
+def _parse_stream_cursor(request):
+    """Read the (event id, action id) cursor from Last-Event-ID or ?cursor="""
+    raw = request.headers.get('Last-Event-ID') or request.GET.get('cursor', '')
+    try:
+        event_id, action_id = (int(part) for part in raw.split('-', 1))
+    except ValueError:
+        return None
+    return event_id, action_id
+
+
+def _sse(event, data, cursor=None):
+    lines = []
+    if cursor:
+        lines.append(f"id: {cursor[0]}-{cursor[1]}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _session_heads(session_id):
+    """One query for the session row plus the newest event and action ids"""
+    latest_event = CombatEvent.objects.filter(combat_session=OuterRef('pk')).order_by('-id').values('id')[:1]
+    latest_action = CombatAction.objects.filter(combat_session=OuterRef('pk')).order_by('-id').values('id')[:1]
+    return CombatSession.objects.filter(pk=session_id).values(
+        'current_round', 'current_turn', 'status', 'updated_at',
+    ).annotate(
+        last_event_id=Subquery(latest_event), last_action_id=Subquery(latest_action)
+    ).first()
+
+
+def _turn_delta(combat_session, heads):
+    # The stream is a GET; a dropped ring is rebuilt in memory, not saved
+    current = combat_session.get_current_participant(save=False)
+    return {
+        'round': heads['current_round'],
+        'turn': heads['current_turn'],
+        'status': heads['status'],
+        'current': {'id': current.pk, 'name': current.name} if current else None,
+    }
+
+
+def combat_event_stream(combat_session, cursor=None):
+    """Generate server-sent events for a combat session until the stream times out"""
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    
+    heads = _session_heads(combat_session.pk)
+    if heads is None:
+        return
+    if cursor is None:
+        # New trackers already rendered the current state; only stream what comes next
+        cursor = (heads['last_event_id'] or 0, heads['last_action_id'] or 0)
+    last_updated = heads['updated_at']
+    yield _sse('hello', {'round': heads['current_round'], 'turn': heads['current_turn']}, cursor)
+    
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while True:
+        heads = _session_heads(combat_session.pk)
+        if heads is None:
+            return
+        event_id, action_id = cursor
+        new_event_id = heads['last_event_id'] or 0
+        new_action_id = heads['last_action_id'] or 0
+        
+        if heads['updated_at'] != last_updated:
+            last_updated = heads['updated_at']
+            combat_session.refresh_from_db(fields=['current_round', 'current_turn', 'status', 'initiative_ring'])
+            yield _sse('turn', _turn_delta(combat_session, heads), cursor)
+        
+        if new_event_id > event_id:
+            changed = set(CombatEvent.objects.filter(
+                combat_session=combat_session, id__gt=event_id, id__lte=new_event_id,
+                participant__isnull=False,
+            ).values_list('participant_id', flat=True))
+            participants = [
+                {'id': p['id'], 'hp': p['current_hp'], 'max_hp': p['max_hp'],
+                 'temp_hp': p['temp_hp'], 'active': p['is_active']}
+                for p in combat_session.participants.filter(id__in=changed).values(
+                    'id', 'current_hp', 'max_hp', 'temp_hp', 'is_active'
+                )
+            ]
+            if participants:
+                yield _sse('participants', participants, (new_event_id, action_id))
+        
+        if new_action_id > action_id:
+            actions = [
+                {'id': a['id'], 'round': a['round_number'], 'participant': a['participant__name'],
+                 'target': a['target__name'], 'type': a['action_type'],
+                 'description': a['description'], 'value': a['value']}
+                for a in combat_session.actions.filter(id__gt=action_id, id__lte=new_action_id).values(
+                    'id', 'round_number', 'participant__name', 'target__name',
+                    'action_type', 'description', 'value'
+                ).order_by('id')
+            ]
+            yield _sse('actions', actions, (new_event_id, new_action_id))
+        
+        cursor = (new_event_id, new_action_id)
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(STREAM_POLL_SECONDS)
+        yield ": keep-alive\n\n"
+
+
+def combat_session_stream(request, campaign_id, chapter_id, encounter_id, session_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    
+    combat_session = _get_combat_session(request, campaign_id, chapter_id, encounter_id, session_id)
+    
+    response = StreamingHttpResponse(
+        combat_event_stream(combat_session, _parse_stream_cursor(request)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,15 +1,22 @@
 from django.views.generic import CreateView, UpdateView, DeleteView
 from django.shortcuts import get_object_or_404, render
+from django.http import StreamingHttpResponse
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
 from datetime import date
+import logging
 
-from ..models import Chapter, Encounter, SessionNote, CharacterSummary
+from ..models import Chapter, Encounter, SessionNote, CharacterSummary, LLMJob
+from ..services.export import invalidate_encounters
+from ..services.jobs import enqueue
+from ..services.llm import stream_session_summary, usage_for
 from ..forms import EncounterForm
 
+logger = logging.getLogger(__name__)
+
 
 class EncounterCreateView(LoginRequiredMixin, CreateView):
     model = Encounter
@@ -292,6 +299,103 @@ class EncounterNoteDeleteView(LoginRequiredMixin, View):
             return render(request, "encounters/components/_notes_list.html", {"enc": encounter})
 
 
+class SessionNoteSummarizeView(LoginRequiredMixin, View):
+    """Queue an AI summary of a note; the returned fragment polls for the result"""
+
+    def post(self, request, campaign_id, chapter_id, encounter_id, note_id):
+        note = get_object_or_404(
+            SessionNote.objects.filter(
+                encounter__chapter__campaign__owner=request.user,
+                encounter__chapter__campaign_id=campaign_id,
+                encounter__chapter_id=chapter_id,
+                encounter_id=encounter_id
+            ),
+            pk=note_id
+        )
+        job = enqueue('session_summary', request.user, target=f'note:{note.pk}', note_id=note.pk)
+        return render(request, "encounters/components/_llm_job_status.html", {"job": job})
+
+
+class SessionNoteSummaryView(LoginRequiredMixin, View):
+    """
+    GET renders a note's saved AI summary. POST streams a new summary as
+    plain text while the model writes it and saves it once the stream
+    completes; a failure part-way through is sent as a record separator
+    (\x1e) followed by the error, and nothing is saved.
+    """
+
+    def get_note(self, request, campaign_id, chapter_id, encounter_id, note_id):
+        return get_object_or_404(
+            SessionNote.objects.select_related('encounter__chapter').filter(
+                encounter__chapter__campaign__owner=request.user,
+                encounter__chapter__campaign_id=campaign_id,
+                encounter__chapter_id=chapter_id,
+                encounter_id=encounter_id
+            ),
+            pk=note_id
+        )
+
+    def get(self, request, *args, **kwargs):
+        note = self.get_note(request, *args, **kwargs)
+        return render(request, "encounters/components/_note_summary.html", {"note": note})
+
+    def post(self, request, *args, **kwargs):
+        note = self.get_note(request, *args, **kwargs)
+
+        def stream():
+            pieces = []
+            try:
+                # Runs while the response is sent, outside the view's own context
+                with usage_for(request.user, note.encounter.chapter.campaign_id):
+                    for piece in stream_session_summary(note.content, note.encounter.chapter.title):
+                        pieces.append(piece)
+                        yield piece
+            except Exception as error:
+                logger.warning("Streaming summary of note %s failed: %s", note.pk, error)
+                yield f"\x1e{error}"
+                return
+            SessionNote.objects.filter(pk=note.pk).update(summary="".join(pieces).strip())
+            invalidate_encounters([note.encounter_id])
+
+        response = StreamingHttpResponse(stream(), content_type="text/plain; charset=utf-8")
+        # Keep proxies from buffering the stream
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class EncounterNotesCompressView(LoginRequiredMixin, View):
+    """Queue compressing an encounter's notes into one new note"""
+
+    def post(self, request, campaign_id, chapter_id, encounter_id):
+        encounter = get_object_or_404(
+            Encounter.objects.filter(
+                chapter__campaign__owner=request.user,
+                chapter__campaign_id=campaign_id,
+                chapter_id=chapter_id
+            ),
+            pk=encounter_id
+        )
+        note_ids = list(encounter.session_notes.values_list('pk', flat=True))
+        if len(note_ids) < 2:
+            return render(request, "encounters/components/_llm_job_status.html", {
+                "error": "Add at least two notes before compressing them."
+            })
+        job = enqueue(
+            'compress_notes', request.user, target=f'encounter:{encounter.pk}',
+            encounter_id=encounter.pk, note_ids=note_ids
+        )
+        return render(request, "encounters/components/_llm_job_status.html", {"job": job})
+
+
+class LLMJobStatusView(LoginRequiredMixin, View):
+    """Polled by the job fragment until the job has finished"""
+
+    def get(self, request, job_id):
+        job = get_object_or_404(LLMJob, pk=job_id, owner=request.user)
+        return render(request, "encounters/components/_llm_job_status.html", {"job": job})
+
+
 class EncounterPlayView(LoginRequiredMixin, View):
     """
     Comprehensive DM interface for playing an encounter.
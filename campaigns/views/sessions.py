@@ -12,7 +12,9 @@ from datetime import datetime, timedelta
 import json
 
 from ..models import Campaign, SessionSchedule, PlayerAvailability, ScheduledSession
-from ..forms.sessions import SessionScheduleForm, PlayerAvailabilityForm
+from ..forms.sessions import SessionScheduleForm, PlayerAvailabilityForm, SessionSolverForm
+from ..services.heatmap import heatmap_index, heatmap_respondents
+from ..services.scheduling import SessionSolver
 
 
 class SessionScheduleListView(LoginRequiredMixin, ListView):
@@ -83,98 +85,51 @@ class SessionScheduleDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        schedule = self.get_object()
+        schedule = self.object
         context["campaign"] = schedule.campaign
         context["player_url"] = self.request.build_absolute_uri(
             schedule.get_player_url()
         )
 
-        # Get only the most recent response per email to avoid duplicates
-        latest_responses = []
-        seen_emails = set()
-        for response in schedule.player_availabilities.order_by("-updated_at"):
-            if response.email not in seen_emails:
-                latest_responses.append(response)
-                seen_emails.add(response.email)
+        # One response per email is enforced by the model, so list them as-is
+        context["responses"] = schedule.player_availabilities.all()
 
-        context["responses"] = latest_responses
+        # Respondents and per-slot picks come from the materialized heatmap
+        heatmap = schedule.get_availability_heatmap()
+        respondents = heatmap_respondents(heatmap)
+        context["respondents"] = respondents
+        universe = schedule.get_slot_universe()
+        context["all_time_slots"] = universe.slots_by_date
+        solver = SessionSolver(universe, respondents, index=heatmap_index(universe, heatmap))
 
-        # Build availability grid for display using latest responses
-        context["availability_grid"] = self.build_availability_grid(
-            schedule, latest_responses
-        )
-
-        # Get all unique time slots from the schedule
-        all_time_slots = schedule.get_all_time_slots_by_date()
-        context["all_time_slots"] = all_time_slots
+        # Build availability grid for display from the heatmap
+        context["availability_grid"] = self.build_availability_grid(universe, solver.index)
+        context["everyone_available"] = solver.index.everyone_available()
 
-        # Calculate most popular time slots
-        context["popular_slots"] = self.calculate_popular_slots(
-            schedule, latest_responses
+        # Rank session times against the organizer's constraints
+        solver_form = SessionSolverForm(
+            self.request.GET or None, responses=respondents
         )
+        options = solver_form.solver_options()
+        context["solver_form"] = solver_form
+        context["popular_slots"] = self.calculate_popular_slots(solver, options)
+        if solver_form.is_bound and solver_form.is_valid() and solver_form.cleaned_data["repeat_every"]:
+            context["recurring_series"] = solver.recurring(
+                interval_days=solver_form.cleaned_data["repeat_every"], **options
+            )
 
         return context
 
-    def build_availability_grid(self, schedule, responses=None):
+    def build_availability_grid(self, universe, index):
         """Build a grid showing all player availability for easy viewing"""
-        grid = {}
-        if responses is None:
-            responses = schedule.player_availabilities.all()
-
-        # Use the dynamic date range from the schedule
-        for current_date in schedule.get_date_range():
-            date_str = current_date.strftime("%Y-%m-%d")
-            grid[date_str] = {"date": current_date, "players": []}
-
-            for response in responses:
-                availability = response.get_availability_for_date(date_str)
-                grid[date_str]["players"].append(
-                    {
-                        "name": response.player_name,
-                        "character": response.character_name,
-                        "available_times": availability,
-                    }
-                )
-
-        return grid
-
-    def calculate_popular_slots(self, schedule, responses):
-        """Calculate the most popular date-time combinations using dynamic slots"""
-        slot_counts = {}
-
-        # Get all time slots by date
-        all_slots_by_date = schedule.get_all_time_slots_by_date()
-
-        # Count availability for each date-time combination
-        for date_str, time_slots in all_slots_by_date.items():
-            for slot in time_slots:
-                slot_label = slot["label"]
-                available_players = []
-
-                for response in responses:
-                    if slot_label in response.get_availability_for_date(date_str):
-                        available_players.append(response.player_name)
-
-                if available_players:
-                    # Parse date from string
-                    from datetime import datetime
-
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-
-                    slot_counts[(date_str, slot_label)] = {
-                        "date": date_obj,
-                        "time_slot": slot_label,
-                        "time_display": slot_label,
-                        "start_time": slot["start_time"],
-                        "count": len(available_players),
-                        "players": available_players,
-                    }
+        return {
+            day["date_str"]: {"date": day["date"], "rows": index.grid_rows(day["date_str"])}
+            for day in universe.days
+        }
 
-        # Sort by count (descending) and return top 5
-        popular_slots = sorted(
-            slot_counts.values(), key=lambda x: x["count"], reverse=True
-        )[:5]
-        return popular_slots
+    def calculate_popular_slots(self, solver, options):
+        """Top five session times that satisfy the organizer's constraints"""
+        return solver.best_times(limit=5, **options)
 
 
 class PlayerAvailabilityView(View):
@@ -271,28 +226,20 @@ class PlayerAvailabilityView(View):
 
     def build_dates_with_slots(self, schedule, existing_response=None):
         """Build a list of dates with their time slots and selection status"""
-        dates_with_slots = []
-
-        for date in schedule.get_date_range():
-            date_str = date.strftime("%Y-%m-%d")
-            time_slots = schedule.generate_time_slots_for_date(date)
-
-            # Check which slots are already selected for this date
-            if existing_response:
-                selected_slots = existing_response.get_availability_for_date(date_str)
-            else:
-                selected_slots = []
-
-            # Add selection status to each slot
-            for slot in time_slots:
-                slot["selected"] = slot["label"] in selected_slots
+        availability_data = existing_response.availability_data if existing_response else {}
 
+        dates_with_slots = []
+        for day in schedule.get_slot_universe().days:
+            selected_slots = set(availability_data.get(day["date_str"], ()))
             dates_with_slots.append(
                 {
-                    "date": date,
-                    "date_str": date_str,
-                    "day_name": date.strftime("%A"),
-                    "time_slots": time_slots,
+                    "date": day["date"],
+                    "date_str": day["date_str"],
+                    "day_name": day["day_name"],
+                    "time_slots": [
+                        dict(slot, selected=slot["label"] in selected_slots)
+                        for slot in day["time_slots"]
+                    ],
                 }
             )
 
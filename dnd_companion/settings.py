@@ -278,3 +278,22 @@ LOGGING = {
 
 # OpenAI API Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# "openai", or "fake" for canned local replies (tests and offline development)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+
+# Background LLM jobs (see campaigns/services/jobs.py)
+LLM_JOB_CONCURRENCY = int(os.getenv('LLM_JOB_CONCURRENCY', '2'))
+LLM_JOB_MAX_ATTEMPTS = int(os.getenv('LLM_JOB_MAX_ATTEMPTS', '3'))
+LLM_JOB_RETRY_DELAY = int(os.getenv('LLM_JOB_RETRY_DELAY', '10'))  # seconds, doubled per attempt
+LLM_JOB_LEASE_SECONDS = int(os.getenv('LLM_JOB_LEASE_SECONDS', '300'))
+
+# Stored LLM replies for identical requests (see campaigns/services/llm.py); 0 entries turns it off
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '2000'))
+LLM_CACHE_MAX_AGE_DAYS = int(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '30'))
+
+# Note compression summarizes chunks of about this many tokens, this many at a time
+LLM_SUMMARY_CHUNK_TOKENS = int(os.getenv('LLM_SUMMARY_CHUNK_TOKENS', '2500'))
+LLM_SUMMARY_WORKERS = int(os.getenv('LLM_SUMMARY_WORKERS', '4'))
+
+# Adventure PDF imports read pages in this many processes (see campaigns/services/pdf_ingest.py)
+PDF_INGEST_WORKERS = int(os.getenv('PDF_INGEST_WORKERS', '2'))
@@ -58,6 +58,12 @@ EOF
   fi
 }
 
+# Function to start the background LLM job worker (writes, so primary only)
+start_llm_worker() {
+  echo "Starting LLM job worker..."
+  python manage.py process_llm_jobs &
+}
+
 # Function to start the Django application
 start_django() {
   echo "Starting Django application with Gunicorn..."
@@ -65,6 +71,7 @@ start_django() {
     --bind "0.0.0.0:8000" \
     --workers 2 \
     --worker-class gthread \
+    --threads 8 \
     --worker-connections 1000 \
     --max-requests 1000 \
     --max-requests-jitter 100 \
@@ -100,6 +107,7 @@ if [ "$1" = "litefs" ] && [ "$2" = "mount" ]; then
   if [ "${FLY_REGION}" = "${PRIMARY_REGION}" ]; then
     echo "Running on primary region, executing Django setup..."
     run_django_commands
+    start_llm_worker
   else
     echo "Running on replica region, skipping Django setup..."
   fi
@@ -111,6 +119,7 @@ elif [ "$1" = "django" ]; then
   # Direct Django start (for development or testing)
   echo "Starting Django directly..."
   run_django_commands
+  start_llm_worker
   start_django
 
 elif [ "$1" = "manage.py" ]; then